@@ -0,0 +1,165 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+import bar_store
+import t1
+from signal_engine import stack_right_aligned, compute_conditions
+
+# Backtest chiến lược của t1.py trên kho nến: dùng đúng điều kiện vào lệnh
+# của calc_signals (RSI + Bollinger + EMA, chờ WAIT_BARS), vào lệnh market tại
+# giá đóng cửa nến có tín hiệu, thoát khi chạm TP / SL theo high/low từng nến.
+# Nếu cùng một nến chạm cả TP và SL thì tính là SL (giả định bất lợi).
+# Toàn bộ symbol × nến được tính dạng ma trận NumPy.
+
+FEE_RATE = 0.00055   # phí taker mỗi chiều
+CHUNK = 2000         # số lệnh mô phỏng mỗi lô
+
+def default_params():
+    return {
+        **t1.STRATEGY_PARAMS,
+        "tp_ratio": t1.TP_RATIO,
+        "sl_ratio": t1.SL_RATIO,
+    }
+
+# ==== NẠP DỮ LIỆU ====
+def load_matrices(folder=None, symbols=None, last=None):
+    folder = folder or t1.DATA_FOLDER
+    symbols = symbols if symbols is not None else bar_store.list_symbols(folder)
+    data = {"ts": [], "high": [], "low": [], "close": []}
+    kept = []
+    for sym in symbols:
+        bars = bar_store.read(folder, sym, last=last)
+        if len(bars) == 0:
+            continue
+        kept.append(sym)
+        for col in data:
+            data[col].append(bars[col].astype(np.float64))
+    mats = {col: stack_right_aligned(series) for col, series in data.items()}
+    return kept, mats
+
+# ==== TÍN HIỆU VÀO LỆNH ====
+def entry_directions(cond_long, cond_short, wait_bars):
+    # 1 = long, -1 = short, 0 = không; điều kiện đúng ở nến t và không đúng ở WAIT_BARS-1 nến trước
+    def fresh(cond):
+        c = np.cumsum(cond, axis=1)
+        prior = c.copy()
+        prior[:, wait_bars - 1:] -= np.pad(c, ((0, 0), (1, 0)))[:, :c.shape[1] - wait_bars + 1]
+        prior -= cond
+        return cond & (prior == 0)
+    can_long = fresh(cond_long)
+    can_short = fresh(cond_short) & ~can_long
+    return can_long.astype(np.int8) - can_short.astype(np.int8)
+
+# ==== MÔ PHỎNG TP / SL ====
+def simulate(direction, close, high, low, tp_ratio, sl_ratio, margin=None, leverage=None, fee_rate=FEE_RATE):
+    margin = t1.MARGIN if margin is None else margin
+    leverage = t1.LEVERAGE if leverage is None else leverage
+    sym_idx, entry_idx = np.nonzero(direction)
+    side = direction[sym_idx, entry_idx].astype(np.float64)
+    entry = close[sym_idx, entry_idx]
+    is_long = side > 0
+    tp = np.where(is_long, entry * tp_ratio, entry * (2 - tp_ratio))
+    sl = np.where(is_long, entry * sl_ratio, entry * (2 - sl_ratio))
+
+    n_bars = close.shape[1]
+    exit_idx = np.full(len(entry_idx), n_bars - 1)
+    closed = np.zeros(len(entry_idx), dtype=bool)
+    by_sl = np.zeros(len(entry_idx), dtype=bool)
+    offsets = np.arange(1, n_bars)
+    # Chia theo lô lệnh để ma trận (lệnh × nến phía sau) không quá lớn
+    for lo_i in range(0, len(entry_idx), CHUNK):
+        sl_ = slice(lo_i, lo_i + CHUNK)
+        idx = entry_idx[sl_, None] + offsets[None, :]
+        valid = idx < n_bars
+        idx = np.minimum(idx, n_bars - 1)
+        hi = high[sym_idx[sl_, None], idx]
+        lo = low[sym_idx[sl_, None], idx]
+        long_ = is_long[sl_, None]
+        with np.errstate(invalid="ignore"):
+            hit_tp = np.where(long_, hi >= tp[sl_, None], lo <= tp[sl_, None]) & valid
+            hit_sl = np.where(long_, lo <= sl[sl_, None], hi >= sl[sl_, None]) & valid
+        hit = hit_tp | hit_sl
+        done = hit.any(axis=1)
+        first = hit.argmax(axis=1)
+        closed[sl_] = done
+        by_sl[sl_] = done & hit_sl[np.arange(len(first)), first]
+        exit_idx[sl_] = np.where(done, entry_idx[sl_] + 1 + first, n_bars - 1)
+    exit_price = np.where(closed, np.where(by_sl, sl, tp), close[sym_idx, n_bars - 1])
+
+    notional = margin * leverage
+    pnl = notional * (exit_price / entry - 1) * side - 2 * notional * fee_rate
+    return {
+        "sym_idx": sym_idx,
+        "entry_idx": entry_idx,
+        "exit_idx": exit_idx,
+        "side": side,
+        "entry": entry,
+        "exit": exit_price,
+        "closed": closed,
+        "by_sl": by_sl,
+        "pnl": pnl,
+    }
+
+# ==== THỐNG KÊ ====
+def max_drawdown(pnl_sorted):
+    if len(pnl_sorted) == 0:
+        return 0.0
+    curve = np.concatenate([[0.0], np.cumsum(pnl_sorted)])
+    return float(np.max(np.maximum.accumulate(curve) - curve))
+
+def summarize(trades, symbols):
+    order = np.lexsort((trades["entry_idx"], trades["exit_idx"]))
+    sym_idx = trades["sym_idx"][order]
+    pnl = trades["pnl"][order]
+    rows = []
+    for i, sym in enumerate(symbols):
+        p = pnl[sym_idx == i]
+        rows.append({
+            "symbol": sym,
+            "trades": len(p),
+            "wins": int((p > 0).sum()),
+            "win_rate": float((p > 0).mean()) if len(p) else 0.0,
+            "pnl": float(p.sum()),
+            "max_drawdown": max_drawdown(p),
+        })
+    per_symbol = pd.DataFrame(rows).sort_values("pnl", ascending=False).reset_index(drop=True)
+    return per_symbol, {"symbols": len(symbols), **summarize_total(trades)}
+
+def summarize_total(trades):
+    order = np.lexsort((trades["entry_idx"], trades["exit_idx"]))
+    pnl = trades["pnl"][order]
+    return {
+        "trades": int(len(pnl)),
+        "open_at_end": int((~trades["closed"]).sum()),
+        "win_rate": float((pnl > 0).mean()) if len(pnl) else 0.0,
+        "pnl": float(pnl.sum()),
+        "max_drawdown": max_drawdown(pnl),
+    }
+
+def run_backtest(mats, params):
+    cond_long, cond_short = compute_conditions(
+        mats["close"], params["rsi_len"], params["rsi_ob"], params["rsi_os"],
+        params["bb_len"], params["stddev"], params["ema_len"],
+    )
+    direction = entry_directions(cond_long, cond_short, params["wait_bars"])
+    return simulate(direction, mats["close"], mats["high"], mats["low"], params["tp_ratio"], params["sl_ratio"])
+
+def main(folder=None, out_csv=None):
+    t0 = time.perf_counter()
+    symbols, mats = load_matrices(folder)
+    t_load = time.perf_counter()
+    params = default_params()
+    trades = run_backtest(mats, params)
+    per_symbol, total = summarize(trades, symbols)
+    t_end = time.perf_counter()
+    print(f"[BT] {len(symbols)} symbol × {mats['close'].shape[1]} nến, nạp {t_load - t0:.2f}s, tính {t_end - t_load:.2f}s")
+    print(per_symbol.head(20).to_string(index=False))
+    print(f"[BT] Tổng: {total['trades']} lệnh ({total['open_at_end']} chưa đóng), "
+          f"win rate {total['win_rate']:.1%}, PnL {total['pnl']:.2f} USDT, max drawdown {total['max_drawdown']:.2f} USDT")
+    if out_csv:
+        per_symbol.to_csv(out_csv, index=False)
+    return per_symbol, total
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None, sys.argv[2] if len(sys.argv) > 2 else None)
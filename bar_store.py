@@ -0,0 +1,188 @@
+import os
+import sys
+import glob
+import threading
+import numpy as np
+import pandas as pd
+import metrics
+
+# Kho nến nhị phân: mỗi symbol một file {symbol}_{tf}.bars gồm các bản ghi
+# cố định 40 byte (ts int64 ms UTC, open/high/low/close float64), tăng dần theo ts.
+# Đọc bằng np.memmap nên không phải parse text; ghi thêm nến mới chỉ là append.
+
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+])
+SUFFIX = ".bars"
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+def bar_path(folder, symbol, tf="1h"):
+    return os.path.join(folder, f"{symbol}_{tf}{SUFFIX}")
+
+def exists(folder, symbol, tf="1h"):
+    return os.path.exists(bar_path(folder, symbol, tf))
+
+def list_symbols(folder, tf="1h"):
+    tail = f"_{tf}{SUFFIX}"
+    if not os.path.isdir(folder):
+        return []
+    return sorted(fn[:-len(tail)] for fn in os.listdir(folder) if fn.endswith(tail))
+
+def count(folder, symbol, tf="1h"):
+    fp = bar_path(folder, symbol, tf)
+    if not os.path.exists(fp):
+        return 0
+    return os.path.getsize(fp) // BAR_DTYPE.itemsize
+
+def symbol_lock(folder, symbol):
+    # Khoá ghi theo symbol (mọi tf): luồng WebSocket của bar_stream và u4 (lấp gap,
+    # cắt file, ghi lại) cùng ghi một file trong worker daemon. Các shard u4 là process
+    # riêng nhưng giữ các symbol tách rời nhau nên chỉ cần khoá trong process.
+    key = (os.path.abspath(folder), symbol)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = threading.RLock()
+    return lock
+
+# ==== ĐỌC ====
+def read(folder, symbol, last=None, tf="1h"):
+    # Trả về view memmap (zero-copy) của `last` nến cuối, hoặc mảng rỗng nếu chưa có dữ liệu
+    n = count(folder, symbol, tf)
+    if n == 0:
+        return np.empty(0, dtype=BAR_DTYPE)
+    bars = np.memmap(bar_path(folder, symbol, tf), dtype=BAR_DTYPE, mode="r", shape=(n,))
+    if last is not None and n > last:
+        bars = bars[-last:]
+    metrics.bytes_read(bars.nbytes)
+    return bars
+
+def last_ts(folder, symbol, tf="1h"):
+    n = count(folder, symbol, tf)
+    if n == 0:
+        return None
+    with open(bar_path(folder, symbol, tf), "rb") as f:
+        f.seek((n - 1) * BAR_DTYPE.itemsize)
+        rec = np.frombuffer(f.read(BAR_DTYPE.itemsize), dtype=BAR_DTYPE)
+    return int(rec["ts"][0])
+
+# ==== GHI ====
+def write(folder, symbol, bars, tf="1h"):
+    fp = bar_path(folder, symbol, tf)
+    tmp = fp + ".tmp"
+    data = np.ascontiguousarray(bars, dtype=BAR_DTYPE)
+    data.tofile(tmp)
+    os.replace(tmp, fp)
+    metrics.bytes_written(data.nbytes)
+    return len(bars)
+
+def append(folder, symbol, bars, tf="1h"):
+    # Chỉ ghi thêm các nến mới hơn nến cuối trong file; bars phải tăng dần theo ts
+    prev = last_ts(folder, symbol, tf)
+    if prev is not None:
+        bars = bars[bars["ts"] > prev]
+    if len(bars) == 0:
+        return 0
+    data = np.ascontiguousarray(bars, dtype=BAR_DTYPE).tobytes()
+    with open(bar_path(folder, symbol, tf), "ab") as f:
+        f.write(data)
+    metrics.bytes_written(len(data))
+    return len(bars)
+
+def replace_tail(folder, symbol, bars, tf="1h"):
+    # Ghi đè các nến có ts >= bars[0] (thường chỉ nến cuối đang hình thành) rồi nối phần còn lại
+    if len(bars) == 0:
+        return 0
+    fp = bar_path(folder, symbol, tf)
+    n = count(folder, symbol, tf)
+    if n == 0:
+        return write(folder, symbol, bars, tf)
+    ts = np.memmap(fp, dtype=BAR_DTYPE, mode="r", shape=(n,))["ts"]
+    pos = int(np.searchsorted(ts, bars["ts"][0], side="left"))
+    del ts
+    data = np.ascontiguousarray(bars, dtype=BAR_DTYPE).tobytes()
+    with open(fp, "r+b") as f:
+        f.seek(pos * BAR_DTYPE.itemsize)
+        f.write(data)
+        f.truncate()
+    metrics.bytes_written(len(data))
+    return len(bars)
+
+def trim(folder, symbol, max_bars, tf="1h"):
+    # Giữ lại max_bars nến cuối (ghi lại file một lần)
+    n = count(folder, symbol, tf)
+    if n <= max_bars:
+        return 0
+    keep = np.array(read(folder, symbol, last=max_bars, tf=tf))
+    write(folder, symbol, keep, tf)
+    return n - max_bars
+
+def remove(folder, symbol, tf="1h"):
+    fp = bar_path(folder, symbol, tf)
+    if os.path.exists(fp):
+        os.remove(fp)
+
+# ==== CHUYỂN ĐỔI VỚI DATAFRAME ====
+def from_frame(df):
+    ts = pd.to_datetime(df["timestamp"], utc=True).dt.as_unit("ms").astype("int64")
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    bars["ts"] = ts.to_numpy()
+    for col in ["open", "high", "low", "close"]:
+        bars[col] = df[col].to_numpy(dtype=np.float64)
+    return bars
+
+def to_frame(bars):
+    df = pd.DataFrame({col: np.asarray(bars[col]) for col in ["open", "high", "low", "close"]})
+    df.insert(0, "timestamp", pd.to_datetime(np.asarray(bars["ts"]), unit="ms"))
+    return df
+
+# ==== CSV (debug / chuyển đổi dữ liệu cũ) ====
+def export_csv(folder, symbol, out_path=None, tf="1h"):
+    out_path = out_path or os.path.join(folder, f"{symbol}_{tf}.csv")
+    to_frame(read(folder, symbol, tf=tf)).to_csv(out_path, index=False)
+    return out_path
+
+def import_csv(folder, fp, tf="1h"):
+    df = pd.read_csv(fp)
+    df = df.iloc[:, :5]
+    df.columns = ["timestamp", "open", "high", "low", "close"]
+    symbol = os.path.basename(fp).split('_')[0]
+    bars = from_frame(df)
+    bars = bars[np.argsort(bars["ts"], kind="stable")]
+    keep = np.ones(len(bars), dtype=bool)
+    keep[1:] = bars["ts"][1:] != bars["ts"][:-1]
+    return symbol, write(folder, symbol, bars[keep], tf)
+
+def import_legacy_csv(folder, tf="1h"):
+    # Chuyển các file {symbol}_1h.csv cũ sang .bars (chỉ symbol chưa có file .bars)
+    n = 0
+    for fp in glob.glob(os.path.join(folder, f"*_{tf}.csv")):
+        symbol = os.path.basename(fp).split('_')[0]
+        if exists(folder, symbol, tf):
+            continue
+        try:
+            import_csv(folder, fp, tf)
+            n += 1
+        except Exception as e:
+            print(f"[STORE] Lỗi chuyển {fp}: {e}")
+    return n
+
+if __name__ == "__main__":
+    # python bar_store.py export SYMBOL [out.csv] [folder]
+    # python bar_store.py import [folder]
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "export" and len(sys.argv) > 2:
+        folder = sys.argv[4] if len(sys.argv) > 4 else "/data/Data1200bar"
+        out = sys.argv[3] if len(sys.argv) > 3 else None
+        print(export_csv(folder, sys.argv[2], out))
+    elif cmd == "import":
+        folder = sys.argv[2] if len(sys.argv) > 2 else "/data/Data1200bar"
+        print(f"[STORE] Đã chuyển {import_legacy_csv(folder)} file CSV sang .bars")
+    else:
+        print("Cách dùng: python bar_store.py export SYMBOL [out.csv] [folder] | import [folder]")
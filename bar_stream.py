@@ -0,0 +1,190 @@
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import bar_store
+import timeframes
+import integrity
+
+# Nhận nến 1h theo thời gian thực qua WebSocket kline của Bybit: mỗi nến đóng
+# (confirm=true) được append ngay vào bar_store và gom lại (debounce vài giây)
+# để gọi đánh giá tín hiệu cho đúng các symbol vừa có nến mới. Chỉ khi nến
+# không nối tiếp được (mất kết nối, thiếu nến) mới gọi on_gap để lấp bằng REST.
+
+BAR_MS = 3600 * 1000
+INTERVAL = 60
+SUB_CHUNK = 10     # số topic mỗi lần subscribe
+DEBOUNCE = 2.0     # giây gom nến trước khi đánh giá
+MAX_BARS = 1200
+TRIM_SLACK = 1.5   # như u4.py: chỉ cắt file về MAX_BARS khi vượt 1.5 × MAX_BARS
+
+def parse_kline_message(msg):
+    # Trả về (symbol, bars đã confirm) hoặc None nếu không phải message kline
+    parts = msg.get("topic", "").split(".")
+    if len(parts) != 3 or parts[0] != "kline":
+        return None
+    rows = [d for d in msg.get("data", []) if d.get("confirm")]
+    bars = np.empty(len(rows), dtype=bar_store.BAR_DTYPE)
+    for i, d in enumerate(sorted(rows, key=lambda d: int(d["start"]))):
+        bars[i] = (int(d["start"]), float(d["open"]), float(d["high"]), float(d["low"]), float(d["close"]))
+    return parts[2], bars
+
+def default_ws_factory(category):
+    from pybit.unified_trading import WebSocket
+    return WebSocket(testnet=False, channel_type=category)
+
+class BarStream:
+    def __init__(self, symbols, data_folder, on_bars, on_gap, categories=None,
+                 ws_factory=default_ws_factory, record_path=None, debounce=DEBOUNCE,
+                 max_bars=MAX_BARS, trim_slack=TRIM_SLACK):
+        self.symbols = list(symbols)
+        self.data_folder = data_folder
+        self.on_bars = on_bars          # on_bars(list symbol) -> đánh giá tín hiệu
+        self.on_gap = on_gap            # on_gap(list symbol) -> lấp dữ liệu bằng REST
+        self.categories = categories or {}
+        self.ws_factory = ws_factory
+        self.record_path = record_path
+        self.debounce = debounce
+        self.max_bars = max_bars
+        self.trim_slack = trim_slack
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.last = {}
+        self.pending = set()
+        self.gaps = set()
+        self.timer = None
+        self.sockets = []
+        self.stats = {"messages": 0, "bars": 0, "gaps": 0, "evaluations": 0}
+
+    # ==== ĐĂNG KÝ ====
+    def start(self):
+        groups = {}
+        for sym in self.symbols:
+            groups.setdefault(self.categories.get(sym, "linear"), []).append(sym)
+        for category, syms in groups.items():
+            ws = self.ws_factory(category)
+            for i in range(0, len(syms), SUB_CHUNK):
+                ws.kline_stream(interval=INTERVAL, symbol=syms[i:i + SUB_CHUNK], callback=self.handle)
+            self.sockets.append(ws)
+        print(f"[STREAM] Đã subscribe kline {INTERVAL} cho {len(self.symbols)} symbol")
+        return self.sockets
+
+    # ==== NHẬN MESSAGE ====
+    def handle(self, msg):
+        self.stats["messages"] += 1
+        if self.record_path:
+            with open(self.record_path, "a") as f:
+                f.write(json.dumps(msg) + "\n")
+        parsed = parse_kline_message(msg)
+        if parsed is None:
+            return
+        symbol, bars = parsed
+        if len(bars) == 0:
+            return
+        with self.lock:
+            for bar in bars:
+                self._accept(symbol, bar)
+            self._schedule()
+
+    def _accept(self, symbol, bar):
+        ts = int(bar["ts"])
+        with bar_store.symbol_lock(self.data_folder, symbol):
+            # Đọc nến cuối ngay trong khoá: u4 (on_gap / job giờ) có thể vừa ghi lại file
+            prev = bar_store.last_ts(self.data_folder, symbol)
+            if prev is not None and ts <= prev:
+                self.last[symbol] = prev
+                return
+            if prev is None or ts != prev + BAR_MS:
+                # Không nối tiếp được: để REST lấp (sẽ lấy luôn cả nến này)
+                self.gaps.add(symbol)
+                self.stats["gaps"] += 1
+                return
+            bar_store.append(self.data_folder, symbol, bar.reshape(1))
+            index = integrity.get_index(self.data_folder)
+            n_bars = bar_store.count(self.data_folder, symbol)
+            index.record_append(symbol, bar.reshape(1), prev, n_bars)
+            if n_bars > self.max_bars * self.trim_slack:
+                # Chế độ stream không chạy u4 mỗi giờ nên tự cắt file ở đây
+                bar_store.trim(self.data_folder, symbol, self.max_bars)
+                kept = bar_store.read(self.data_folder, symbol)
+                index.record_trim(symbol, int(kept["ts"][0]), int(kept["ts"][-1]), len(kept))
+            timeframes.update(self.data_folder, symbol, max_bars=self.max_bars)
+        self.last[symbol] = ts
+        self.pending.add(symbol)
+        self.stats["bars"] += 1
+
+    def _schedule(self):
+        if self.timer is None:
+            self.timer = threading.Timer(self.debounce, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    # ==== ĐÁNH GIÁ ====
+    def flush(self):
+        with self.lock:
+            self.timer = None
+            pending, gaps = self.pending, self.gaps
+            self.pending, self.gaps = set(), set()
+        if not pending and not gaps:
+            return
+        with self.flush_lock:
+            if gaps:
+                try:
+                    self.on_gap(sorted(gaps))
+                except Exception as e:
+                    logging.warning(f"[STREAM] Lỗi lấp dữ liệu {sorted(gaps)}: {e}")
+                with self.lock:
+                    for sym in gaps:
+                        self.last.pop(sym, None)
+            try:
+                self.on_bars(sorted(pending | gaps))
+                self.stats["evaluations"] += 1
+            except Exception as e:
+                logging.warning(f"[STREAM] Lỗi đánh giá tín hiệu: {e}")
+
+    def check_stale(self, now=None):
+        # Chạy định kỳ: symbol nào chưa có nến đã đóng gần nhất thì coi như gap
+        now = now or datetime.now(timezone.utc)
+        last_closed = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+        last_closed_ms = int(last_closed.timestamp() * 1000)
+        with self.lock:
+            for sym in self.symbols:
+                if sym not in self.last:
+                    self.last[sym] = bar_store.last_ts(self.data_folder, sym)
+                if self.last[sym] is None or self.last[sym] < last_closed_ms:
+                    self.gaps.add(sym)
+            stale = len(self.gaps)
+        if stale:
+            print(f"[STREAM] {stale} symbol thiếu nến, lấp bằng REST")
+        self.flush()
+        return stale
+
+# ==== PHÁT LẠI MESSAGE ĐÃ GHI (thay cho WebSocket thật khi test) ====
+class ReplayWebSocket:
+    def __init__(self, path, channel_type="linear", delay=0.0):
+        self.path = path
+        self.channel_type = channel_type
+        self.delay = delay
+        self.subscriptions = []
+
+    def kline_stream(self, interval, symbol, callback):
+        symbols = [symbol] if isinstance(symbol, str) else list(symbol)
+        self.subscriptions.append((f"kline.{interval}.", set(symbols), callback))
+
+    def replay(self):
+        n = 0
+        with open(self.path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                msg = json.loads(line)
+                topic = msg.get("topic", "")
+                for prefix, symbols, callback in self.subscriptions:
+                    if topic.startswith(prefix) and topic[len(prefix):] in symbols:
+                        callback(msg)
+                        n += 1
+                if self.delay:
+                    time.sleep(self.delay)
+        return n
@@ -0,0 +1,267 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import bar_store
+import instruments
+import signal_engine
+import indicator_state
+import order_exec
+import u4
+import t1
+from rate_limit import AdaptiveLimiter
+from portfolio import Portfolio
+from stand_ins import last_closed_ms, SyntheticMarket, RecordedMarket, ReplaySession, FakeHTTP, record_fixtures
+
+# Benchmark toàn pipeline u4.py -> t1.py trên dữ liệu phát lại (không gọi Bybit):
+# đo từng giai đoạn (lấy list symbol, fetch/parse/ghi nến, nạp kho nến, tính
+# tín hiệu, đối soát lệnh, đặt lệnh) cho nhiều quy mô symbol, ghi mỗi lần chạy
+# thành một dòng JSON (kèm commit) để so sánh giữa các commit.
+#
+#   python bench/run_bench.py --sizes 480,1000,2000,5000
+#   python bench/run_bench.py --record /data/bench_fixtures [--symbols BTCUSDT,ETHUSDT]
+#   python bench/run_bench.py --fixtures /data/bench_fixtures --latency 0.02
+#
+# --record ghi instruments + kline của các symbol (mặc định capcoin.csv); nếu có
+# BYBIT_API_KEY / BYBIT_API_SECRET thì ghi thêm lệnh và position của tài khoản.
+# Phản hồi đặt lệnh luôn được giả lập (không đặt lệnh thật để ghi lại).
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+LEGACY_SAMPLE = 50     # số symbol chạy calc_signals (ta + pandas) để so với engine vector hoá
+N_ORDERS = 500         # số lệnh đang theo dõi khi đo đối soát
+N_PLACE = 20           # số tín hiệu vào lệnh khi đo đặt lệnh
+N_POSITIONS = 200      # số position đang mở khi đo nạp vị thế (dữ liệu tổng hợp)
+
+def git_commit():
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=root, text=True).strip()
+    except Exception:
+        return None
+
+@contextlib.contextmanager
+def quiet():
+    # u4 / t1 in log cho từng symbol, không tính phần in ra màn hình vào kết quả
+    level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.ERROR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            yield
+        finally:
+            logging.getLogger().setLevel(level)
+
+class Timer:
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        yield
+        self.stages[name] = round(time.perf_counter() - t0, 4)
+
+# ==== CHUẨN BỊ MÔI TRƯỜNG ====
+def setup(workdir, market, symbols, latency):
+    data = os.path.join(workdir, "bars")
+    with open(os.path.join(workdir, "capcoin.csv"), "w") as f:
+        f.write("\n".join(symbols) + "\n")
+    u4.contracts_file = os.path.join(workdir, "capcoin.csv")
+    u4.data_folder = data
+    u4.resync_file = os.path.join(workdir, "resync.json")
+    u4.universe_file = os.path.join(workdir, "universe.json")
+    u4.limiter = AdaptiveLimiter(rate=1e6, max_rate=1e6, concurrency=u4.max_concurrency,
+                                 max_concurrency=u4.max_concurrency)
+    t1.DATA_FOLDER = data
+    t1.STATE_FILE = os.path.join(workdir, "state.json")
+    t1.RESYNC_FILE = u4.resync_file
+    t1.ORDER_DB = os.path.join(workdir, "orders.db")
+    t1.ORDER_LOG = os.path.join(workdir, "active_orders.json")
+    t1.session = FakeHTTP(market, latency=latency)
+    t1.rest_limiter = order_exec.RateLimiter(1e6)
+    t1.instrument_cache = None
+    t1.indicator_states = None
+    t1.active_orders_cache = None
+    t1.order_store = None
+    t1.portfolio = Portfolio(t1.LEVERAGE)
+    instruments.CACHE_FILE = os.path.join(workdir, "instruments.json")
+    return data
+
+# ==== CÁC GIAI ĐOẠN ====
+def bench_u4(timer, http, market, symbols, workdir):
+    async def fetch_lists():
+        return await instruments.get_instruments_async(http, force=True)
+
+    async def run():
+        return await u4.run(http)
+
+    with timer.stage("symbol_list"):
+        asyncio.run(fetch_lists())
+    calls_before = dict(http.calls)
+    with quiet(), timer.stage("fetch_cold"):
+        cold = asyncio.run(run())
+    kline_calls = http.calls.get("market/kline", 0) - calls_before.get("market/kline", 0)
+    with quiet(), timer.stage("fetch_warm"):
+        warm = asyncio.run(run())
+    # Tách riêng phần giải mã và ghi của lần backfill (không qua mạng / limiter)
+    end = last_closed_ms()
+    raw = [market.klines(sym, 0, end, u4.MAX_BARS) for sym in symbols]
+    with timer.stage("parse"):
+        parsed = [u4.parse_klines(rows) for rows in raw]
+    scratch = os.path.join(workdir, "scratch")
+    os.makedirs(scratch, exist_ok=True)
+    with timer.stage("write"):
+        for sym, bars in zip(symbols, parsed):
+            bar_store.write(scratch, sym, bars)
+    return {
+        "updated_cold": cold["updated"],
+        "unchanged_warm": warm["unchanged"],
+        "errors": len(cold["error"]) + len(warm["error"]),
+        "kline_requests": kline_calls,
+    }
+
+def bench_signals(timer, symbols):
+    with quiet(), timer.stage("store_load"):
+        kept, series, stamps, last_prices, _ = t1.load_closes(symbols)
+    closes = signal_engine.stack_right_aligned(series)
+    with timer.stage("signals_seed"):
+        states = indicator_state.seed_states(kept, closes, [s[-1] for s in stamps], t1.STRATEGY_PARAMS)
+    with timer.stage("signals_batch"):
+        directions = signal_engine.batch_signals(closes, **t1.STRATEGY_PARAMS)
+    # Nến mới tiếp theo cho mọi symbol: cập nhật O(1) từ trạng thái đã lưu
+    with timer.stage("signals_incremental"):
+        for i, sym in enumerate(kept):
+            indicator_state.advance_bars(states[sym], series[i][-1:] * 1.001,
+                                         stamps[i][-1:] + 3600 * 1000, t1.STRATEGY_PARAMS)
+    sample = kept[:LEGACY_SAMPLE]
+    frames = [pd.DataFrame({"close": series[i]}) for i in range(len(sample))]
+    with timer.stage("calc_signals_sample"):
+        for df in frames:
+            t1.calc_signals(df)
+    per = timer.stages["calc_signals_sample"] / max(len(sample), 1)
+    timer.stages["calc_signals_est"] = round(per * len(kept), 4)
+    return kept, last_prices, sum(1 for d in directions if d)
+
+def bench_orders(timer, market, kept, last_prices):
+    fake = t1.session
+    # Lệnh / position đã ghi (fixtures) hoặc sinh tổng hợp
+    fake.orders.update(market.orders(kept, N_ORDERS))
+    fake.positions = market.positions(kept, N_POSITIONS)
+    with quiet():
+        t1.load_instruments()
+        active = t1.load_active_orders()
+        for oid, o in fake.orders.items():
+            t1.order_store.add(o["symbol"], oid)
+        active = t1.order_store.open_orders()
+    before = dict(fake.calls)
+    with quiet(), timer.stage("reconcile"):
+        t1.cleanup_closed_orders(active)
+    reconcile_calls = {k: v - before.get(k, 0) for k, v in fake.calls.items() if v != before.get(k, 0)}
+
+    before = dict(fake.calls)
+    with quiet(), timer.stage("positions"):
+        t1.load_positions()
+    positions_calls = {k: v - before.get(k, 0) for k, v in fake.calls.items() if v != before.get(k, 0)}
+
+    jobs = [(sym, price, "long" if i % 2 else "short", active)
+            for i, (sym, price) in enumerate(zip(kept[:N_PLACE], last_prices[:N_PLACE]))]
+    before = dict(fake.calls)
+    with quiet(), timer.stage("place_orders"):
+        if t1.ORDER_MODE == "batch":
+            t1.execute_signals_batch(jobs)
+        else:
+            order_exec.run_concurrent(jobs, t1.execute_signal, t1.EXEC_WORKERS)
+    place_calls = {k: v - before.get(k, 0) for k, v in fake.calls.items() if v != before.get(k, 0)}
+    t1.order_store.close()
+    t1.order_store = None
+    return {"reconcile_calls": reconcile_calls, "positions_calls": positions_calls,
+            "positions_loaded": len(fake.positions), "place_calls": place_calls, "orders_placed": len(jobs)}
+
+def bench_size(market, n_symbols, latency, keep=False):
+    symbols = market.symbols[:n_symbols]
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    timer = Timer()
+    try:
+        market.prepare(symbols)
+        data = setup(workdir, market, symbols, latency)
+        http = ReplaySession(market, latency=latency)
+        fetch = bench_u4(timer, http, market, symbols, workdir)
+        kept, last_prices, n_signals = bench_signals(timer, symbols)
+        orders = bench_orders(timer, market, kept, last_prices)
+        bytes_on_disk = sum(os.path.getsize(os.path.join(data, fn)) for fn in os.listdir(data))
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    n = max(len(symbols), 1)
+    return {
+        "n_symbols": len(symbols),
+        "stages": timer.stages,
+        "per_symbol_ms": {k: round(v * 1000 / n, 4) for k, v in timer.stages.items()
+                          if k not in ("calc_signals_sample", "place_orders", "reconcile", "positions")},
+        "signals": n_signals,
+        "bytes_on_disk": bytes_on_disk,
+        **fetch,
+        **orders,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline u4.py -> t1.py trên dữ liệu phát lại")
+    parser.add_argument("--sizes", default="480,1000,2000,5000", help="số symbol cho từng lần đo (tổng hợp)")
+    parser.add_argument("--fixtures", default=None, help="thư mục fixtures đã ghi (record_fixtures)")
+    parser.add_argument("--latency", type=float, default=0.0, help="độ trễ giả lập mỗi request (giây)")
+    parser.add_argument("--out", default=RESULTS_FILE, help="file JSON lines nhận kết quả")
+    parser.add_argument("--keep", action="store_true", help="giữ lại thư mục tạm để kiểm tra")
+    parser.add_argument("--record", default=None, help="ghi fixtures từ API thật vào thư mục này rồi thoát")
+    parser.add_argument("--symbols", default=None, help="danh sách symbol khi --record (mặc định capcoin.csv)")
+    args = parser.parse_args()
+
+    if args.record:
+        if args.symbols:
+            symbols = [s for s in args.symbols.split(",") if s]
+        else:
+            import universe
+            symbols = universe.load_contracts(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "capcoin.csv"))
+        record_fixtures(args.record, symbols, api_key=os.getenv("BYBIT_API_KEY"),
+                        api_secret=os.getenv("BYBIT_API_SECRET"))
+        print(f"[BENCH] Đã ghi fixtures của {len(symbols)} symbol vào {args.record}")
+        return
+
+    if args.fixtures:
+        market = RecordedMarket(args.fixtures)
+        sizes = [len(market.symbols)]
+    else:
+        sizes = [int(s) for s in args.sizes.split(",") if s]
+        market = SyntheticMarket(max(sizes))
+    meta = {
+        "commit": git_commit(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "source": "fixtures" if args.fixtures else "synthetic",
+        "latency": args.latency,
+    }
+    with open(args.out, "a") as f:
+        for n in sizes:
+            res = {**meta, **bench_size(market, n, args.latency, args.keep)}
+            f.write(json.dumps(res) + "\n")
+            f.flush()
+            stages = "  ".join(f"{k}={v:.3f}s" for k, v in res["stages"].items())
+            print(f"[BENCH] {res['n_symbols']} symbol: {stages}")
+    print(f"[BENCH] Đã ghi kết quả: {args.out}")
+
+if __name__ == "__main__":
+    main()
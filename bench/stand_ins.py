@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import numpy as np
+
+# Thay thế cục bộ cho aiohttp.ClientSession (market REST của u4.py) và
+# pybit HTTP (lệnh / position của t1.py). Dữ liệu lấy từ thư mục fixtures đã
+# ghi lại (record_fixtures) hoặc sinh tổng hợp cho N symbol. Mọi lời gọi đều
+# được đếm theo endpoint; có thể thêm độ trễ giả lập mỗi request.
+
+BAR_MS = 3600 * 1000
+
+def last_closed_ms(now=None):
+    now = now or time.time()
+    return int(now // 3600) * BAR_MS - BAR_MS
+
+# ==== NGUỒN DỮ LIỆU ====
+class SyntheticMarket:
+    WINDOW = 2000   # số nến sinh sẵn cho mỗi symbol
+
+    def __init__(self, n_symbols, seed=1):
+        self.symbols = [f"SYN{i:04d}USDT" for i in range(n_symbols)]
+        self.seed = seed
+        self.cache = {}
+
+    def _series(self, symbol):
+        # Giá xác định theo (symbol, giờ), sinh một lần dạng chuỗi như API thật (mới nhất trước)
+        if symbol not in self.cache:
+            end = last_closed_ms()
+            ts = end - BAR_MS * np.arange(self.WINDOW, dtype=np.int64)
+            h = ts // BAR_MS
+            rng = np.random.default_rng([self.seed, self.symbols.index(symbol) if symbol in self.symbols else 0])
+            base = 1 + rng.random() * 100
+            c = base * (1 + 0.05 * np.sin(h / 17.0 + rng.random() * 6) + 0.02 * np.sin(h / 3.1))
+            cols = [ts.astype(str)] + [x.astype(str) for x in (c * 0.999, c * 1.01, c * 0.99, c, c * 0 + 1000, c * 0 + 1000)]
+            self.cache[symbol] = (ts, np.column_stack(cols).tolist())
+        return self.cache[symbol]
+
+    def prepare(self, symbols):
+        # Sinh trước dữ liệu để phần sinh không bị tính vào thời gian fetch
+        for symbol in symbols:
+            self._series(symbol)
+
+    def klines(self, symbol, start_ms, end_ms, limit):
+        ts, rows = self._series(symbol)
+        # ts giảm dần: lấy các nến trong [start_ms, end_ms], tối đa limit nến mới nhất
+        lo = int(np.searchsorted(-ts, -end_ms, side="left"))
+        hi = int(np.searchsorted(-ts, -start_ms, side="right"))
+        return rows[lo:min(hi, lo + limit)]
+
+    def instruments(self, category):
+        if category != "linear":
+            return []
+        return [{
+            "symbol": s, "status": "Trading",
+            "lotSizeFilter": {"qtyStep": "0.1", "minOrderQty": "0.1"},
+            "priceFilter": {"tickSize": "0.0001"},
+        } for s in self.symbols]
+
+    def orders(self, symbols, n):
+        # n lệnh đang theo dõi: phần lớn đã khớp / huỷ, một ít còn chờ TP/SL
+        statuses = ("Filled", "Cancelled", "Untriggered", "New")
+        return {f"old-{i}": {"symbol": symbols[i % len(symbols)], "orderStatus": statuses[i % len(statuses)],
+                             "avgPrice": "1.0"} for i in range(n)}
+
+    def positions(self, symbols, n):
+        return [{"symbol": sym, "side": "Buy" if i % 2 else "Sell", "size": "10", "positionValue": "100",
+                 "positionIM": "50", "leverage": "2", "positionIdx": 0}
+                for i, sym in enumerate(symbols[:n])]
+
+class RecordedMarket:
+    # Fixtures: instruments_{category}.json (list item), klines/{symbol}.json (list row, mới nhất trước),
+    # tuỳ chọn orders.json / positions.json (list item của order/history + order/realtime, position/list).
+    # Timestamp được dịch để nến cuối trùng với nến đã đóng gần nhất hiện tại.
+    def __init__(self, folder):
+        self.folder = folder
+        self.rows = {}
+        kdir = os.path.join(folder, "klines")
+        for fn in sorted(os.listdir(kdir)):
+            with open(os.path.join(kdir, fn)) as f:
+                self.rows[fn[:-5]] = json.load(f)
+        self.symbols = sorted(self.rows)
+        newest = max(int(r[0][0]) for r in self.rows.values() if r)
+        self.shift = last_closed_ms() - newest
+
+    def prepare(self, symbols):
+        pass
+
+    def klines(self, symbol, start_ms, end_ms, limit):
+        out = []
+        for r in self.rows.get(symbol, []):
+            t = int(r[0]) + self.shift
+            if start_ms <= t <= end_ms:
+                out.append([str(t)] + r[1:])
+        return out[:limit]
+
+    def _load(self, name):
+        fp = os.path.join(self.folder, name)
+        if not os.path.exists(fp):
+            return None
+        with open(fp) as f:
+            return json.load(f)
+
+    def instruments(self, category):
+        return self._load(f"instruments_{category}.json") or []
+
+    def orders(self, symbols, n):
+        # Lệnh đã ghi (nếu có) thay cho lệnh sinh; n bị bỏ qua
+        items = self._load("orders.json")
+        if items is None:
+            return SyntheticMarket.orders(self, symbols, n)
+        return {o["orderId"]: {k: v for k, v in o.items() if k != "orderId"} for o in items}
+
+    def positions(self, symbols, n):
+        items = self._load("positions.json")
+        return SyntheticMarket.positions(self, symbols, n) if items is None else items
+
+# ==== aiohttp.ClientSession ====
+class _Response:
+    def __init__(self, payload, status=200, headers=None):
+        self.payload = payload
+        self.status = status
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self, loads=json.loads, content_type=None):
+        return loads(json.dumps(self.payload))
+
+class ReplaySession:
+    def __init__(self, market, latency=0.0):
+        self.market = market
+        self.latency = latency
+        self.calls = {}
+
+    def get(self, url, params=None, **kwargs):
+        endpoint = url.rsplit("/v5/", 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        return _Delayed(self._respond(endpoint, params or {}), self.latency)
+
+    def _respond(self, endpoint, params):
+        if endpoint == "market/instruments-info":
+            return _Response({"retCode": 0, "result": {"list": self.market.instruments(params["category"]), "nextPageCursor": ""}})
+        if endpoint == "market/kline":
+            rows = self.market.klines(params["symbol"], int(params["start"]), int(params["end"]), int(params["limit"]))
+            return _Response({"retCode": 0, "result": {"list": rows}})
+        return _Response({"retCode": 10001, "result": {}}, status=404)
+
+    async def close(self):
+        pass
+
+class _Delayed:
+    def __init__(self, resp, latency):
+        self.resp = resp
+        self.latency = latency
+
+    async def __aenter__(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.resp
+
+    async def __aexit__(self, *exc):
+        return False
+
+# ==== pybit HTTP ====
+class FakeHTTP:
+    def __init__(self, market=None, latency=0.0, orders=None, positions=None):
+        self.market = market
+        self.latency = latency
+        self.orders = dict(orders or {})          # orderId -> {"symbol", "orderStatus", "avgPrice"}
+        self.positions = list(positions or [])
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.reject = set()         # symbol bị từ chối mọi lệnh trong batch
+        self.reject_legs = set()    # symbol bị từ chối chân TP/SL (cả batch lẫn place_order)
+        self.fill_delay = {}        # symbol -> số lần hỏi lệnh market còn ở trạng thái New trước khi khớp
+        self.unfilled = {}          # orderId -> số lần hỏi còn lại
+
+    def _hit(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _page(self, items, limit, cursor):
+        start = int(cursor or 0)
+        page = items[start:start + limit]
+        nxt = str(start + limit) if start + limit < len(items) else ""
+        return {"retCode": 0, "result": {"list": page, "nextPageCursor": nxt}}
+
+    def get_server_time(self):
+        self._hit("get_server_time")
+        return {"retCode": 0, "result": {"timeSecond": str(int(time.time()))}}
+
+    def get_instruments_info(self, category, symbol=None, limit=1000, cursor=None, **kw):
+        self._hit("get_instruments_info")
+        items = self.market.instruments(category) if self.market else []
+        if symbol:
+            items = [i for i in items if i["symbol"] == symbol]
+        return self._page(items, int(limit), cursor)
+
+    def get_order_history(self, category, symbol=None, orderId=None, limit=50, cursor=None, **kw):
+        self._hit("get_order_history")
+        with self.lock:
+            if orderId in self.unfilled:
+                self.unfilled[orderId] -= 1
+                if self.unfilled[orderId] < 0:
+                    del self.unfilled[orderId]
+                    self.orders[orderId].update(orderStatus="Filled", avgPrice="1.0")
+            # Như API thật: lệnh mới nhất trước
+            items = [{"orderId": oid, **o} for oid, o in reversed(self.orders.items())
+                     if (not orderId or oid == orderId) and (not symbol or o["symbol"] == symbol)]
+        return self._page(items, int(limit), cursor)
+
+    def get_open_orders(self, category, limit=50, cursor=None, **kw):
+        self._hit("get_open_orders")
+        items = [{"orderId": oid, **o} for oid, o in self.orders.items() if o["orderStatus"] in ("New", "Untriggered")]
+        return self._page(items, int(limit), cursor)
+
+    def get_positions(self, category, symbol=None, limit=200, cursor=None, **kw):
+        self._hit("get_positions")
+        items = [p for p in self.positions if not symbol or p["symbol"] == symbol]
+        return self._page(items, int(limit), cursor)
+
+    def _new_order(self, symbol, kw):
+        with self.lock:
+            self.next_id += 1
+            oid = f"bench-{self.next_id}"
+            if "triggerPrice" in kw:
+                self.orders[oid] = {"symbol": symbol, "orderStatus": "Untriggered", "avgPrice": ""}
+            elif self.fill_delay.get(symbol):
+                self.orders[oid] = {"symbol": symbol, "orderStatus": "New", "avgPrice": "0"}
+                self.unfilled[oid] = self.fill_delay[symbol]
+            else:
+                self.orders[oid] = {"symbol": symbol, "orderStatus": "Filled", "avgPrice": "1.0"}
+        return oid
+
+    def _rejected(self, symbol, kw):
+        return symbol in self.reject or ("triggerPrice" in kw and symbol in self.reject_legs)
+
+    def place_order(self, category, symbol, side, orderType, qty, **kw):
+        self._hit("place_order")
+        if "triggerPrice" in kw and symbol in self.reject_legs:
+            return {"retCode": 110007, "retMsg": "ab not enough for new order", "result": {}}
+        return {"retCode": 0, "result": {"orderId": self._new_order(symbol, kw)}}
+
+    def place_batch_order(self, category, request, **kw):
+        # reject / reject_legs: lệnh bị từ chối riêng lẻ (kiểm tra xử lý lỗi một phần)
+        self._hit("place_batch_order")
+        results, infos = [], []
+        for req in request:
+            link = req.get("orderLinkId", "")
+            if self._rejected(req["symbol"], req):
+                results.append({"orderId": "", "symbol": req["symbol"], "orderLinkId": link})
+                infos.append({"code": 110007, "msg": "ab not enough for new order"})
+                continue
+            oid = self._new_order(req["symbol"], req)
+            results.append({"orderId": oid, "symbol": req["symbol"], "orderLinkId": link})
+            infos.append({"code": 0, "msg": "OK"})
+        return {"retCode": 0, "result": {"list": results}, "retExtInfo": {"list": infos}}
+
+# ==== GHI FIXTURES TỪ API THẬT ====
+def record_fixtures(folder, symbols, n_bars=1200, api_key=None, api_secret=None):
+    # Endpoint public (instruments, kline) không cần API key; có key thì ghi thêm lệnh
+    # (order/history + order/realtime) và position của tài khoản để phát lại khi đo t1.py
+    import aiohttp
+
+    async def run():
+        os.makedirs(os.path.join(folder, "klines"), exist_ok=True)
+        url = "https://api.bybit.com/v5/market"
+        async with aiohttp.ClientSession() as http:
+            for category in ("linear", "spot"):
+                items, cursor = [], None
+                while True:
+                    params = {"category": category, "limit": 1000}
+                    if cursor:
+                        params["cursor"] = cursor
+                    async with http.get(f"{url}/instruments-info", params=params) as resp:
+                        js = await resp.json()
+                    items += js["result"].get("list", [])
+                    cursor = js["result"].get("nextPageCursor")
+                    if not cursor:
+                        break
+                with open(os.path.join(folder, f"instruments_{category}.json"), "w") as f:
+                    json.dump(items, f)
+            end = last_closed_ms()
+            for symbol in symbols:
+                rows, stop = [], end
+                while len(rows) < n_bars:
+                    params = {"category": "linear", "symbol": symbol, "interval": "60",
+                              "limit": 1000, "end": stop}
+                    async with http.get(f"{url}/kline", params=params) as resp:
+                        js = await resp.json()
+                    batch = js.get("result", {}).get("list", [])
+                    if not batch:
+                        break
+                    rows += batch
+                    stop = int(batch[-1][0]) - BAR_MS
+                with open(os.path.join(folder, "klines", f"{symbol}.json"), "w") as f:
+                    json.dump(rows[:n_bars], f)
+
+    asyncio.run(run())
+    if api_key:
+        record_account(folder, api_key, api_secret)
+
+def record_account(folder, api_key, api_secret):
+    from pybit.unified_trading import HTTP
+    from order_sync import iter_pages, PAGE_LIMIT
+    from portfolio import PAGE_LIMIT as POSITION_LIMIT
+    session = HTTP(api_key=api_key, api_secret=api_secret)
+    orders = {o["orderId"]: o for o in iter_pages(session.get_order_history, category="linear", limit=PAGE_LIMIT)}
+    for o in iter_pages(session.get_open_orders, category="linear", settleCoin="USDT", limit=PAGE_LIMIT):
+        orders[o["orderId"]] = o
+    positions = list(iter_pages(session.get_positions, category="linear", settleCoin="USDT", limit=POSITION_LIMIT))
+    with open(os.path.join(folder, "orders.json"), "w") as f:
+        json.dump(list(orders.values()), f)
+    with open(os.path.join(folder, "positions.json"), "w") as f:
+        json.dump(positions, f)
+    return len(orders), len(positions)
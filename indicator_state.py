@@ -0,0 +1,162 @@
+import os
+import json
+import math
+import numpy as np
+from signal_engine import (
+    ema, rsi_averages, rsi_from_averages, bollinger, bar_counts, conditions_from_indicators,
+)
+
+try:
+    import fcntl   # khoá file khi nhiều shard u4 cùng ghi danh sách resync (không có trên Windows)
+except ImportError:
+    fcntl = None
+
+# Trạng thái chỉ báo theo từng symbol, lưu giữa các lần chạy để mỗi giờ chỉ
+# phải cập nhật nến mới (O(1)) thay vì tính lại toàn bộ 1200 nến.
+# Mỗi state gồm: EMA, trung bình tăng/giảm của RSI (Wilder), cửa sổ BB_LEN
+# giá đóng cửa gần nhất, cờ điều kiện long/short của WAIT_BARS nến cuối.
+
+BAR_MS = 3600 * 1000
+
+# ==== ĐỌC / GHI TRẠNG THÁI ====
+def load_states(path):
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    return {}
+
+def save_states(path, states):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(states, f)
+    os.replace(tmp, path)
+
+# ==== DANH SÁCH SYMBOL CẦN TÍNH LẠI (u4.py báo khi backfill / có gap) ====
+def load_resync(path):
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return set(json.load(f))
+        except Exception:
+            return set()
+    return set()
+
+def mark_resync(path, symbols):
+    if not symbols:
+        return
+    with open(path + ".lock", "w") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        merged = load_resync(path) | set(symbols)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(sorted(merged), f)
+        os.replace(tmp, path)
+
+def clear_resync(path, symbols=None):
+    # symbols=None: xoá hết; ngược lại chỉ bỏ các symbol đã được tính lại
+    if not os.path.exists(path):
+        return
+    remaining = set() if symbols is None else load_resync(path) - set(symbols)
+    if remaining:
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(sorted(remaining), f)
+        os.replace(tmp, path)
+    else:
+        os.remove(path)
+
+# ==== KHỞI TẠO TỪ TOÀN BỘ LỊCH SỬ (vector hoá) ====
+# Chỉ gọi với chuỗi đã đủ EMA_LEN + 1 nến (t1.py đã lọc), nên giá trị cuối luôn hợp lệ.
+def seed_states(symbols, closes, last_ts, params):
+    if not symbols:
+        return {}
+    wait_bars = params["wait_bars"]
+    avg_up, avg_down = rsi_averages(closes, params["rsi_len"])
+    e = ema(closes, params["ema_len"])
+    upper, lower = bollinger(closes, params["bb_len"], params["stddev"], tail=wait_bars)
+    r = rsi_from_averages(avg_up, avg_down)
+    cond_long, cond_short = conditions_from_indicators(
+        closes[:, -wait_bars:], r[:, -wait_bars:], e[:, -wait_bars:], upper, lower,
+        params["rsi_ob"], params["rsi_os"],
+    )
+    counts = bar_counts(closes)
+    states = {}
+    for i, symbol in enumerate(symbols):
+        n = int(counts[i])
+        states[symbol] = {
+            "params": params,
+            "last_ts": int(last_ts[i]),
+            "count": n,
+            "last_close": float(closes[i, -1]),
+            "ema": float(e[i, -1]),
+            "avg_up": float(avg_up[i, -1]),
+            "avg_down": float(avg_down[i, -1]),
+            "window": [float(x) for x in closes[i, -min(n, params["bb_len"]):]],
+            "long": [bool(x) for x in cond_long[i, -min(n, wait_bars):]],
+            "short": [bool(x) for x in cond_short[i, -min(n, wait_bars):]],
+        }
+    return states
+
+# ==== CẬP NHẬT 1 NẾN MỚI (O(1)) ====
+def advance(state, close, ts):
+    p = state["params"]
+    diff = close - state["last_close"]
+    a = 1.0 / p["rsi_len"]
+    state["avg_up"] = (1 - a) * state["avg_up"] + a * max(diff, 0.0)
+    state["avg_down"] = (1 - a) * state["avg_down"] + a * max(-diff, 0.0)
+    k = 2.0 / (p["ema_len"] + 1)
+    state["ema"] = (1 - k) * state["ema"] + k * close
+    window = state["window"]
+    window.append(close)
+    if len(window) > p["bb_len"]:
+        del window[0]
+    state["count"] += 1
+    state["last_close"] = close
+    state["last_ts"] = ts
+
+    n = state["count"]
+    cond_long = cond_short = False
+    if n >= p["ema_len"] and n >= p["rsi_len"] and len(window) == p["bb_len"]:
+        mid = sum(window) / len(window)
+        std = math.sqrt(sum((x - mid) ** 2 for x in window) / len(window))
+        upper = mid + p["stddev"] * std
+        lower = mid - p["stddev"] * std
+        if state["avg_down"] == 0:
+            r = 100.0
+        else:
+            r = 100 - 100 / (1 + state["avg_up"] / state["avg_down"])
+        cond_long = close < lower and r < p["rsi_os"] and close < state["ema"]
+        cond_short = close > upper and r > p["rsi_ob"] and close > state["ema"]
+    for key, flag in (("long", cond_long), ("short", cond_short)):
+        flags = state[key]
+        flags.append(flag)
+        if len(flags) > p["wait_bars"]:
+            del flags[0]
+    return state
+
+# Trả về số nến đã cập nhật, hoặc None nếu không nối tiếp được (cần tính lại từ đầu)
+def advance_bars(state, closes, timestamps, params):
+    if state is None or state.get("params") != params:
+        return None
+    last_ts = state["last_ts"]
+    new = np.flatnonzero(timestamps > last_ts)
+    if len(new) == 0:
+        return 0 if len(timestamps) and timestamps[-1] == last_ts else None
+    expected = last_ts + BAR_MS * np.arange(1, len(new) + 1)
+    if not np.array_equal(timestamps[new], expected):
+        return None
+    for i in new:
+        advance(state, float(closes[i]), int(timestamps[i]))
+    return len(new)
+
+# ==== QUYẾT ĐỊNH TÍN HIỆU ====
+def decide(state):
+    if state["long"][-1] and not any(state["long"][:-1]):
+        return "long"
+    if state["short"][-1] and not any(state["short"][:-1]):
+        return "short"
+    return None
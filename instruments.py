@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import logging
+
+# Cache thông tin instrument (category, qtyStep, minOrderQty, tickSize) dùng
+# chung cho u4.py và t1.py. Lưu ra đĩa kèm thời điểm cập nhật; hết TTL mới
+# quét lại toàn bộ instruments-info (có phân trang) một lần cho mỗi category.
+# Làm mới lỗi (mạng, rate limit) thì dùng tạm cache đã hết hạn nếu có.
+
+CACHE_FILE = "/data/instruments.json"
+CACHE_TTL = 6 * 3600   # giây
+CATEGORIES = ("linear", "spot")
+URL = "https://api.bybit.com/v5/market/instruments-info"
+PAGE_LIMIT = 1000
+
+# ==== ĐỌC / GHI CACHE ====
+def load_cache(path=None):
+    path = path or CACHE_FILE
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except Exception:
+            return None
+    return None
+
+def save_cache(cache, path=None):
+    path = path or CACHE_FILE
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"   # nhiều shard u4 có thể cùng làm mới cache
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+def is_fresh(cache, ttl=CACHE_TTL):
+    return bool(cache) and time.time() - cache.get("updated", 0) < ttl
+
+def build_cache(items_by_category):
+    cache = {"updated": time.time()}
+    for category, items in items_by_category.items():
+        table = {}
+        for item in items:
+            lot = item.get("lotSizeFilter", {})
+            price = item.get("priceFilter", {})
+            table[item["symbol"]] = {
+                "status": item.get("status"),
+                "qtyStep": float(lot.get("qtyStep") or lot.get("basePrecision") or 0),
+                "minOrderQty": float(lot.get("minOrderQty") or 0),
+                "tickSize": float(price.get("tickSize") or 0),
+            }
+        cache[category] = table
+    return cache
+
+# ==== LÀM MỚI (pybit, đồng bộ) ====
+def refresh(session, path=None):
+    items_by_category = {}
+    for category in CATEGORIES:
+        items, cursor = [], None
+        while True:
+            params = {"category": category, "limit": PAGE_LIMIT}
+            if cursor:
+                params["cursor"] = cursor
+            js = session.get_instruments_info(**params)
+            items += js["result"].get("list", [])
+            cursor = js["result"].get("nextPageCursor")
+            if not cursor:
+                break
+        items_by_category[category] = items
+    cache = build_cache(items_by_category)
+    save_cache(cache, path)
+    return cache
+
+def get_instruments(session, path=None, ttl=CACHE_TTL, force=False):
+    cache = load_cache(path)
+    if force or not is_fresh(cache, ttl):
+        try:
+            cache = refresh(session, path)
+        except Exception as e:
+            if not cache:
+                raise
+            _warn_stale(cache, e)
+    return cache
+
+# ==== LÀM MỚI (aiohttp, cho u4.py) ====
+async def refresh_async(http, path=None):
+    items_by_category = {}
+    for category in CATEGORIES:
+        items, cursor = [], None
+        while True:
+            params = {"category": category, "limit": PAGE_LIMIT}
+            if cursor:
+                params["cursor"] = cursor
+            async with http.get(URL, params=params) as resp:
+                js = await resp.json()
+            items += js["result"].get("list", [])
+            cursor = js["result"].get("nextPageCursor")
+            if not cursor:
+                break
+        items_by_category[category] = items
+    cache = build_cache(items_by_category)
+    save_cache(cache, path)
+    return cache
+
+async def get_instruments_async(http, path=None, ttl=CACHE_TTL, force=False):
+    cache = load_cache(path)
+    if force or not is_fresh(cache, ttl):
+        try:
+            cache = await refresh_async(http, path)
+        except Exception as e:
+            if not cache:
+                raise
+            _warn_stale(cache, e)
+    return cache
+
+def _warn_stale(cache, error):
+    age = (time.time() - cache.get("updated", 0)) / 3600
+    logging.warning(f"[INSTRUMENTS] Làm mới thất bại, dùng cache cũ ({age:.1f}h): {error}")
+
+# ==== TRA CỨU ====
+def category_of(cache, symbol, default="linear"):
+    for category in CATEGORIES:
+        if symbol in cache.get(category, {}):
+            return category
+    return default
+
+def lot_size(cache, symbol, category="linear"):
+    # (qtyStep, minOrderQty) hoặc None nếu symbol chưa có trong cache
+    info = cache.get(category, {}).get(symbol)
+    if not info:
+        return None
+    return info["qtyStep"], info["minOrderQty"]
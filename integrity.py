@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+import numpy as np
+import bar_store
+
+# Chỉ mục toàn vẹn của kho nến: mỗi symbol lưu vùng phủ (nến đầu / cuối, số nến)
+# và danh sách khoảng nến 1h bị thiếu ở giữa file. u4.py / bar_stream cập nhật
+# chỉ mục ngay khi ghi nến (append chỉ xét các nến mới), rồi u4.py lấy lại đúng
+# các giờ bị thiếu thay vì xoá file để tải lại 1200 nến. Khoảng nào sàn không có
+# dữ liệu (thử MAX_ATTEMPTS lần vẫn trống) thì thôi không thử lại.
+#
+#   python integrity.py verify [folder]             quét toàn bộ kho, chỉ báo cáo (không ghi chỉ mục)
+#   python integrity.py verify --rebuild [folder]   quét và dựng lại chỉ mục từ các file
+#   python integrity.py repair [folder]             dựng lại chỉ mục rồi lấy lại các giờ bị thiếu (qua u4.py)
+
+BAR_MS = 3600 * 1000
+INDEX_FILE = "_integrity.db"
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS coverage (
+    symbol     TEXT PRIMARY KEY,
+    first_ts   INTEGER NOT NULL,
+    last_ts    INTEGER NOT NULL,
+    count      INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS gaps (
+    symbol    TEXT NOT NULL,
+    start_ts  INTEGER NOT NULL,
+    end_ts    INTEGER NOT NULL,
+    attempts  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (symbol, start_ts)
+);
+"""
+
+# ==== PHÁT HIỆN GAP (vector hoá) ====
+def find_gaps(ts, prev_ts=None):
+    # ts tăng dần; trả về list (start, end) các nến bị thiếu (bao gồm hai đầu),
+    # kể cả giữa prev_ts (nến cuối trước đó) và ts[0]
+    ts = np.asarray(ts, dtype=np.int64)
+    if prev_ts is not None:
+        ts = np.r_[np.int64(prev_ts), ts]
+    if len(ts) < 2:
+        return []
+    step = np.diff(ts)
+    idx = np.flatnonzero(step > BAR_MS)
+    return [(int(ts[i]) + BAR_MS, int(ts[i + 1]) - BAR_MS) for i in idx]
+
+def check_order(ts):
+    # Lỗi không lấp được bằng cách tải thêm: nến không tăng dần / trùng / lệch giờ
+    ts = np.asarray(ts, dtype=np.int64)
+    issues = []
+    if len(ts) > 1 and np.any(np.diff(ts) <= 0):
+        issues.append("không tăng dần hoặc trùng nến")
+    if np.any(ts % BAR_MS):
+        issues.append("ts không tròn giờ")
+    return issues
+
+def carry_attempts(found, old):
+    # Số lần thử của gap mới = lớn nhất trong các gap cũ giao với nó (lấp một phần
+    # làm đổi điểm đầu gap, không được đếm lại từ 0)
+    out = []
+    for start, end in found:
+        n = max((a for s, e, a in old if s <= end and e >= start), default=0)
+        out.append((start, end, n))
+    return out
+
+def merge_bars(existing, new):
+    # Ghép nến tải lại vào dữ liệu sẵn có: sắp theo ts, bỏ trùng (giữ nến sẵn có)
+    merged = np.concatenate([np.asarray(existing, dtype=bar_store.BAR_DTYPE),
+                             np.asarray(new, dtype=bar_store.BAR_DTYPE)])
+    order = np.argsort(merged["ts"], kind="stable")
+    merged = merged[order]
+    keep = np.ones(len(merged), dtype=bool)
+    keep[1:] = merged["ts"][1:] != merged["ts"][:-1]
+    return merged[keep]
+
+# ==== CHỈ MỤC (SQLite WAL, dùng chung giữa các shard u4) ====
+class IntegrityIndex:
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(folder, INDEX_FILE), timeout=30,
+                                    check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    # ==== GHI NHẬN KHI GHI NẾN ====
+    def record_write(self, symbol, bars):
+        # Cả file vừa được ghi lại: tính lại vùng phủ và gap; giữ số lần thử của gap cũ
+        ts = np.asarray(bars["ts"], dtype=np.int64)
+        if len(ts) == 0:
+            self.remove(symbol)
+            return []
+        found = find_gaps(ts)
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                old = self.conn.execute(
+                    "SELECT start_ts, end_ts, attempts FROM gaps WHERE symbol = ?", (symbol,)).fetchall()
+                self.conn.execute("DELETE FROM gaps WHERE symbol = ?", (symbol,))
+                self.conn.executemany(
+                    "INSERT INTO gaps VALUES (?, ?, ?, ?)",
+                    [(symbol, s, e, n) for s, e, n in carry_attempts(found, old)],
+                )
+                self._set_coverage(symbol, int(ts[0]), int(ts[-1]), len(ts))
+        return found
+
+    def record_append(self, symbol, bars, prev_ts, count):
+        # Chỉ xét các nến vừa append (và khoảng giữa nến cuối cũ với nến mới đầu tiên)
+        if len(bars) == 0:
+            return []
+        with self.lock:
+            row = self.conn.execute("SELECT first_ts FROM coverage WHERE symbol = ?", (symbol,)).fetchone()
+        if row is None or prev_ts is None:
+            return self.rebuild_symbol(symbol)
+        found = find_gaps(bars["ts"], prev_ts)
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT OR IGNORE INTO gaps VALUES (?, ?, ?, 0)",
+                                      [(symbol, s, e) for s, e in found])
+                self._set_coverage(symbol, row[0], int(bars["ts"][-1]), count)
+        return found
+
+    def record_trim(self, symbol, first_ts, last_ts, count):
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.execute("DELETE FROM gaps WHERE symbol = ? AND end_ts < ?", (symbol, first_ts))
+                self._set_coverage(symbol, first_ts, last_ts, count)
+
+    def _set_coverage(self, symbol, first_ts, last_ts, count):
+        self.conn.execute("INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)",
+                          (symbol, first_ts, last_ts, count, time.time()))
+
+    def remove(self, symbol):
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.execute("DELETE FROM gaps WHERE symbol = ?", (symbol,))
+                self.conn.execute("DELETE FROM coverage WHERE symbol = ?", (symbol,))
+
+    def rebuild_symbol(self, symbol):
+        return self.record_write(symbol, bar_store.read(self.folder, symbol))
+
+    # ==== TRUY VẤN ====
+    def gaps(self, symbols=None, max_attempts=MAX_ATTEMPTS):
+        # dict symbol -> [(start, end)] các gap còn đáng thử lấp
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT symbol, start_ts, end_ts FROM gaps WHERE attempts < ? ORDER BY symbol, start_ts",
+                (max_attempts,),
+            ).fetchall()
+        keep = set(symbols) if symbols is not None else None
+        out = {}
+        for symbol, start, end in rows:
+            if keep is None or symbol in keep:
+                out.setdefault(symbol, []).append((start, end))
+        return out
+
+    def mark_attempts(self, symbol, ranges):
+        # ranges: các khoảng (start, end) vừa thử lấp; gap nào còn giao với chúng bị tính thêm một lần
+        if not ranges:
+            return
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                hit = set()
+                for start, end in ranges:
+                    hit.update(r[0] for r in self.conn.execute(
+                        "SELECT start_ts FROM gaps WHERE symbol = ? AND start_ts <= ? AND end_ts >= ?",
+                        (symbol, end, start)).fetchall())
+                self.conn.executemany("UPDATE gaps SET attempts = attempts + 1 WHERE symbol = ? AND start_ts = ?",
+                                      [(symbol, s) for s in hit])
+
+    def summary(self):
+        with self.lock:
+            n_sym = self.conn.execute("SELECT COUNT(*) FROM coverage").fetchone()[0]
+            n_gap, missing = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM((end_ts - start_ts) / ? + 1), 0) FROM gaps", (BAR_MS,)
+            ).fetchone()
+            n_dead = self.conn.execute("SELECT COUNT(*) FROM gaps WHERE attempts >= ?", (MAX_ATTEMPTS,)).fetchone()[0]
+        return {"symbols": n_sym, "gaps": n_gap, "missing_bars": missing, "unfillable": n_dead}
+
+    # ==== QUÉT TOÀN BỘ KHO ====
+    def verify(self, rebuild=False):
+        # Đọc cột ts (memmap) của mọi file. Mặc định chỉ đọc, không ghi chỉ mục; rebuild=True
+        # thì dựng lại chỉ mục từ các file. Trả về dict: issues (symbol -> lỗi thứ tự),
+        # gaps (symbol -> gap tìm thấy trong file), drift (symbol có chỉ mục khác file)
+        issues, found = {}, {}
+        symbols = bar_store.list_symbols(self.folder)
+        for symbol in symbols:
+            ts = bar_store.read(self.folder, symbol)["ts"]
+            problems = check_order(ts)
+            if problems:
+                issues[symbol] = problems
+                continue
+            found[symbol] = find_gaps(ts)
+            if rebuild:
+                self.record_write(symbol, {"ts": ts})
+        with self.lock:
+            known = {r[0] for r in self.conn.execute("SELECT symbol FROM coverage").fetchall()}
+        orphan = known - set(symbols)
+        if rebuild:
+            for symbol in orphan:
+                self.remove(symbol)
+            drift = []
+        else:
+            stored = self.gaps(max_attempts=1 << 62)
+            drift = sorted(orphan | {sym for sym, g in found.items()
+                                     if sym not in known or stored.get(sym, []) != g})
+        return {"issues": issues, "gaps": found, "drift": drift}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+_indexes = {}
+
+def get_index(folder):
+    # Một chỉ mục cho mỗi thư mục trong process (u4, bar_stream dùng chung)
+    if folder not in _indexes:
+        _indexes[folder] = IntegrityIndex(folder)
+    return _indexes[folder]
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    args = [a for a in sys.argv[2:] if not a.startswith("--")]
+    folder = args[0] if args else "/data/Data1200bar"
+    if cmd == "verify":
+        t0 = time.perf_counter()
+        index = get_index(folder)
+        report = index.verify(rebuild="--rebuild" in sys.argv)
+        issues = report["issues"]
+        n_gap = sum(len(g) for g in report["gaps"].values())
+        missing = sum((e - s) // BAR_MS + 1 for g in report["gaps"].values() for s, e in g)
+        print(f"[INTEGRITY] {len(report['gaps'])} symbol, {n_gap} gap ({missing} nến thiếu, "
+              f"{index.summary()['unfillable']} không lấp được), {len(issues)} file lỗi thứ tự, "
+              f"{time.perf_counter() - t0:.2f}s")
+        if report["drift"]:
+            print(f"  chỉ mục lệch với file ở {len(report['drift'])} symbol (chạy verify --rebuild): "
+                  f"{', '.join(report['drift'][:20])}")
+        for symbol, problems in sorted(issues.items()):
+            print(f"  {symbol}: {', '.join(problems)}")
+        sys.exit(1 if issues else 0)
+    elif cmd == "repair":
+        import asyncio
+        import u4
+        get_index(folder).verify(rebuild=True)
+        u4.data_folder = folder
+        asyncio.run(u4.repair_main())
+    else:
+        print("Cách dùng: python integrity.py verify [--rebuild] [folder] | repair [folder]")
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics dùng chung cho u4.py, t1.py và worker.py: histogram độ trễ theo giai
+# đoạn, số request / độ trễ REST theo endpoint, số byte đọc / ghi của kho nến,
+# độ trễ từ lúc có tín hiệu tới lúc lệnh được nhận. Xuất ra dạng text kiểu
+# Prometheus (GET /metrics khi worker chạy daemon) hoặc ghi thêm một dòng JSON
+# mỗi lần chạy vào METRICS_FILE.
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))    # 0: không mở HTTP endpoint
+METRICS_FILE = os.getenv("METRICS_FILE")             # None: không ghi JSON lines
+PREFIX = "bybit_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+HELP = {
+    "stage_seconds": ("histogram", "Thời gian mỗi giai đoạn"),
+    "rest_seconds": ("histogram", "Độ trễ request REST theo endpoint"),
+    "rest_requests_total": ("counter", "Số request REST theo endpoint và kết quả"),
+    "bytes_read_total": ("counter", "Số byte đọc từ kho nến"),
+    "bytes_written_total": ("counter", "Số byte ghi vào kho nến"),
+    "signal_to_order_seconds": ("histogram", "Từ lúc có tín hiệu tới lúc lệnh vào được nhận"),
+}
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "buckets": dict(zip(map(str, self.buckets), self.counts))}
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    # ==== XUẤT ====
+    def snapshot(self):
+        with self.lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self.counters.items()]
+            hists = [{"name": n, "labels": dict(l), **h.snapshot()} for (n, l), h in self.histograms.items()]
+        return {"counters": sorted(counters, key=_sort_key), "histograms": sorted(hists, key=_sort_key)}
+
+    def render(self):
+        # Định dạng text exposition của Prometheus (bucket cộng dồn, có +Inf)
+        with self.lock:
+            counters = sorted(self.counters.items())
+            hists = sorted((k, (h.buckets, list(h.counts), h.sum, h.count)) for k, h in self.histograms.items())
+        lines, seen = [], set()
+        for (name, labels), value in counters:
+            _header(lines, seen, name)
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+        for (name, labels), (buckets, counts, total, n) in hists:
+            _header(lines, seen, name)
+            acc = 0
+            for bound, c in zip(buckets, counts):
+                acc += c
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', bound),))} {acc}")
+            lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {n}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {n}")
+        return "\n".join(lines) + "\n"
+
+def _sort_key(item):
+    return item["name"], sorted(item["labels"].items())
+
+def _header(lines, seen, name):
+    if name in seen:
+        return
+    seen.add(name)
+    kind, text = HELP.get(name, ("untyped", name))
+    lines.append(f"# HELP {PREFIX}{name} {text}")
+    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return "{" + inner + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+REGISTRY = Registry()
+
+# ==== GHI NHẬN ====
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+@contextlib.contextmanager
+def stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe("stage_seconds", time.perf_counter() - t0, stage=name)
+
+def rest_call(endpoint, seconds, outcome="ok"):
+    REGISTRY.inc("rest_requests_total", endpoint=endpoint, outcome=outcome)
+    REGISTRY.observe("rest_seconds", seconds, endpoint=endpoint)
+
+def bytes_read(n, kind="bars"):
+    REGISTRY.inc("bytes_read_total", int(n), kind=kind)
+
+def bytes_written(n, kind="bars"):
+    REGISTRY.inc("bytes_written_total", int(n), kind=kind)
+
+# ==== BỌC SESSION pybit: ĐẾM / ĐO MỌI LỜI GỌI REST ====
+class InstrumentedSession:
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, name):
+        attr = getattr(self._session, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            t0 = time.perf_counter()
+            outcome = "ok"
+            try:
+                resp = attr(*args, **kwargs)
+                if isinstance(resp, dict) and resp.get("retCode") not in (0, None):
+                    outcome = f"retCode_{resp.get('retCode')}"
+                return resp
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                rest_call(name, time.perf_counter() - t0, outcome)
+        return call
+
+# ==== XUẤT RA NGOÀI ====
+def dump(path=None, **extra):
+    # Ghi thêm một dòng JSON (snapshot toàn bộ metrics); không làm gì nếu chưa cấu hình file
+    path = path or METRICS_FILE
+    if not path:
+        return None
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    line = {"time": round(time.time(), 3), "pid": os.getpid(), **extra, **REGISTRY.snapshot()}
+    with open(path, "a") as f:
+        f.write(json.dumps(line) + "\n")
+    return path
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, ctype = json.dumps(REGISTRY.snapshot()).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, ctype = REGISTRY.render().encode(), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(port=None, host="0.0.0.0"):
+    # Mở HTTP endpoint trên luồng nền (daemon), trả về server hoặc None nếu port = 0
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"[METRICS] Đang phục vụ tại http://{host}:{port}/metrics")
+    return server
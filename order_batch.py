@@ -0,0 +1,163 @@
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from order_exec import poll_with_backoff
+
+# Đặt lệnh theo lô cho t1.py qua endpoint batch của Bybit (order/create-batch):
+# 1) mọi lệnh market vào lệnh của lượt chạy, gom tối đa BATCH_LIMIT lệnh / request;
+#    lệnh nào được sàn nhận thì báo ngay cho t1.py (on_entry) để ghi lại trước
+#    khi làm gì khác, lỗi ở bước sau không làm mất dấu lệnh đang sống;
+# 2) hỏi giá khớp từng lệnh theo symbol + orderId (song song), mỗi vòng hỏi
+#    lệnh nào đã khớp thì gửi TP / SL của nó luôn, không chờ các symbol khác;
+# 3) chân TP / SL (conditional, reduceOnly) gom theo lô trong từng vòng.
+# Mỗi chân được gắn orderLinkId riêng để ánh xạ kết quả; chân bị từ chối chỉ
+# làm hỏng chân đó (lệnh vào lỗi thì không đặt TP/SL, chân TP/SL lỗi được
+# thử lại riêng một lần bằng place_order). Hết thời gian chờ khớp thì đặt
+# TP / SL theo giá tín hiệu như cách đặt từng lệnh.
+
+BATCH_LIMIT = 10    # số lệnh tối đa mỗi request batch cho category linear
+DEAD_STATUSES = {"Rejected", "Cancelled", "Deactivated"}
+
+def new_link_id(leg):
+    return f"t1-{leg}-{uuid.uuid4().hex[:24]}"
+
+def _chunks(items, n):
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+def _extra(recv_window):
+    return {"recv_window": recv_window} if recv_window else {}
+
+# ==== GỬI THEO LÔ, ÁNH XẠ KẾT QUẢ TỪNG CHÂN ====
+def submit(session, requests, category="linear", limiter=None, recv_window=None):
+    # requests: list dict tham số lệnh (có orderLinkId); trả về dict orderLinkId -> (orderId hoặc None, lỗi)
+    out = {}
+    for chunk in _chunks(requests, BATCH_LIMIT):
+        if limiter:
+            limiter.acquire()
+        try:
+            resp = session.place_batch_order(category=category, request=chunk, **_extra(recv_window))
+        except Exception as e:
+            for req in chunk:
+                out[req["orderLinkId"]] = (None, str(e))
+            continue
+        if resp.get("retCode") != 0:
+            for req in chunk:
+                out[req["orderLinkId"]] = (None, resp.get("retMsg") or f"retCode {resp.get('retCode')}")
+            continue
+        results = resp.get("result", {}).get("list", [])
+        infos = resp.get("retExtInfo", {}).get("list", [])
+        by_link = {r.get("orderLinkId"): i for i, r in enumerate(results)}
+        for pos, req in enumerate(chunk):
+            i = by_link.get(req["orderLinkId"], pos)
+            res = results[i] if i < len(results) else {}
+            info = infos[i] if i < len(infos) else {}
+            if info.get("code", 0) == 0 and res.get("orderId"):
+                out[req["orderLinkId"]] = (res["orderId"], None)
+            else:
+                out[req["orderLinkId"]] = (None, info.get("msg") or "không có orderId")
+    return out
+
+# ==== GIÁ KHỚP CỦA MỘT LỆNH MARKET ====
+def fetch_fill(session, symbol, order_id, category="linear", limiter=None):
+    # Trả về (orderStatus, avgPrice hoặc None); hỏi đúng lệnh, không quét trang lịch sử
+    if limiter:
+        limiter.acquire()
+    resp = session.get_order_history(category=category, symbol=symbol, orderId=order_id)
+    orders = resp.get("result", {}).get("list", [])
+    if not orders:
+        return None, None
+    price = float(orders[0].get("avgPrice") or 0)
+    return orders[0].get("orderStatus"), (price if price > 0 else None)
+
+# ==== TP / SL CHO CÁC LỆNH VỪA KHỚP ====
+def place_legs(session, filled, tp_sl_legs, report, category="linear", limiter=None, recv_window=None):
+    # filled: list (entry, giá vào thực tế); ghi orderId / lỗi của từng chân vào report
+    legs, t_fill = [], time.perf_counter()
+    for e, real_entry in filled:
+        report[e["symbol"]]["fill"] = real_entry
+        report[e["symbol"]]["t_fill"] = t_fill
+        for leg, req in zip(("tp", "sl"), tp_sl_legs(e, real_entry)):
+            legs.append((e["symbol"], leg, {**req, "orderLinkId": new_link_id(leg)}))
+    placed = submit(session, [req for _, _, req in legs], category, limiter, recv_window)
+
+    for symbol, leg, req in legs:
+        order_id, err = placed[req["orderLinkId"]]
+        if order_id is None:
+            # Thử lại riêng chân này một lần (vị thế đã mở, không được để thiếu TP/SL)
+            try:
+                if limiter:
+                    limiter.acquire()
+                resp = session.place_order(category=category, **req, **_extra(recv_window))
+                order_id = resp.get("result", {}).get("orderId") or None
+                if order_id is None:
+                    err = f"{err}; thử lại: {resp.get('retMsg') or resp.get('retCode')}"
+            except Exception as e:
+                err = f"{err}; thử lại: {e}"
+        report[symbol][leg] = order_id
+        if order_id is None:
+            report[symbol]["errors"].append(f"{leg.upper()}: {err}")
+    t_legs = time.perf_counter()
+    for e, _ in filled:
+        report[e["symbol"]]["t_legs"] = t_legs
+
+# ==== VÀO LỆNH + TP/SL CHO NHIỀU SYMBOL ====
+def place_entries_with_tp_sl(session, entries, tp_sl_legs, category="linear", limiter=None, fill_timeout=10.0,
+                             on_entry=None, recv_window=None, max_workers=8):
+    # entries: list dict {"symbol", "side", "qty", "entry_price"}
+    # tp_sl_legs(entry, real_entry) -> (request TP, request SL), chưa có orderLinkId
+    # on_entry(entry, orderId): gọi ngay khi sàn nhận lệnh vào (trước khi chờ khớp)
+    # Trả về dict symbol -> {"entry", "tp", "sl": orderId hoặc None, "fill": giá, "errors": [..],
+    #                        "t_ack", "t_fill", "t_legs": perf_counter lúc sàn nhận lệnh / thấy khớp / đặt xong TP SL}
+    report = {e["symbol"]: {"entry": None, "tp": None, "sl": None, "fill": None, "errors": [],
+                            "t_ack": None, "t_fill": None, "t_legs": None} for e in entries}
+    pending = {}   # orderId -> entry đang chờ khớp
+    for chunk in _chunks(entries, BATCH_LIMIT):
+        reqs = [{"symbol": e["symbol"], "side": e["side"], "orderType": "Market",
+                 "qty": f"{e['qty']}", "reduceOnly": False, "orderLinkId": new_link_id("in")} for e in chunk]
+        placed = submit(session, reqs, category, limiter, recv_window)
+        t_ack = time.perf_counter()
+        for e, req in zip(chunk, reqs):
+            order_id, err = placed[req["orderLinkId"]]
+            report[e["symbol"]]["entry"] = order_id
+            report[e["symbol"]]["t_ack"] = t_ack
+            if not order_id:
+                report[e["symbol"]]["errors"].append(f"vào lệnh: {err}")
+                continue
+            pending[order_id] = e
+            if on_entry:
+                try:
+                    on_entry(e, order_id)
+                except Exception as ex:
+                    logging.warning(f"[BATCH] Lỗi ghi nhận lệnh vào {e['symbol']} {order_id}: {ex}")
+    if not pending:
+        return report
+
+    def lookup(item):
+        order_id, e = item
+        try:
+            return order_id, fetch_fill(session, e["symbol"], order_id, category, limiter)
+        except Exception as ex:
+            logging.warning(f"[BATCH] Không lấy được giá khớp {e['symbol']} {order_id}: {ex}")
+            return order_id, (None, None)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as pool:
+        def check():
+            filled = []
+            for order_id, (status, price) in pool.map(lookup, list(pending.items())):
+                if price:
+                    filled.append((pending.pop(order_id), price))
+                elif status in DEAD_STATUSES:
+                    e = pending.pop(order_id)
+                    report[e["symbol"]]["errors"].append(f"vào lệnh: {status}")
+            if filled:
+                place_legs(session, filled, tp_sl_legs, report, category, limiter, recv_window)
+            return True if not pending else None
+
+        poll_with_backoff(check, timeout=fill_timeout)
+    if pending:
+        # Hết thời gian chờ: vị thế có thể đã mở, đặt TP/SL theo giá tín hiệu
+        place_legs(session, [(e, e["entry_price"]) for e in pending.values()], tp_sl_legs, report,
+                   category, limiter, recv_window)
+    return report
@@ -0,0 +1,62 @@
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Hạ tầng thực thi lệnh song song cho t1.py: giới hạn tốc độ gọi REST dùng
+# chung giữa các luồng, chờ khớp lệnh với backoff tăng dần, và chạy danh
+# sách symbol có tín hiệu trên thread pool.
+
+# ==== GIỚI HẠN TỐC ĐỘ (token bucket, an toàn đa luồng) ====
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# ==== CHỜ KẾT QUẢ VỚI BACKOFF ====
+def poll_with_backoff(check, timeout=10.0, first_delay=0.2, factor=1.7, max_delay=2.0):
+    # Gọi check() tới khi trả về giá trị khác None hoặc hết timeout
+    deadline = time.monotonic() + timeout
+    delay = first_delay
+    while True:
+        result = check()
+        if result is not None:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(remaining, delay * random.uniform(0.8, 1.2)))
+        delay = min(max_delay, delay * factor)
+
+# ==== CHẠY SONG SONG ====
+def run_concurrent(jobs, fn, max_workers):
+    # jobs: list các tuple tham số; trả về list (job, kết quả hoặc exception)
+    results = []
+    if not jobs:
+        return results
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fn, *job): job for job in jobs}
+        for fut in as_completed(futures):
+            job = futures[fut]
+            try:
+                results.append((job, fut.result()))
+            except Exception as e:
+                logging.warning(f"[EXEC] Lỗi thực thi {job[0]}: {e}")
+                results.append((job, e))
+    return results
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Lưu trạng thái lệnh trong SQLite (WAL): mỗi lần thêm / đổi trạng thái lệnh
+# chỉ ghi đúng các dòng đó trong một transaction, không ghi lại cả file JSON.
+# Crash giữa chừng không làm hỏng dữ liệu; có index theo trạng thái và thời gian.
+
+CLOSED_STATUSES = ("Filled", "Cancelled", "Rejected", "Lost")   # "Lost": không tra được, đã bỏ theo dõi
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id   TEXT PRIMARY KEY,
+    symbol     TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_status_symbol ON orders(status, symbol);
+CREATE INDEX IF NOT EXISTS idx_orders_updated ON orders(updated_at);
+"""
+
+class OrderStore:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def add(self, symbol, order_id, status="New"):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO orders VALUES (?, ?, ?, ?, ?)",
+                (order_id, symbol, status, now, now),
+            )
+
+    def set_statuses(self, statuses):
+        # statuses: dict order_id -> status, ghi trong một transaction
+        if not statuses:
+            return
+        now = time.time()
+        with self.lock:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany(
+                    "UPDATE orders SET status = ?, updated_at = ? WHERE order_id = ?",
+                    [(status, now, order_id) for order_id, status in statuses.items()],
+                )
+
+    def open_orders(self):
+        # dict symbol -> [order_id] theo thứ tự tạo, chỉ các lệnh chưa đóng
+        marks = ",".join("?" * len(CLOSED_STATUSES))
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT symbol, order_id FROM orders WHERE status NOT IN ({marks}) ORDER BY created_at",
+                CLOSED_STATUSES,
+            ).fetchall()
+        out = {}
+        for symbol, order_id in rows:
+            out.setdefault(symbol, []).append(order_id)
+        return out
+
+    def count_open(self, symbol):
+        marks = ",".join("?" * len(CLOSED_STATUSES))
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT COUNT(*) FROM orders WHERE symbol = ? AND status NOT IN ({marks})",
+                (symbol, *CLOSED_STATUSES),
+            ).fetchone()[0]
+
+    def purge_closed(self, older_than):
+        # Dọn lệnh đã đóng quá older_than giây
+        marks = ",".join("?" * len(CLOSED_STATUSES))
+        with self.lock:
+            cur = self.conn.execute(
+                f"DELETE FROM orders WHERE status IN ({marks}) AND updated_at < ?",
+                (*CLOSED_STATUSES, time.time() - older_than),
+            )
+        return cur.rowcount
+
+    def import_json(self, path):
+        # Chuyển active_orders.json cũ vào DB một lần, đổi tên file để không nhập lại
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r") as f:
+            data = json.load(f)
+        n = 0
+        for symbol, ids in data.items():
+            for order_id in ids:
+                self.add(symbol, order_id)
+                n += 1
+        os.replace(path, path + ".migrated")
+        return n
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,70 @@
+import logging
+
+# Đối soát trạng thái lệnh theo lô: kéo toàn bộ lệnh đang mở + lịch sử lệnh
+# của cả category (có phân trang) một lần mỗi lượt chạy, dựng index
+# orderId -> orderStatus, rồi cập nhật active_orders từ index đó thay vì
+# gọi get_order_history cho từng orderId.
+
+CLOSED_STATUSES = {"Filled", "Cancelled", "Rejected"}
+PAGE_LIMIT = 50     # giới hạn tối đa của Bybit cho order/realtime và order/history
+MAX_PAGES = 40      # chặn trên số trang lịch sử mỗi lượt
+
+def iter_pages(call, max_pages=MAX_PAGES, **params):
+    cursor = None
+    for _ in range(max_pages):
+        if cursor:
+            params["cursor"] = cursor
+        resp = call(**params)
+        result = resp.get("result", {})
+        for item in result.get("list", []):
+            yield item
+        cursor = result.get("nextPageCursor")
+        if not cursor:
+            break
+
+def build_status_index(session, category="linear", settle_coin="USDT"):
+    index = {}
+    for o in iter_pages(session.get_order_history, category=category, limit=PAGE_LIMIT):
+        index.setdefault(o["orderId"], o["orderStatus"])
+    # Lệnh đang mở ghi đè lịch sử (trạng thái mới nhất)
+    for o in iter_pages(session.get_open_orders, category=category, settleCoin=settle_coin, limit=PAGE_LIMIT):
+        index[o["orderId"]] = o["orderStatus"]
+    return index
+
+def lookup_status(session, symbol, order_id, category="linear"):
+    info = session.get_order_history(category=category, symbol=symbol, orderId=order_id)
+    orders = info.get("result", {}).get("list", [])
+    return orders[0]["orderStatus"] if orders else "Unknown"
+
+def reconcile(session, active_orders, category="linear", statuses=None):
+    # Trả về số lệnh còn mở theo symbol; chỉ orderId không có trong index mới bị tra riêng.
+    # statuses (dict, tuỳ chọn) nhận orderId -> trạng thái của các lệnh vừa đóng / không tra được.
+    if not any(active_orders.values()):
+        return {symbol: 0 for symbol in active_orders}
+    try:
+        index = build_status_index(session, category)
+    except Exception as e:
+        logging.warning(f"[SYNC] Không lấy được danh sách lệnh theo lô, tra từng lệnh: {e}")
+        index = {}
+    n_lookup = 0
+    for symbol, ids in active_orders.items():
+        open_ids = []
+        for order_id in ids:
+            status = index.get(order_id)
+            if status is None:
+                try:
+                    status = lookup_status(session, symbol, order_id, category)
+                    n_lookup += 1
+                except Exception as e:
+                    logging.warning(f"Không kiểm tra được trạng thái order {order_id} của {symbol}: {e}")
+                    if statuses is not None:
+                        statuses[order_id] = "Lost"   # bỏ theo dõi như trước, nhưng vẫn ghi lại
+                    continue
+            if status in CLOSED_STATUSES:
+                if statuses is not None:
+                    statuses[order_id] = status
+                continue
+            open_ids.append(order_id)
+        active_orders[symbol] = open_ids
+    logging.info(f"[SYNC] index {len(index)} lệnh, tra riêng {n_lookup} lệnh")
+    return {symbol: len(ids) for symbol, ids in active_orders.items()}
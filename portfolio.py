@@ -0,0 +1,138 @@
+import time
+import threading
+from order_sync import iter_pages
+
+# Bảng vị thế / mức ký quỹ trong bộ nhớ cho t1.py: kéo toàn bộ position linear
+# một lần mỗi lượt chạy (có phân trang) hoặc giữ cập nhật từ private stream
+# "position" của Bybit. Các kiểm tra MAX_OPEN theo symbol và tổng ký quỹ trả
+# lời O(1) từ bảng này, không gọi get_positions cho từng symbol.
+# Stream chỉ đẩy tin khi vị thế đổi: quá STREAM_TIMEOUT không có tin (hoặc
+# socket đã rớt) thì bảng coi như cũ và t1.py nạp lại qua REST.
+
+PAGE_LIMIT = 200       # giới hạn tối đa của Bybit cho position/list
+STREAM_TIMEOUT = 300   # giây không có tin stream / snapshot thì nạp lại qua REST
+
+def _float(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+class Portfolio:
+    def __init__(self, leverage=1):
+        self.leverage = leverage          # dùng khi position không có positionIM
+        self.positions = {}               # (symbol, positionIdx) -> {"side", "size", "margin", "value"}
+        self.by_symbol = {}               # symbol -> ký quỹ đang dùng
+        self.total_margin = 0.0
+        self.updated = 0.0
+        self.live = False                 # True khi đang nhận private stream
+        self.ws = None
+        self.lock = threading.Lock()
+
+    # ==== NẠP TỪ REST (1 lượt phân trang cho cả category) ====
+    def refresh(self, session, category="linear", settle_coin="USDT"):
+        items = list(iter_pages(session.get_positions, category=category,
+                                settleCoin=settle_coin, limit=PAGE_LIMIT))
+        with self.lock:
+            self.positions, self.by_symbol, self.total_margin = {}, {}, 0.0
+            for p in items:
+                self._apply(p)
+            self.updated = time.time()
+        return len(self.positions)
+
+    # ==== CẬP NHẬT TỪ PRIVATE STREAM ====
+    def handle(self, msg):
+        if msg.get("topic", "").split(".")[0] != "position":
+            return
+        with self.lock:
+            for p in msg.get("data", []):
+                if p.get("category", "linear") == "linear":
+                    self._apply(p)
+            self.updated = time.time()
+
+    def subscribe(self, ws):
+        ws.position_stream(callback=self.handle)
+        self.ws = ws
+        self.live = True
+        return ws
+
+    def is_live(self, timeout=STREAM_TIMEOUT):
+        # True nếu stream còn kết nối và bảng được cập nhật (tin stream hoặc REST) trong timeout giây
+        if not self.live:
+            return False
+        connected = getattr(self.ws, "is_connected", None)
+        if connected is not None and not connected():
+            self.live = False
+            return False
+        return time.time() - self.updated <= timeout
+
+    def _apply(self, p):
+        key = (p["symbol"], int(p.get("positionIdx", 0) or 0))
+        old = self.positions.pop(key, None)
+        if old:
+            self._add_margin(key[0], -old["margin"])
+        size = _float(p.get("size"))
+        if size <= 0 or not p.get("side"):
+            return
+        value = _float(p.get("positionValue"))
+        margin = _float(p.get("positionIM")) or value / (_float(p.get("leverage")) or self.leverage)
+        self.positions[key] = {"side": p["side"], "size": size, "margin": margin, "value": value}
+        self._add_margin(key[0], margin)
+
+    def _add_margin(self, symbol, margin):
+        total = self.by_symbol.get(symbol, 0.0) + margin
+        if total > 1e-9:
+            self.by_symbol[symbol] = total
+        else:
+            self.by_symbol.pop(symbol, None)
+        self.total_margin = max(0.0, self.total_margin + margin)
+
+    # ==== GHI NHẬN LỆNH VỪA VÀO (trước khi refresh / stream kịp báo) ====
+    def reserve(self, symbol, side, qty, margin):
+        with self.lock:
+            key = (symbol, 0)
+            pos = self.positions.get(key)
+            if pos is None:
+                self.positions[key] = {"side": side, "size": qty, "margin": margin, "value": margin * self.leverage}
+            elif pos["side"] == side:
+                pos["size"] += qty
+                pos["margin"] += margin
+            else:
+                # Lệnh ngược chiều vị thế một chiều: chỉ giảm size, không cộng ký quỹ
+                pos["size"] = max(0.0, pos["size"] - qty)
+                return
+            self._add_margin(symbol, margin)
+
+    # ==== TRUY VẤN O(1) ====
+    def size(self, symbol, direction):
+        # Giống check_position cũ: size dương nếu cùng hướng long, âm nếu short
+        side = "Buy" if direction == "long" else "Sell"
+        with self.lock:
+            total = sum(self.positions.get((symbol, idx), {}).get("size", 0.0)
+                        for idx in (0, 1, 2)
+                        if self.positions.get((symbol, idx), {}).get("side") == side)
+        return total if direction == "long" else -total
+
+    def entries(self, symbol, margin_per_entry):
+        # Số lần vào lệnh ước lượng từ ký quỹ thực tế của symbol
+        if margin_per_entry <= 0:
+            return 0
+        return int(round(self.by_symbol.get(symbol, 0.0) / margin_per_entry))
+
+    def can_open(self, symbol, margin, max_entries, max_total_margin=0, pending=0.0):
+        # Trả về (được vào lệnh?, lý do nếu không); pending: ký quỹ của các lệnh đã duyệt trong lượt này
+        if self.entries(symbol, margin) >= max_entries:
+            return False, f"ĐÃ ĐỦ {max_entries} LỆNH đang mở"
+        used = self.total_margin + pending
+        if max_total_margin and used + margin > max_total_margin:
+            return False, f"tổng ký quỹ {used:.0f} + {margin} vượt {max_total_margin}"
+        return True, None
+
+    def summary(self):
+        with self.lock:
+            return {"positions": len(self.positions), "symbols": len(self.by_symbol),
+                    "total_margin": round(self.total_margin, 2)}
+
+def default_ws_factory(api_key, api_secret):
+    from pybit.unified_trading import WebSocket
+    return WebSocket(testnet=False, channel_type="private", api_key=api_key, api_secret=api_secret)
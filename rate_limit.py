@@ -0,0 +1,185 @@
+import time
+import json
+import random
+import asyncio
+import metrics
+
+try:
+    import orjson   # tuỳ chọn: giải mã JSON nhanh hơn nhiều cho response kline
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Bộ giới hạn tốc độ tự điều chỉnh cho các request REST bất đồng bộ của u4.py:
+# token bucket (req/s) + giới hạn số request đồng thời. Tăng dần (cộng) khi
+# mọi thứ ổn, giảm một nửa (nhân) khi Bybit báo quá tải qua HTTP 403/429,
+# retCode 10006/10018 hoặc header X-Bapi-Limit-Status sắp cạn. Request lỗi /
+# bị chặn được thử lại với backoff ngẫu nhiên (full jitter).
+# Mỗi đợt quá tải chỉ giảm một lần (các request đã gửi trước lần giảm bị chặn
+# cùng lúc không giảm tiếp), và mức đồng thời vừa bị chặn thành trần: chỉ tăng
+# tới trần - 1, sau probe_after request không bị chặn mới thử nâng trần.
+
+THROTTLE_STATUS = {403, 429}
+THROTTLE_RETCODES = {10006, 10018}
+
+class ThrottledError(Exception):
+    pass
+
+class AdaptiveLimiter:
+    def __init__(self, rate=100.0, concurrency=30, min_concurrency=2, max_concurrency=64,
+                 min_rate=5.0, max_rate=120.0, max_retries=4, base_delay=0.5, max_delay=8.0,
+                 probe_after=1000):
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.ok_streak = 0
+        self.pause_until = 0.0
+        self.ceiling = max_concurrency + 1   # mức đồng thời đã bị chặn gần nhất
+        self.quiet = 0                       # số request thành công từ lần bị chặn gần nhất
+        self.probe_after = probe_after
+        self.epoch = 0                       # tăng mỗi lần giảm, để một đợt quá tải chỉ giảm một lần
+        self._cond = None
+        self._loop = None
+        self.reset_stats()
+
+    # ==== THỐNG KÊ ====
+    def reset_stats(self):
+        self.stats = {"requests": 0, "retries": 0, "throttles": 0, "errors": 0}
+        self.latencies = []
+
+    def summary(self):
+        lat = sorted(self.latencies)
+        def pct(p):
+            if not lat:
+                return 0.0
+            return lat[min(len(lat) - 1, int(round(p / 100.0 * (len(lat) - 1))))]
+        return {
+            **self.stats,
+            "p50_ms": round(pct(50) * 1000, 1),
+            "p99_ms": round(pct(99) * 1000, 1),
+            "rate": round(self.rate, 1),
+            "concurrency": self.concurrency,
+        }
+
+    # ==== CẤP / TRẢ SLOT ====
+    async def _acquire(self):
+        # limiter toàn cục của u4 sống qua nhiều asyncio.run (worker daemon, bench):
+        # Condition gắn với event loop đầu tiên dùng nó nên tạo lại cho mỗi loop mới
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+            self.in_flight = 0
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+        while True:
+            now = time.monotonic()
+            if now < self.pause_until:
+                await asyncio.sleep(self.pause_until - now)
+                continue
+            self.tokens = min(max(1.0, self.rate / 10), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def _release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    # ==== ĐIỀU CHỈNH ====
+    def _on_success(self, headers):
+        remaining, limit = _limit_headers(headers)
+        if limit and remaining is not None and remaining < 0.1 * limit:
+            # Sắp chạm giới hạn: giảm nhẹ tốc độ, không tăng đồng thời
+            self.rate = max(self.min_rate, self.rate * 0.9)
+            self.ok_streak = 0
+            return
+        self.ok_streak += 1
+        self.quiet += 1
+        if self.ok_streak >= self.concurrency:
+            self.ok_streak = 0
+            if self.concurrency + 1 >= self.ceiling:
+                if self.quiet < self.probe_after:
+                    return
+                self.ceiling += 1   # lâu rồi không bị chặn: thử lại mức cao hơn
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self.rate = min(self.max_rate, self.rate * 1.05)
+
+    def _on_throttle(self, headers, epoch=None):
+        self.stats["throttles"] += 1
+        self.ok_streak = 0
+        self.quiet = 0
+        if epoch is None or epoch == self.epoch:
+            self.epoch += 1
+            self.ceiling = self.concurrency
+            self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+            self.rate = max(self.min_rate, self.rate * 0.5)
+        reset_ms = _header_int(headers, "X-Bapi-Limit-Reset-Timestamp")
+        if reset_ms:
+            wait = min(self.max_delay, max(0.0, reset_ms / 1000.0 - time.time()))
+            self.pause_until = max(self.pause_until, time.monotonic() + wait)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    # ==== GỬI REQUEST ====
+    async def get_json(self, session, url, params):
+        endpoint = url.rsplit("/v5/", 1)[-1]
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+            await self._acquire()
+            epoch = self.epoch
+            self.stats["requests"] += 1
+            t0 = time.perf_counter()
+            outcome = "error"
+            try:
+                async with session.get(url, params=params) as resp:
+                    status = resp.status
+                    headers = resp.headers
+                    js = await resp.json(loads=json_loads, content_type=None) if status not in THROTTLE_STATUS else None
+                outcome = f"http_{status}" if status != 200 else "ok"
+            except Exception as e:
+                self.stats["errors"] += 1
+                last_error = e
+                continue
+            finally:
+                self.latencies.append(time.perf_counter() - t0)
+                metrics.rest_call(endpoint, self.latencies[-1], outcome)
+                await self._release()
+            if status in THROTTLE_STATUS or (js and js.get("retCode") in THROTTLE_RETCODES):
+                self._on_throttle(headers, epoch)
+                last_error = ThrottledError(f"HTTP {status}, retCode {js.get('retCode') if js else None}")
+                continue
+            if status >= 500:
+                self.stats["errors"] += 1
+                last_error = RuntimeError(f"HTTP {status}")
+                continue
+            self._on_success(headers)
+            return js
+        raise last_error
+
+def _header_int(headers, name):
+    try:
+        value = headers.get(name)
+        return int(float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _limit_headers(headers):
+    return _header_int(headers, "X-Bapi-Limit-Status"), _header_int(headers, "X-Bapi-Limit")
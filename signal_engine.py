@@ -0,0 +1,129 @@
+import sys
+import numpy as np
+
+# Tính RSI / Bollinger / EMA cho toàn bộ symbol cùng lúc trên ma trận 2 chiều
+# (symbol × bar). Các chuỗi ngắn hơn được căn phải và đệm NaN bên trái, nên
+# cột cuối cùng luôn là nến mới nhất của mọi symbol.
+
+# ==== GHÉP CHUỖI THÀNH MA TRẬN ====
+def stack_right_aligned(series):
+    n_bars = max((len(s) for s in series), default=0)
+    mat = np.full((len(series), n_bars), np.nan)
+    for i, s in enumerate(series):
+        if len(s):
+            mat[i, n_bars - len(s):] = s
+    return mat
+
+def bar_counts(closes):
+    return np.count_nonzero(~np.isnan(closes), axis=1)
+
+# ==== CHỈ BÁO (giống hệt ta với fillna=False) ====
+def _ewm(values, alpha, min_periods):
+    # ewm(adjust=False): y0 = x0, yt = (1-a)*y(t-1) + a*xt, bắt đầu từ bar hợp lệ đầu tiên
+    out = np.full(values.shape, np.nan)
+    prev = np.full(values.shape[0], np.nan)
+    seen = np.zeros(values.shape[0], dtype=np.int64)
+    for t in range(values.shape[1]):
+        x = values[:, t]
+        valid = ~np.isnan(x)
+        prev = np.where(np.isnan(prev), x, (1 - alpha) * prev + alpha * x)
+        seen += valid
+        out[:, t] = np.where(seen >= min_periods, prev, np.nan)
+    return out
+
+def ema(closes, window):
+    return _ewm(closes, 2.0 / (window + 1), window)
+
+def rsi_averages(closes, window):
+    diff = np.diff(closes, axis=1, prepend=np.nan)
+    # ta: diff đầu tiên là NaN nhưng được thay bằng 0 cho cả up lẫn down
+    first = ~np.isnan(closes) & np.isnan(diff)
+    diff[first] = 0.0
+    up = np.where(diff > 0, diff, np.where(np.isnan(diff), np.nan, 0.0))
+    down = np.where(diff < 0, -diff, np.where(np.isnan(diff), np.nan, 0.0))
+    return _ewm(up, 1.0 / window, window), _ewm(down, 1.0 / window, window)
+
+def rsi_from_averages(avg_up, avg_down):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = 100 - 100 / (1 + avg_up / avg_down)
+    return np.where(avg_down == 0, 100.0, out)
+
+def rsi(closes, window):
+    return rsi_from_averages(*rsi_averages(closes, window))
+
+def bollinger(closes, window, stddev, tail=None):
+    # Chỉ cần `tail` cột cuối thì chỉ lấy đủ dữ liệu cho các cửa sổ đó
+    if tail is not None:
+        closes = closes[:, -(tail + window - 1):]
+    n_out = closes.shape[1] - window + 1
+    mid = np.full((closes.shape[0], closes.shape[1]), np.nan)
+    std = np.full_like(mid, np.nan)
+    if n_out > 0:
+        win = np.lib.stride_tricks.sliding_window_view(closes, window, axis=1)
+        mid[:, window - 1:] = win.mean(axis=2)
+        std[:, window - 1:] = win.std(axis=2)
+    upper = mid + stddev * std
+    lower = mid - stddev * std
+    if tail is not None:
+        upper, lower = upper[:, -tail:], lower[:, -tail:]
+    return upper, lower
+
+# ==== ĐIỀU KIỆN & TÍN HIỆU ====
+def compute_conditions(closes, rsi_len, rsi_ob, rsi_os, bb_len, stddev, ema_len, tail=None):
+    r = rsi(closes, rsi_len)
+    e = ema(closes, ema_len)
+    upper, lower = bollinger(closes, bb_len, stddev, tail=tail)
+    if tail is not None:
+        closes, r, e = closes[:, -tail:], r[:, -tail:], e[:, -tail:]
+    return conditions_from_indicators(closes, r, e, upper, lower, rsi_ob, rsi_os)
+
+def conditions_from_indicators(closes, r, e, upper, lower, rsi_ob, rsi_os):
+    cond_long = (closes < lower) & (r < rsi_os) & (closes < e)
+    cond_short = (closes > upper) & (r > rsi_ob) & (closes > e)
+    return cond_long, cond_short
+
+def batch_signals(closes, rsi_len, rsi_ob, rsi_os, bb_len, stddev, ema_len, wait_bars):
+    if closes.size == 0:
+        return []
+    cond_long, cond_short = compute_conditions(
+        closes, rsi_len, rsi_ob, rsi_os, bb_len, stddev, ema_len, tail=wait_bars
+    )
+    can_long = cond_long[:, -1] & ~cond_long[:, :-1].any(axis=1)
+    can_short = cond_short[:, -1] & ~cond_short[:, :-1].any(axis=1)
+    enough = bar_counts(closes) >= ema_len + 1
+    out = []
+    for ok, lg, sh in zip(enough, can_long, can_short):
+        if not ok:
+            out.append(None)
+        elif lg:
+            out.append("long")
+        elif sh:
+            out.append("short")
+        else:
+            out.append(None)
+    return out
+
+# ==== KIỂM TRA KHỚP VỚI calc_signals ====
+def check_parity(data_folder=None):
+    import t1
+    import bar_store
+    if data_folder:
+        t1.DATA_FOLDER = data_folder
+    symbols, series, _, _, _ = t1.load_closes(bar_store.list_symbols(t1.DATA_FOLDER))
+    batch = batch_signals(
+        stack_right_aligned(series),
+        t1.RSI_LEN, t1.RSI_OB, t1.RSI_OS, t1.BB_LEN, t1.STDDEV, t1.EMA_LEN, t1.WAIT_BARS,
+    )
+    mismatch = []
+    for symbol, got in zip(symbols, batch):
+        df = bar_store.to_frame(bar_store.read(t1.DATA_FOLDER, symbol, last=t1.MAX_BARS))
+        want = t1.calc_signals(df)
+        if want != got:
+            mismatch.append((symbol, want, got))
+    print(f"[PARITY] {len(symbols)} symbol, {len(mismatch)} khác biệt.")
+    for symbol, want, got in mismatch:
+        print(f"  {symbol}: calc_signals={want} batch={got}")
+    return not mismatch
+
+if __name__ == "__main__":
+    sys.exit(0 if check_parity(sys.argv[1] if len(sys.argv) > 1 else None) else 1)
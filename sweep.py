@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import itertools
+from functools import lru_cache
+from multiprocessing import Pool, shared_memory
+import numpy as np
+import pandas as pd
+import backtest
+from signal_engine import rsi, ema, bollinger, conditions_from_indicators
+
+# Quét lưới tham số chiến lược trên toàn bộ kho nến bằng process pool.
+# Ma trận close/high/low nằm trong shared memory (worker chỉ map lại, không
+# pickle dữ liệu). Mỗi task là một nhóm tổ hợp dùng chung bộ chỉ báo
+# (RSI_LEN, BB_LEN, STDDEV, EMA_LEN), cắt nhỏ để có khoảng CHUNKS_PER_WORKER
+# task mỗi process (lưới mặc định chỉ có 4 bộ chỉ báo); RSI / EMA / BB được
+# cache trong từng worker nên các task cùng bộ chỉ báo không tính lại.
+
+GRID = {
+    "rsi_len":   [14],
+    "rsi_ob":    [70, 75, 80, 85],
+    "rsi_os":    [15, 20, 25, 30],
+    "bb_len":    [20],
+    "stddev":    [2.0, 2.5],
+    "ema_len":   [100, 200],
+    "wait_bars": [3, 5, 8],
+    "tp_ratio":  [1.04, 1.06, 1.082, 1.1],
+    "sl_ratio":  [0.95, 0.962, 0.975],
+}
+INDICATOR_KEYS = ("rsi_len", "bb_len", "stddev", "ema_len")
+MATRICES = ("close", "high", "low")
+CHUNKS_PER_WORKER = 4
+
+# ==== PHÍA WORKER ====
+_shared = {}
+
+def _attach(specs):
+    for name, (shm_name, shape) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shared[name + "_shm"] = shm   # giữ tham chiếu để buffer không bị giải phóng
+        _shared[name] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+@lru_cache(maxsize=8)
+def _rsi(n):
+    return rsi(_shared["close"], n)
+
+@lru_cache(maxsize=8)
+def _ema(n):
+    return ema(_shared["close"], n)
+
+@lru_cache(maxsize=8)
+def _bb(n, stddev):
+    return bollinger(_shared["close"], n, stddev)
+
+def _run_group(task):
+    ind, combos = task
+    close, high, low = _shared["close"], _shared["high"], _shared["low"]
+    r = _rsi(ind["rsi_len"])
+    e = _ema(ind["ema_len"])
+    upper, lower = _bb(ind["bb_len"], ind["stddev"])
+    results = []
+    for combo in combos:
+        cond_long, cond_short = conditions_from_indicators(
+            close, r, e, upper, lower, combo["rsi_ob"], combo["rsi_os"],
+        )
+        direction = backtest.entry_directions(cond_long, cond_short, combo["wait_bars"])
+        trades = backtest.simulate(direction, close, high, low, combo["tp_ratio"], combo["sl_ratio"])
+        results.append({**ind, **combo, **backtest.summarize_total(trades)})
+    return results
+
+# ==== PHÍA ĐIỀU PHỐI ====
+def build_tasks(grid, workers=1):
+    keys = list(grid)
+    groups = {}
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = dict(zip(keys, values))
+        ind = tuple(params[k] for k in INDICATOR_KEYS)
+        rest = {k: v for k, v in params.items() if k not in INDICATOR_KEYS}
+        groups.setdefault(ind, []).append(rest)
+    # Sắp theo (rsi_len, ema_len) để các nhóm liên tiếp dùng lại được cache
+    order = sorted(groups, key=lambda k: (k[0], k[3], k[1], k[2]))
+    total = sum(len(combos) for combos in groups.values())
+    size = max(1, -(-total // (workers * CHUNKS_PER_WORKER)))
+    return [(dict(zip(INDICATOR_KEYS, k)), groups[k][i:i + size])
+            for k in order for i in range(0, len(groups[k]), size)]
+
+def sweep(folder=None, grid=None, workers=None):
+    grid = grid or GRID
+    workers = workers or os.cpu_count()
+    symbols, mats = backtest.load_matrices(folder)
+    blocks, specs = [], {}
+    try:
+        for name in MATRICES:
+            arr = np.ascontiguousarray(mats[name], dtype=np.float64)
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            np.ndarray(arr.shape, dtype=np.float64, buffer=shm.buf)[...] = arr
+            blocks.append(shm)
+            specs[name] = (shm.name, arr.shape)
+        tasks = build_tasks(grid, workers)
+        rows = []
+        with Pool(workers, initializer=_attach, initargs=(specs,)) as pool:
+            for res in pool.imap_unordered(_run_group, tasks):
+                rows.extend(res)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    table = pd.DataFrame(rows).sort_values(["pnl", "max_drawdown"], ascending=[False, True])
+    table.insert(0, "rank", range(1, len(table) + 1))
+    return symbols, table.reset_index(drop=True)
+
+def main(folder=None, out_csv="sweep_results.csv", workers=None):
+    t0 = time.perf_counter()
+    symbols, table = sweep(folder, workers=workers)
+    print(f"[SWEEP] {len(table)} tổ hợp × {len(symbols)} symbol trong {time.perf_counter() - t0:.1f}s "
+          f"({workers or os.cpu_count()} process)")
+    print(table.head(20).to_string(index=False))
+    table.to_csv(out_csv, index=False)
+    print(f"[SWEEP] Đã ghi bảng xếp hạng: {out_csv}")
+    return table
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else None,
+        sys.argv[2] if len(sys.argv) > 2 else "sweep_results.csv",
+        int(sys.argv[3]) if len(sys.argv) > 3 else None,
+    )
@@ -1,19 +1,32 @@
 import os
-import glob
-import pandas as pd
 import ta
 import numpy as np
 import time
 import logging
-import json
+import threading
 from pybit.unified_trading import HTTP
+import bar_store
+import metrics
+import timeframes
+from signal_engine import stack_right_aligned
+from order_sync import reconcile
+from order_store import OrderStore
+from portfolio import Portfolio, default_ws_factory as position_ws_factory
+from order_exec import RateLimiter, poll_with_backoff, run_concurrent
+from order_batch import place_entries_with_tp_sl
+from instruments import get_instruments, lot_size, is_fresh
+from indicator_state import (
+    load_states, save_states, load_resync, clear_resync, seed_states, advance_bars, decide,
+)
 
 # ==== CẤU HÌNH ====
 API_KEY      = os.getenv("BYBIT_API_KEY")
 API_SECRET   = os.getenv("BYBIT_API_SECRET")
 RECV_WINDOW  = 60000
 DATA_FOLDER = "/data/Data1200bar"
+MAX_BARS     = 1200   # file .bars có thể dài hơn (u4 chỉ cắt khi vượt 1.5×), chỉ đọc 1200 nến cuối
 MAX_OPEN     = 100
+MAX_TOTAL_MARGIN = float(os.getenv("MAX_TOTAL_MARGIN", "0"))   # tổng ký quỹ tối đa mọi vị thế, 0: không giới hạn
 MARGIN       = 50
 LEVERAGE     = 2
 TP_RATIO     = 1.082
@@ -25,50 +38,81 @@ BB_LEN       = 20
 STDDEV       = 2.0
 EMA_LEN      = 200
 WAIT_BARS    = 5
-ORDER_LOG    = "/data/active_orders.json"
+ORDER_LOG    = "/data/active_orders.json"   # định dạng cũ, chỉ còn dùng để chuyển sang ORDER_DB
+ORDER_DB     = "/data/orders.db"
+ORDER_RETENTION = 30 * 86400   # giữ lệnh đã đóng trong DB 30 ngày
+STATE_FILE   = "/data/indicator_state.json"
+RESYNC_FILE  = "/data/indicator_resync.json"   # u4.py ghi các symbol vừa backfill / có gap
+
+# Chạy thêm calc_signals trên khung lớn dựng từ nến 1h (ví dụ ["4h", "1d"]); chỉ
+# đánh giá khi nến khung đó vừa đóng, symbol đã có tín hiệu 1h thì giữ tín hiệu 1h
+EXTRA_TIMEFRAMES = [tf for tf in os.getenv("EXTRA_TIMEFRAMES", "").split(",") if tf]
+
+# "batch": gom lệnh vào / TP / SL của mọi symbol có tín hiệu qua endpoint batch;
+# "single": mỗi symbol 3 lệnh place_order riêng trên thread pool như trước
+ORDER_MODE = os.getenv("ORDER_MODE", "batch")
+EXEC_WORKERS = 8      # số symbol vào lệnh song song
+REST_RATE    = 8      # số request REST tối đa mỗi giây (dùng chung mọi luồng)
+FILL_TIMEOUT = 10     # giây chờ market order khớp để lấy giá entry
+
+STRATEGY_PARAMS = {
+    "rsi_len": RSI_LEN, "rsi_ob": RSI_OB, "rsi_os": RSI_OS, "bb_len": BB_LEN,
+    "stddev": STDDEV, "ema_len": EMA_LEN, "wait_bars": WAIT_BARS,
+}
 
 logging.basicConfig(level=logging.INFO)
 
-print("[T1] Kết nối Bybit...")
-session = HTTP(api_key=API_KEY, api_secret=API_SECRET, recv_window=RECV_WINDOW)
-try:
-    session.get_server_time()
-    print("[T1] Kết nối Bybit thành công!")
-except Exception as e:
-    print("[T1] Lỗi kết nối Bybit:", e)
-    exit(1)
+session = None
+instrument_cache = None
+indicator_states = None   # giữ trong bộ nhớ khi chạy trong worker daemon
+active_orders_cache = None
+order_store = None
+portfolio = Portfolio(LEVERAGE)   # vị thế thực tế, nạp 1 lần mỗi lượt hoặc cập nhật từ private stream
+rest_limiter = RateLimiter(REST_RATE)
+orders_lock = threading.Lock()
+signal_times = {}   # symbol -> perf_counter lúc có tín hiệu, để đo độ trễ tín hiệu -> lệnh
+
+def connect():
+    global session
+    subscribe_timeframes()
+    print("[T1] Kết nối Bybit...")
+    session = metrics.InstrumentedSession(HTTP(api_key=API_KEY, api_secret=API_SECRET, recv_window=RECV_WINDOW))
+    try:
+        session.get_server_time()
+        print("[T1] Kết nối Bybit thành công!")
+    except Exception as e:
+        print("[T1] Lỗi kết nối Bybit:", e)
+        exit(1)
 
 def load_active_orders():
-    if os.path.exists(ORDER_LOG):
-        with open(ORDER_LOG, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_active_orders(active_orders):
-    with open(ORDER_LOG, "w") as f:
-        json.dump(active_orders, f)
-
-def cleanup_closed_orders(symbol, active_orders):
-    open_order_ids = []
-    for order_id in active_orders.get(symbol, []):
-        try:
-            info = session.get_order_history(category="linear", symbol=symbol, orderId=order_id)
-            orders = info.get("result", {}).get("list", [])
-            status = orders[0]["orderStatus"] if orders else "Unknown"
-            if status in ["Filled", "Cancelled", "Rejected"]:
-                continue
-            open_order_ids.append(order_id)
-        except Exception as e:
-            logging.warning(f"Không kiểm tra được trạng thái order {order_id} của {symbol}: {e}")
-    active_orders[symbol] = open_order_ids
-    save_active_orders(active_orders)
-    return len(open_order_ids)
+    global order_store
+    if order_store is None:
+        order_store = OrderStore(ORDER_DB)
+        n = order_store.import_json(ORDER_LOG)
+        if n:
+            print(f"[T1] Đã chuyển {n} lệnh từ {ORDER_LOG} sang {ORDER_DB}")
+    return order_store.open_orders()
 
-def get_qty(symbol, entry_price):
+def cleanup_closed_orders(active_orders):
+    # Đối soát tất cả symbol một lần (lấy lệnh theo lô), chỉ ghi các lệnh đổi trạng thái
+    closed = {}
+    open_counts = reconcile(session, active_orders, statuses=closed)
+    order_store.set_statuses(closed)
+    order_store.purge_closed(ORDER_RETENTION)
+    return open_counts
+
+def get_lot_size(symbol):
+    lot = lot_size(instrument_cache, symbol) if instrument_cache else None
+    if lot:
+        return lot
+    # Symbol mới chưa có trong cache: hỏi trực tiếp
+    rest_limiter.acquire()
     info = session.get_instruments_info(category="linear", symbol=symbol)
     filt = info["result"]["list"][0]["lotSizeFilter"]
-    step = float(filt["qtyStep"])
-    min_qty = float(filt["minOrderQty"])
+    return float(filt["qtyStep"]), float(filt["minOrderQty"])
+
+def get_qty(symbol, entry_price):
+    step, min_qty = get_lot_size(symbol)
     raw = (MARGIN * LEVERAGE) / entry_price
     qty = max(min_qty, np.floor(raw / step) * step) if step > 0 else raw
     precision = abs(int(np.log10(step))) if step < 1 and step > 0 else 0
@@ -92,31 +136,60 @@ def calc_signals(df):
         return "short"
     return None
 
+def subscribe_timeframes():
+    # Gọi từ connect()/main(), không chạy lúc import; gọi lại nhiều lần không đăng ký trùng
+    for tf in EXTRA_TIMEFRAMES:
+        timeframes.subscribe(tf, calc_signals, last=MAX_BARS)
+
 def get_entry_price(order_id, symbol):
-    for _ in range(10):
+    # Hỏi lại với backoff tăng dần (0.2s, 0.34s, ... tối đa 2s) thay vì sleep 1s cố định
+    def check():
         try:
+            rest_limiter.acquire()
             info = session.get_order_history(category="linear", symbol=symbol, orderId=order_id)
             orders = info.get("result", {}).get("list", [])
             if orders and orders[0].get("avgPrice"):
                 return float(orders[0]["avgPrice"])
         except Exception as e:
             logging.warning(f"Không lấy được giá entry cho order {order_id}: {e}")
-        time.sleep(1)
-    return None
+        return None
+    return poll_with_backoff(check, timeout=FILL_TIMEOUT)
 
-def check_position(symbol, direction):
+def load_positions():
+    # Một lượt get_positions (phân trang) cho cả category; bỏ qua nếu private stream còn sống và mới
+    if portfolio.is_live():
+        return True
     try:
-        info = session.get_positions(category="linear", symbol=symbol)
-        positions = info.get("result", {}).get("list", [])
-        if not positions:
-            return 0.0
-        if direction == "long":
-            return float(positions[0].get("size", 0))
-        else:  # short
-            return -float(positions[0].get("size", 0))
+        rest_limiter.acquire()
+        n = portfolio.refresh(session)
+        st = portfolio.summary()
+        print(f"[T1] Vị thế: {n} position, tổng ký quỹ {st['total_margin']}")
+        return True
     except Exception as e:
-        logging.warning(f"Lỗi kiểm tra position {symbol}: {e}")
-        return 0.0
+        logging.warning(f"[T1] Không tải được danh sách position: {e}")
+        return False
+
+def start_position_stream(ws_factory=position_ws_factory):
+    # Nạp snapshot một lần rồi giữ bảng vị thế cập nhật qua private stream (worker chế độ stream)
+    if session is None:
+        connect()
+    portfolio.refresh(session)
+    return portfolio.subscribe(ws_factory(API_KEY, API_SECRET))
+
+def check_position(symbol, direction):
+    return portfolio.size(symbol, direction)
+
+def tp_sl_prices(real_entry, side):
+    # Xác định vị thế THỰC TẾ dựa vào 'side' đã vào lệnh
+    if side == "Sell":
+        # SHORT: TP dưới entry, SL trên entry
+        tp_price = real_entry * (2 - TP_RATIO)  # ví dụ: 0.918 nếu TP_RATIO=1.082
+        sl_price = real_entry * (2 - SL_RATIO)  # ví dụ: 1.038 nếu SL_RATIO=0.962
+        return tp_price, sl_price, 2, 1         # TP khi giá <= tp_price, SL khi giá >= sl_price
+    # LONG: TP trên entry, SL dưới entry
+    tp_price = real_entry * TP_RATIO        # 1.082 × entry
+    sl_price = real_entry * SL_RATIO        # 0.962 × entry
+    return tp_price, sl_price, 1, 2         # TP khi giá >= tp_price, SL khi giá <= sl_price
 
 def place_market_order_with_tp_sl(symbol, qty, entry_price, direction, active_orders):
     if len(active_orders.get(symbol, [])) >= MAX_OPEN:
@@ -133,8 +206,10 @@ def place_market_order_with_tp_sl(symbol, qty, entry_price, direction, active_or
         return
 
     print(f"[T1] {symbol}: VÀO LỆNH {direction.upper()} MARKET | qty={qty}")
+    t_start = time.perf_counter()
     try:
         # 1. Đặt lệnh market vào lệnh
+        rest_limiter.acquire()
         order = session.place_order(
             category="linear",
             symbol=symbol,
@@ -145,31 +220,24 @@ def place_market_order_with_tp_sl(symbol, qty, entry_price, direction, active_or
             reduceOnly=False,
             recv_window=RECV_WINDOW
         )
+        t_ack = time.perf_counter()
+        portfolio.reserve(symbol, side, qty, MARGIN)
+        t_signal = signal_times.pop(symbol, None)
+        if t_signal is not None:
+            metrics.observe("signal_to_order_seconds", t_ack - t_signal)
         order_id = order.get("result", {}).get("orderId")
         if order_id:
-            active_orders.setdefault(symbol, []).append(order_id)
-            save_active_orders(active_orders)
+            with orders_lock:
+                active_orders.setdefault(symbol, []).append(order_id)
+            order_store.add(symbol, order_id)
 
         # 2. Lấy giá entry thực tế sau khi market fill
         real_entry = get_entry_price(order_id, symbol)
+        t_fill = time.perf_counter()
         if not real_entry:
             real_entry = entry_price
 
-        # Xác định vị thế THỰC TẾ dựa vào 'side' đã vào lệnh
-        entered_is_short = (side == "Sell")
-
-        if entered_is_short:
-            # SHORT: TP dưới entry, SL trên entry
-            tp_price = real_entry * (2 - TP_RATIO)  # ví dụ: 0.918 nếu TP_RATIO=1.082
-            sl_price = real_entry * (2 - SL_RATIO)  # ví dụ: 1.038 nếu SL_RATIO=0.962
-            tp_trigger_dir = 2  # giá <= tp_price thì chốt lời
-            sl_trigger_dir = 1  # giá >= sl_price thì cắt lỗ
-        else:
-            # LONG: TP trên entry, SL dưới entry
-            tp_price = real_entry * TP_RATIO        # 1.082 × entry
-            sl_price = real_entry * SL_RATIO        # 0.962 × entry
-            tp_trigger_dir = 1  # giá >= tp_price thì chốt lời
-            sl_trigger_dir = 2  # giá <= sl_price thì cắt lỗ
+        tp_price, sl_price, tp_trigger_dir, sl_trigger_dir = tp_sl_prices(real_entry, side)
 
         tp_percent = abs(tp_price - real_entry) / real_entry * 100.0
         sl_percent = abs(sl_price - real_entry) / real_entry * 100.0
@@ -178,6 +246,7 @@ def place_market_order_with_tp_sl(symbol, qty, entry_price, direction, active_or
               f"MARKET SL tại {sl_price:.4f} (~{sl_percent:.2f}%)")
 
         # 3. Đặt TP/SL bằng conditional market order (chỉ để đóng vị thế)
+        rest_limiter.acquire()
         tp_order = session.place_order(
             category="linear",
             symbol=symbol,
@@ -191,6 +260,7 @@ def place_market_order_with_tp_sl(symbol, qty, entry_price, direction, active_or
             recv_window=RECV_WINDOW
         )
 
+        rest_limiter.acquire()
         sl_order = session.place_order(
             category="linear",
             symbol=symbol,
@@ -204,47 +274,189 @@ def place_market_order_with_tp_sl(symbol, qty, entry_price, direction, active_or
             recv_window=RECV_WINDOW
         )
 
+        t_done = time.perf_counter()
+
         logging.info(f"[T1] TP resp: {tp_order}")
         logging.info(f"[T1] SL resp: {sl_order}")
+        logging.info(f"[T1] {symbol}: latency entry={t_ack - t_start:.3f}s fill={t_fill - t_ack:.3f}s "
+                     f"tp/sl={t_done - t_fill:.3f}s tổng={t_done - t_start:.3f}s")
     except Exception as e:
         logging.warning(f"Lỗi đặt lệnh {symbol}: {e}")
         return None
 
-def main():
-    active_orders = load_active_orders()
-    csv_files = glob.glob(os.path.join(DATA_FOLDER, "*_1h.csv"))
-    print(f"[T1] Tổng số file dữ liệu: {len(csv_files)}")
-    n_checked, n_signal, n_no_signal, n_error = 0, 0, 0, 0
-    for fp in csv_files:
+def execute_signal(symbol, entry_price, direction, active_orders):
+    qty, precision = get_qty(symbol, entry_price)
+    qty = round(qty, precision)
+    if qty > 0:
+        place_market_order_with_tp_sl(symbol, qty, entry_price, direction, active_orders)
+    else:
+        print(f"[T1] {symbol}: Không vào lệnh do qty=0")
+
+# ==== VÀO LỆNH THEO LÔ (ORDER_MODE="batch") ====
+def tp_sl_legs(entry, real_entry):
+    close_side = "Sell" if entry["side"] == "Buy" else "Buy"
+    tp_price, sl_price, tp_dir, sl_dir = tp_sl_prices(real_entry, entry["side"])
+    leg = {"symbol": entry["symbol"], "side": close_side, "orderType": "Market", "qty": f"{entry['qty']}",
+           "reduceOnly": True, "closeOnTrigger": True}
+    return ({**leg, "triggerDirection": tp_dir, "triggerPrice": str(tp_price)},
+            {**leg, "triggerDirection": sl_dir, "triggerPrice": str(sl_price)})
+
+def execute_signals_batch(jobs):
+    # jobs giống run_concurrent: (symbol, entry_price, direction, active_orders); trả về số lỗi
+    entries, n_error = [], 0
+    for symbol, entry_price, direction, active_orders in jobs:
+        try:
+            qty, precision = get_qty(symbol, entry_price)
+            qty = round(qty, precision)
+        except Exception as e:
+            logging.warning(f"Lỗi tính qty {symbol}: {e}")
+            n_error += 1
+            continue
+        if qty <= 0:
+            print(f"[T1] {symbol}: Không vào lệnh do qty=0")
+            continue
+        print(f"[T1] {symbol}: VÀO LỆNH {direction.upper()} MARKET | qty={qty}")
+        entries.append({"symbol": symbol, "side": "Buy" if direction == "long" else "Sell",
+                        "qty": qty, "entry_price": entry_price, "active_orders": active_orders})
+    if not entries:
+        return n_error
+
+    def record(e, order_id):
+        # Ghi lại ngay khi sàn nhận lệnh vào, trước khi chờ khớp / đặt TP SL
+        t_ack = time.perf_counter()
+        symbol = e["symbol"]
+        with orders_lock:
+            e["active_orders"].setdefault(symbol, []).append(order_id)
+        order_store.add(symbol, order_id)
+        portfolio.reserve(symbol, e["side"], e["qty"], MARGIN)
+        t_signal = signal_times.pop(symbol, None)
+        if t_signal is not None:
+            metrics.observe("signal_to_order_seconds", t_ack - t_signal)
+
+    t_start = time.perf_counter()
+    report = place_entries_with_tp_sl(session, entries, tp_sl_legs, limiter=rest_limiter,
+                                      fill_timeout=FILL_TIMEOUT, on_entry=record,
+                                      recv_window=RECV_WINDOW, max_workers=EXEC_WORKERS)
+    for e in entries:
+        symbol, res = e["symbol"], report[e["symbol"]]
+        if res["entry"]:
+            print(f"[T1] {symbol}: khớp ~{res['fill']}, TP {res['tp'] or 'LỖI'}, SL {res['sl'] or 'LỖI'}")
+            if res["t_legs"]:
+                logging.info(f"[T1] {symbol}: latency entry={res['t_ack'] - t_start:.3f}s "
+                             f"fill={res['t_fill'] - res['t_ack']:.3f}s tp/sl={res['t_legs'] - res['t_fill']:.3f}s "
+                             f"tổng={res['t_legs'] - t_start:.3f}s")
+        for err in res["errors"]:
+            logging.warning(f"Lỗi đặt lệnh {symbol}: {err}")
+        n_error += 1 if res["errors"] else 0
+    return n_error
+
+def load_closes(symbols_all):
+    symbols, series, stamps, last_prices, n_error = [], [], [], [], 0
+    for symbol in symbols_all:
         try:
-            symbol = os.path.basename(fp).split('_')[0]
-            df = pd.read_csv(fp)
-            if not {'open','high','low','close','volume'}.issubset(df.columns):
-                df.columns = ['timestamp','open','high','low','close','volume'][:df.shape[1]]
-            if len(df) < EMA_LEN + 1:
+            bars = bar_store.read(DATA_FOLDER, symbol, last=MAX_BARS)
+            if len(bars) < EMA_LEN + 1:
                 continue
-            num_open = cleanup_closed_orders(symbol, active_orders)
-            direction = calc_signals(df)
+            symbols.append(symbol)
+            series.append(bars["close"])
+            stamps.append(bars["ts"])
+            last_prices.append(float(bars["close"][-1]))
+        except Exception as e:
+            logging.warning(f"[T1] Lỗi xử lý {symbol}: {e}")
+            n_error += 1
+    return symbols, series, stamps, last_prices, n_error
+
+def update_signal_states(symbols, series, stamps, states):
+    # Cập nhật O(1) cho symbol nối tiếp được, còn lại tính lại toàn bộ một lần (vector hoá)
+    resync = load_resync(RESYNC_FILE)
+    to_seed = []
+    for i, symbol in enumerate(symbols):
+        state = None if symbol in resync else states.get(symbol)
+        if advance_bars(state, series[i], stamps[i], STRATEGY_PARAMS) is None:
+            to_seed.append(i)
+    if to_seed:
+        seeded = seed_states(
+            [symbols[i] for i in to_seed],
+            stack_right_aligned([series[i] for i in to_seed]),
+            [stamps[i][-1] for i in to_seed],
+            STRATEGY_PARAMS,
+        )
+        states.update(seeded)
+    print(f"[T1] Chỉ báo: {len(symbols) - len(to_seed)} symbol cập nhật nến mới, {len(to_seed)} symbol tính lại toàn bộ.")
+    return [decide(states[symbol]) for symbol in symbols]
+
+def load_instruments():
+    global instrument_cache
+    if instrument_cache is not None and is_fresh(instrument_cache):
+        return
+    try:
+        instrument_cache = get_instruments(session)
+    except Exception as e:
+        logging.warning(f"[T1] Không tải được cache instrument: {e}")
+
+def main(only_symbols=None):
+    # only_symbols: chỉ đánh giá các symbol này (bar_stream gọi khi có nến mới đóng)
+    global indicator_states, active_orders_cache
+    if session is None:
+        connect()
+    subscribe_timeframes()
+    load_instruments()
+    if active_orders_cache is None:
+        active_orders_cache = load_active_orders()
+    active_orders = active_orders_cache
+    all_symbols = list(only_symbols) if only_symbols is not None else bar_store.list_symbols(DATA_FOLDER)
+    print(f"[T1] Tổng số file dữ liệu: {len(all_symbols)}")
+    n_checked, n_signal, n_no_signal = 0, 0, 0
+    with metrics.stage("t1_load"):
+        symbols, series, stamps, last_prices, n_error = load_closes(all_symbols)
+    if indicator_states is None:
+        indicator_states = load_states(STATE_FILE)
+    states = indicator_states
+    with metrics.stage("t1_signals"):
+        directions = update_signal_states(symbols, series, stamps, states)
+        if timeframes.SUBSCRIPTIONS:
+            higher = timeframes.evaluate(DATA_FOLDER, symbols)
+            directions = [d or higher.get(sym) for sym, d in zip(symbols, directions)]
+    t_signal = time.perf_counter()
+    save_states(STATE_FILE, states)
+    clear_resync(RESYNC_FILE, all_symbols)
+    with metrics.stage("t1_reconcile"):
+        open_counts = cleanup_closed_orders(active_orders)
+    with metrics.stage("t1_positions"):
+        load_positions()
+    jobs = []
+    pending_margin = 0.0
+    for symbol, direction, entry_price in zip(symbols, directions, last_prices):
+        try:
+            num_open = max(open_counts.get(symbol, 0), portfolio.entries(symbol, MARGIN))
             n_checked += 1
             if direction:
                 n_signal += 1
                 print(f"[T1] {symbol}: Có tín hiệu '{direction.upper()}'. Số lệnh đang mở: {num_open}")
-                if num_open < MAX_OPEN:
-                    entry_price = df['close'].iat[-1]
-                    qty, precision = get_qty(symbol, entry_price)
-                    qty = round(qty, precision)
-                    if qty > 0:
-                        place_market_order_with_tp_sl(symbol, qty, entry_price, direction, active_orders)
-                    else:
-                        print(f"[T1] {symbol}: Không vào lệnh do qty=0")
+                ok, reason = portfolio.can_open(symbol, MARGIN, MAX_OPEN, MAX_TOTAL_MARGIN, pending_margin)
+                if ok and num_open < MAX_OPEN:
+                    pending_margin += MARGIN
+                    signal_times[symbol] = t_signal
+                    jobs.append((symbol, entry_price, direction, active_orders))
                 else:
-                    print(f"[T1] {symbol}: ĐÃ ĐỦ {MAX_OPEN} LỆNH đang mở, không vào lệnh mới.")
+                    print(f"[T1] {symbol}: {reason or f'ĐÃ ĐỦ {MAX_OPEN} LỆNH đang mở'}, không vào lệnh mới.")
             else:
                 n_no_signal += 1
         except Exception as e:
-            logging.warning(f"[T1] Lỗi xử lý {fp}: {e}")
+            logging.warning(f"[T1] Lỗi xử lý {symbol}: {e}")
             n_error += 1
+    # Vào lệnh song song cho các symbol có tín hiệu (giới hạn tốc độ REST chung)
+    t_exec = time.perf_counter()
+    with metrics.stage("t1_orders"):
+        if ORDER_MODE == "batch":
+            n_error += execute_signals_batch(jobs)
+        else:
+            results = run_concurrent(jobs, execute_signal, EXEC_WORKERS)
+            n_error += sum(1 for _, res in results if isinstance(res, Exception))
+    if jobs:
+        print(f"[T1] Đã xử lý {len(jobs)} lệnh trong {time.perf_counter() - t_exec:.2f}s")
     print(f"[T1] Tổng kết: {n_checked} symbol, {n_signal} có tín hiệu, {n_no_signal} không có tín hiệu, {n_error} lỗi.")
 
 if __name__ == "__main__":
     main()
+    metrics.dump(job="t1")
@@ -0,0 +1,23 @@
+import os
+import sys
+
+# Các module nằm ở thư mục gốc repo (không phải package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+
+import numpy as np
+import bar_store
+
+# Nến giả dùng chung cho các test kho nến
+BAR_MS = 3600 * 1000
+T0 = 1_700_000_000_000 // (24 * BAR_MS) * (24 * BAR_MS)   # tròn ngày (cũng tròn mọi khung lớn)
+
+def make_bars(hours, start=T0):
+    # hours: số nến liên tiếp, hoặc danh sách giờ (tính từ start) để tạo gap; close = 1 + giờ
+    hours = np.arange(hours) if np.isscalar(hours) else np.asarray(list(hours), dtype=np.int64)
+    out = np.empty(len(hours), dtype=bar_store.BAR_DTYPE)
+    out["ts"] = start + BAR_MS * hours
+    out["open"] = out["close"] = 1.0 + hours
+    out["high"] = out["close"] + 1
+    out["low"] = out["close"] - 1
+    return out
@@ -0,0 +1,76 @@
+import json
+import threading
+import bar_store
+import integrity
+from bar_stream import BarStream, ReplayWebSocket
+from conftest import BAR_MS, T0, make_bars
+
+# Phát lại message kline đã ghi qua ReplayWebSocket: nến nối tiếp được append,
+# nến trùng bị bỏ qua, nến nhảy cóc (thiếu giờ) chuyển sang on_gap để REST lấp.
+
+def kline(symbol, ts, confirm=True):
+    row = {"start": ts, "open": "1", "high": "2", "low": "0.5", "close": "1.5", "confirm": confirm}
+    return {"topic": f"kline.60.{symbol}", "data": [row]}
+
+def replay(tmp_path, messages, store, **kw):
+    folder = str(tmp_path)
+    for symbol, existing in store.items():
+        bar_store.write(folder, symbol, existing)
+        integrity.get_index(folder).record_write(symbol, existing)
+    path = tmp_path / "ws.jsonl"
+    path.write_text("".join(json.dumps(m) + "\n" for m in messages))
+    seen = {"bars": [], "gap": []}
+    stream = BarStream(list(store), folder,
+                       on_bars=seen["bars"].append, on_gap=seen["gap"].append,
+                       ws_factory=lambda category: ReplayWebSocket(str(path), category),
+                       debounce=3600, **kw)
+    ws, = stream.start()
+    ws.replay()
+    stream.timer.cancel()
+    stream.flush()
+    return stream, folder, seen
+
+def test_replay_with_duplicate_and_gap(tmp_path):
+    last = T0 + 9 * BAR_MS
+    stream, folder, seen = replay(tmp_path, [
+        kline("BTCUSDT", last + BAR_MS, confirm=False),   # nến đang hình thành: bỏ qua
+        kline("BTCUSDT", last + BAR_MS),
+        kline("BTCUSDT", last + BAR_MS),                  # trùng
+        kline("BTCUSDT", last),                           # cũ hơn nến cuối
+        kline("ETHUSDT", last + 3 * BAR_MS),              # thiếu 2 giờ
+    ], {"BTCUSDT": make_bars(10), "ETHUSDT": make_bars(10)})
+
+    btc = bar_store.read(folder, "BTCUSDT")
+    assert len(btc) == 11 and int(btc["ts"][-1]) == last + BAR_MS
+    assert bar_store.count(folder, "ETHUSDT") == 10
+    assert stream.stats == {"messages": 5, "bars": 1, "gaps": 1, "evaluations": 1}
+    assert seen["gap"] == [["ETHUSDT"]]
+    assert seen["bars"] == [["BTCUSDT", "ETHUSDT"]]
+    assert integrity.get_index(folder).gaps() == {}
+
+def test_accept_rechecks_file_under_symbol_lock(tmp_path):
+    # u4 ghi lại file (lấp gap) trong lúc luồng WS đang chờ khoá: nến WS đã có thì bỏ qua
+    last = T0 + 9 * BAR_MS
+    folder = str(tmp_path)
+    bar_store.write(folder, "BTCUSDT", make_bars(10))
+    stream = BarStream(["BTCUSDT"], folder, on_bars=lambda s: None, on_gap=lambda s: None)
+    stream.last["BTCUSDT"] = last
+    lock = bar_store.symbol_lock(folder, "BTCUSDT")
+    with lock:
+        worker = threading.Thread(target=stream._accept, args=("BTCUSDT", make_bars(1, start=last + BAR_MS)[0]))
+        worker.start()
+        worker.join(0.2)
+        assert worker.is_alive()
+        bar_store.write(folder, "BTCUSDT", make_bars(11))
+    worker.join()
+    assert bar_store.count(folder, "BTCUSDT") == 11
+    assert stream.stats["bars"] == 0
+
+def test_stream_trims_like_u4(tmp_path):
+    # Không có u4 chạy mỗi giờ: file vượt 1.5 × max_bars thì bị cắt về max_bars ngay khi nhận nến
+    stream, folder, seen = replay(tmp_path, [kline("BTCUSDT", T0 + 15 * BAR_MS)],
+                                  {"BTCUSDT": make_bars(15)}, max_bars=10)
+    kept = bar_store.read(folder, "BTCUSDT")
+    assert len(kept) == 10 and int(kept["ts"][-1]) == T0 + 15 * BAR_MS
+    assert integrity.get_index(folder).gaps() == {}
+    assert integrity.get_index(folder).summary()["symbols"] == 1
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import t1
+from signal_engine import stack_right_aligned
+from indicator_state import seed_states, advance_bars, decide, BAR_MS
+
+# Đường O(1) (seed_states -> advance_bars -> decide) phải cho cùng tín hiệu với
+# calc_signals chạy lại trên cửa sổ 1200 nến trượt, kể cả sau khi phải seed lại.
+
+WINDOW = t1.MAX_BARS
+PARAMS = t1.STRATEGY_PARAMS
+T0 = 1_700_000_000_000 // BAR_MS * BAR_MS
+
+def walk(n, seed):
+    # Random walk có cú giật (3 nến cùng chiều) thường xuyên để tín hiệu long / short xuất hiện
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 0.01, n)
+    for i in np.flatnonzero(rng.random(n) < 0.01):
+        steps[i:i + 3] += rng.choice([-0.03, 0.03])
+    return 100 * np.exp(np.cumsum(steps))
+
+def reference(closes):
+    return t1.calc_signals(pd.DataFrame({"close": closes}))
+
+def seed(closes, stamps):
+    return seed_states(["X"], stack_right_aligned([closes]), [stamps[-1]], PARAMS)["X"]
+
+def run(closes, stamps, steps):
+    state = seed(closes[:WINDOW], stamps[:WINDOW])
+    got, want, n_reseed = [], [], 0
+    for end in range(WINDOW + 1, WINDOW + 1 + steps):
+        c, ts = closes[end - WINDOW:end], stamps[end - WINDOW:end]
+        if advance_bars(state, c, ts, PARAMS) is None:
+            state = seed(c, ts)
+            n_reseed += 1
+        got.append(decide(state))
+        want.append(reference(c))
+    return got, want, n_reseed
+
+def test_incremental_matches_calc_signals():
+    steps = 600
+    seen = set()
+    for s in range(3):
+        closes = walk(WINDOW + steps + 1, s)
+        stamps = T0 + BAR_MS * np.arange(len(closes), dtype=np.int64)
+        got, want, n_reseed = run(closes, stamps, steps)
+        assert n_reseed == 0
+        assert got == want
+        seen.update(got)
+    assert {"long", "short"} <= seen
+
+def test_reseed_after_gap_matches_calc_signals():
+    steps = 300
+    closes = walk(WINDOW + steps + 1, 11)
+    stamps = T0 + BAR_MS * np.arange(len(closes), dtype=np.int64)
+    stamps[WINDOW + 100:] += 3 * BAR_MS      # thiếu 3 nến: không nối tiếp được
+    got, want, n_reseed = run(closes, stamps, steps)
+    assert n_reseed == 1
+    assert got == want
+
+def test_advance_bars_requires_matching_state():
+    closes = walk(WINDOW + 2, 3)
+    stamps = T0 + BAR_MS * np.arange(len(closes), dtype=np.int64)
+    state = seed(closes[:WINDOW], stamps[:WINDOW])
+    c, ts = closes[1:WINDOW + 1], stamps[1:WINDOW + 1]
+    assert advance_bars(None, c, ts, PARAMS) is None                            # symbol trong danh sách resync
+    assert advance_bars(state, c, ts, {**PARAMS, "rsi_len": 21}) is None         # đổi tham số chiến lược
+    assert advance_bars(state, closes[:WINDOW], stamps[:WINDOW], PARAMS) == 0    # chưa có nến mới
+    assert advance_bars(state, c, ts, PARAMS) == 1
+    assert state["last_ts"] == int(stamps[WINDOW])
+    # Dữ liệu bị dựng lại (nến cuối cũ hơn state): phải seed lại
+    assert advance_bars(state, closes[:WINDOW - 5], stamps[:WINDOW - 5], PARAMS) is None
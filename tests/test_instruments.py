@@ -0,0 +1,18 @@
+import time
+import pytest
+import instruments
+
+class BrokenHTTP:
+    def get_instruments_info(self, **params):
+        raise ConnectionError("timeout")
+
+def test_failed_refresh_returns_stale_cache(tmp_path):
+    path = str(tmp_path / "instruments.json")
+    stale = {"updated": time.time() - 2 * instruments.CACHE_TTL,
+             "linear": {"BTCUSDT": {"status": "Trading", "qtyStep": 0.001, "minOrderQty": 0.001, "tickSize": 0.1}}}
+    instruments.save_cache(stale, path)
+    assert instruments.get_instruments(BrokenHTTP(), path) == stale
+
+def test_failed_refresh_without_cache_raises(tmp_path):
+    with pytest.raises(ConnectionError):
+        instruments.get_instruments(BrokenHTTP(), str(tmp_path / "instruments.json"))
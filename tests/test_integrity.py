@@ -0,0 +1,39 @@
+import bar_store
+from integrity import IntegrityIndex, BAR_MS, MAX_ATTEMPTS
+from conftest import T0, make_bars
+
+def test_partial_repair_keeps_attempt_count(tmp_path):
+    index = IntegrityIndex(str(tmp_path))
+    # Thiếu giờ 10..19
+    index.record_write("BTCUSDT", make_bars([h for h in range(30) if not 10 <= h <= 19]))
+    gap = (T0 + 10 * BAR_MS, T0 + 19 * BAR_MS)
+    assert index.gaps() == {"BTCUSDT": [gap]}
+    index.mark_attempts("BTCUSDT", [gap])
+    index.mark_attempts("BTCUSDT", [gap])
+    # Lấp được 10..14: gap còn lại đổi điểm đầu nhưng vẫn giữ 2 lần thử, lần thử thứ 3 thì bỏ
+    index.record_write("BTCUSDT", make_bars([h for h in range(30) if not 15 <= h <= 19]))
+    rest = (T0 + 15 * BAR_MS, T0 + 19 * BAR_MS)
+    assert index.gaps() == {"BTCUSDT": [rest]}
+    index.mark_attempts("BTCUSDT", [gap])
+    assert index.gaps() == {}
+    assert index.summary()["unfillable"] == 1 and MAX_ATTEMPTS == 3
+
+def test_verify_is_report_only_unless_rebuild(tmp_path):
+    folder = str(tmp_path)
+    index = IntegrityIndex(folder)
+    bar_store.write(folder, "BTCUSDT", make_bars(range(20)))
+    index.record_write("BTCUSDT", make_bars(range(20)))
+    # File bị sửa ngoài luồng ghi thường (mất giờ 5..6), thêm file chưa có trong chỉ mục
+    bar_store.write(folder, "BTCUSDT", make_bars([h for h in range(20) if h not in (5, 6)]))
+    bar_store.write(folder, "ETHUSDT", make_bars(range(10)))
+    before = index.summary()
+
+    report = index.verify()
+    assert report["gaps"] == {"BTCUSDT": [(T0 + 5 * BAR_MS, T0 + 6 * BAR_MS)], "ETHUSDT": []}
+    assert report["drift"] == ["BTCUSDT", "ETHUSDT"] and report["issues"] == {}
+    assert index.summary() == before and index.gaps() == {}
+
+    report = index.verify(rebuild=True)
+    assert report["drift"] == []
+    assert index.gaps() == {"BTCUSDT": [(T0 + 5 * BAR_MS, T0 + 6 * BAR_MS)]}
+    assert index.verify()["drift"] == []
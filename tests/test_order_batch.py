@@ -0,0 +1,89 @@
+import time
+from stand_ins import FakeHTTP
+from order_batch import place_entries_with_tp_sl, BATCH_LIMIT
+
+# Lô lệnh qua FakeHTTP: lệnh vào được ghi nhận ngay khi sàn nhận, TP/SL của
+# symbol nào khớp trước được gửi trước, lệnh vào / chân bị từ chối chỉ hỏng riêng nó.
+
+class LoggingHTTP(FakeHTTP):
+    def __init__(self, log, **kw):
+        super().__init__(**kw)
+        self.log = log
+
+    def place_batch_order(self, category, request, **kw):
+        kind = "legs" if "triggerPrice" in request[0] else "entries"
+        self.log.append((kind, sorted({r["symbol"] for r in request}), kw.get("recv_window")))
+        return super().place_batch_order(category, request, **kw)
+
+def legs(entry, real_entry):
+    close_side = "Sell" if entry["side"] == "Buy" else "Buy"
+    leg = {"symbol": entry["symbol"], "side": close_side, "orderType": "Market", "qty": f"{entry['qty']}",
+           "reduceOnly": True, "closeOnTrigger": True}
+    return ({**leg, "triggerDirection": 1, "triggerPrice": str(real_entry * 1.08)},
+            {**leg, "triggerDirection": 2, "triggerPrice": str(real_entry * 0.96)})
+
+def entry(symbol):
+    return {"symbol": symbol, "side": "Buy", "qty": 1.0, "entry_price": 2.0}
+
+def run(fake, log, symbols, fill_timeout=5.0):
+    return place_entries_with_tp_sl(fake, [entry(s) for s in symbols], legs, fill_timeout=fill_timeout,
+                                    on_entry=lambda e, oid: log.append(("recorded", e["symbol"], oid)),
+                                    recv_window=60000)
+
+def test_fills_rejected_entry_and_rejected_leg():
+    log = []
+    fake = LoggingHTTP(log)
+    fake.reject = {"CUSDT"}
+    fake.reject_legs = {"DUSDT"}
+    fake.fill_delay = {"BUSDT": 1}
+    t0 = time.monotonic()
+    report = run(fake, log, ["AUSDT", "BUSDT", "CUSDT", "DUSDT"])
+    assert time.monotonic() - t0 < 2.0
+
+    entry_ids = {s: report[s]["entry"] for s in report}
+    assert log == [
+        ("entries", ["AUSDT", "BUSDT", "CUSDT", "DUSDT"], 60000),
+        # Ghi nhận ngay sau khi batch lệnh vào được nhận, trước mọi TP/SL
+        ("recorded", "AUSDT", entry_ids["AUSDT"]),
+        ("recorded", "BUSDT", entry_ids["BUSDT"]),
+        ("recorded", "DUSDT", entry_ids["DUSDT"]),
+        # Vòng hỏi đầu: A, D đã khớp -> gửi TP/SL luôn, không chờ B
+        ("legs", ["AUSDT", "DUSDT"], 60000),
+        ("legs", ["BUSDT"], 60000),
+    ]
+    assert fake.calls["get_order_history"] == 4      # A, B, D rồi B lần nữa
+    assert fake.calls["place_order"] == 2            # thử lại riêng 2 chân của D
+
+    assert report["AUSDT"]["tp"] and report["AUSDT"]["sl"] and not report["AUSDT"]["errors"]
+    assert report["BUSDT"]["fill"] == 1.0 and report["BUSDT"]["tp"] and report["BUSDT"]["sl"]
+    assert report["CUSDT"]["entry"] is None and report["CUSDT"]["tp"] is None
+    assert report["CUSDT"]["errors"][0].startswith("vào lệnh:")
+    assert report["DUSDT"]["entry"] and report["DUSDT"]["tp"] is None and report["DUSDT"]["sl"] is None
+    assert [err[:3] for err in report["DUSDT"]["errors"]] == ["TP:", "SL:"]
+
+    # Mốc thời gian từng lệnh (t1.py log latency entry / fill / tp-sl như khi đặt từng lệnh)
+    a, b = report["AUSDT"], report["BUSDT"]
+    assert a["t_ack"] == b["t_ack"] <= a["t_fill"] <= a["t_legs"] < b["t_fill"] <= b["t_legs"]
+    assert report["CUSDT"]["t_ack"] and report["CUSDT"]["t_fill"] is None
+
+def test_fill_timeout_uses_signal_price():
+    log = []
+    fake = LoggingHTTP(log)
+    fake.fill_delay = {"BUSDT": 1000}
+    report = run(fake, log, ["AUSDT", "BUSDT"], fill_timeout=0.3)
+    assert report["AUSDT"]["fill"] == 1.0
+    assert report["BUSDT"]["fill"] == 2.0 and report["BUSDT"]["tp"] and report["BUSDT"]["sl"]
+    assert [k for k, *_ in log].count("legs") == 2
+
+def test_entries_recorded_when_lookups_and_leg_batch_fail():
+    log = []
+    fake = LoggingHTTP(log)
+    def broken(*args, **kw):
+        raise ConnectionError("reset")
+    fake.get_order_history = broken
+    fake.place_batch_order = lambda category, request, **kw: (
+        FakeHTTP.place_batch_order(fake, category, request, **kw) if "triggerPrice" not in request[0] else broken())
+    symbols = [f"S{i}USDT" for i in range(BATCH_LIMIT + 3)]
+    report = run(fake, log, symbols, fill_timeout=0.2)
+    assert [s for kind, s, _ in log if kind == "recorded"] == symbols
+    assert all(report[s]["entry"] and report[s]["tp"] for s in symbols)   # batch lỗi -> thử lại từng chân
@@ -0,0 +1,43 @@
+import math
+from stand_ins import FakeHTTP
+from order_sync import reconcile, PAGE_LIMIT
+
+# Đối soát theo lô: số lời gọi REST phụ thuộc số trang, không phụ thuộc số lệnh theo dõi
+
+STATUSES = ("Filled", "Cancelled", "Untriggered", "New", "Rejected")
+
+def tracked(n_orders, n_symbols=40):
+    orders, active = {}, {}
+    for i in range(n_orders):
+        sym = f"S{i % n_symbols}USDT"
+        oid = f"o-{i}"
+        orders[oid] = {"symbol": sym, "orderStatus": STATUSES[i % len(STATUSES)], "avgPrice": "1.0"}
+        active.setdefault(sym, []).append(oid)
+    return orders, active
+
+def test_bulk_reconcile_call_counts():
+    n = 300
+    orders, active = tracked(n)
+    fake = FakeHTTP(orders=orders)
+    closed = {}
+    counts = reconcile(fake, active, statuses=closed)
+
+    n_open = sum(1 for o in orders.values() if o["orderStatus"] in ("New", "Untriggered"))
+    assert fake.calls == {
+        "get_order_history": math.ceil(n / PAGE_LIMIT),
+        "get_open_orders": math.ceil(n_open / PAGE_LIMIT),
+    }
+    assert sum(counts.values()) == n_open
+    assert len(closed) == n - n_open
+    assert all(orders[oid]["orderStatus"] in ("New", "Untriggered") for ids in active.values() for oid in ids)
+
+def test_unknown_orders_fall_back_to_per_id_lookup():
+    orders, active = tracked(120)
+    fake = FakeHTTP(orders=orders)
+    # Lệnh không có trong index lô: mỗi lệnh đúng 1 lần tra riêng, trạng thái "Unknown" vẫn được giữ lại
+    active["S0USDT"] += ["gone-1", "gone-2", "gone-3"]
+    closed = {}
+    reconcile(fake, active, statuses=closed)
+    assert fake.calls["get_order_history"] == math.ceil(120 / PAGE_LIMIT) + 3
+    assert fake.calls["get_open_orders"] == math.ceil(48 / PAGE_LIMIT)
+    assert active["S0USDT"][-3:] == ["gone-1", "gone-2", "gone-3"]
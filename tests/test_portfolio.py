@@ -0,0 +1,76 @@
+import math
+import time
+from stand_ins import FakeHTTP
+from portfolio import Portfolio, PAGE_LIMIT, STREAM_TIMEOUT
+
+def position(symbol, side="Buy", size="10", margin="50", idx=0, **kw):
+    return {"symbol": symbol, "side": side, "size": size, "positionValue": "100",
+            "positionIM": margin, "leverage": "2", "positionIdx": idx, **kw}
+
+class FakeWS:
+    def __init__(self):
+        self.callback = None
+        self.connected = True
+
+    def position_stream(self, callback):
+        self.callback = callback
+
+    def is_connected(self):
+        return self.connected
+
+def test_refresh_pages_and_sums_margin():
+    n = 450
+    fake = FakeHTTP(positions=[position(f"S{i}USDT") for i in range(n)] + [position("ZEROUSDT", size="0")])
+    pf = Portfolio(leverage=2)
+    assert pf.refresh(fake) == n
+    assert fake.calls == {"get_positions": math.ceil((n + 1) / PAGE_LIMIT)}
+    assert pf.summary() == {"positions": n, "symbols": n, "total_margin": 50.0 * n}
+
+def test_stream_updates_replace_and_close_positions():
+    pf = Portfolio(leverage=2)
+    pf.refresh(FakeHTTP(positions=[position("BTCUSDT"), position("ETHUSDT", side="Sell", margin="")]))
+    # Không có positionIM: ký quỹ = positionValue / leverage
+    assert pf.by_symbol == {"BTCUSDT": 50.0, "ETHUSDT": 50.0}
+
+    pf.handle({"topic": "position", "data": [position("BTCUSDT", size="20", margin="120")]})
+    pf.handle({"topic": "position", "data": [position("ETHUSDT", side="", size="0")]})
+    pf.handle({"topic": "order", "data": [position("XRPUSDT")]})               # topic khác: bỏ qua
+    pf.handle({"topic": "position", "data": [position("SOLUSDT", category="inverse")]})
+    assert pf.by_symbol == {"BTCUSDT": 120.0}
+    assert pf.total_margin == 120.0
+    assert pf.size("BTCUSDT", "long") == 20.0 and pf.size("BTCUSDT", "short") == 0
+
+def test_reserve_entries_and_can_open():
+    pf = Portfolio(leverage=2)
+    pf.refresh(FakeHTTP(positions=[position("BTCUSDT", margin="100")]))
+    assert pf.entries("BTCUSDT", 50) == 2
+    assert pf.can_open("BTCUSDT", 50, max_entries=2)[0] is False
+    assert pf.can_open("ETHUSDT", 50, max_entries=2) == (True, None)
+
+    pf.reserve("ETHUSDT", "Sell", 5, 50)
+    pf.reserve("ETHUSDT", "Sell", 5, 50)
+    assert pf.entries("ETHUSDT", 50) == 2 and pf.size("ETHUSDT", "short") == -10
+    # Lệnh ngược chiều chỉ giảm size, không cộng ký quỹ
+    pf.reserve("ETHUSDT", "Buy", 4, 50)
+    assert pf.size("ETHUSDT", "short") == -6 and pf.total_margin == 200.0
+
+    ok, reason = pf.can_open("XRPUSDT", 50, max_entries=3, max_total_margin=260, pending=20)
+    assert not ok and "vượt 260" in reason
+    assert pf.can_open("XRPUSDT", 50, max_entries=3, max_total_margin=270, pending=20) == (True, None)
+
+def test_quiet_or_dropped_stream_falls_back_to_rest():
+    pf = Portfolio()
+    assert not pf.is_live()
+    ws = pf.subscribe(FakeWS())
+    pf.refresh(FakeHTTP(positions=[position("BTCUSDT")]))
+    assert pf.is_live()
+
+    # Quá STREAM_TIMEOUT không có tin: coi như cũ, REST snapshot làm mới lại
+    pf.updated = time.time() - STREAM_TIMEOUT - 1
+    assert not pf.is_live()
+    ws.callback({"topic": "position", "data": [position("BTCUSDT", size="5")]})
+    assert pf.is_live()
+
+    # Socket rớt: thôi dùng stream hẳn
+    ws.connected = False
+    assert not pf.is_live() and not pf.live
@@ -0,0 +1,107 @@
+import time
+import asyncio
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from rate_limit import AdaptiveLimiter, ThrottledError
+
+# Server aiohttp giả lập Bybit: trả lần lượt các phản hồi trong script (429,
+# retCode 10006, header X-Bapi-Limit-*), hết script thì trả OK.
+
+def make_app(script, state, max_in_flight=None):
+    # max_in_flight: giả lập giới hạn theo tải -> vượt N request đồng thời thì bị chặn
+    async def kline(request):
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        try:
+            over = max_in_flight is not None and state["in_flight"] > max_in_flight
+            await asyncio.sleep(0.005)
+            state["hits"] += 1
+            state["log"].append(over)
+            kind = ("429" if state["hits"] % 2 else "10006") if over else (script.pop(0) if script else "ok")
+            if kind == "429":
+                return web.Response(status=429, text="Too Many Requests")
+            headers = {"X-Bapi-Limit": "100", "X-Bapi-Limit-Status": "99"}
+            if kind == "10006":
+                if not over:
+                    headers["X-Bapi-Limit-Reset-Timestamp"] = str(int((time.time() + 0.2) * 1000))
+                return web.json_response({"retCode": 10006, "retMsg": "Too many visits!"}, headers=headers)
+            if kind == "low":
+                headers["X-Bapi-Limit-Status"] = "2"
+            return web.json_response({"retCode": 0, "result": {"list": []}}, headers=headers)
+        finally:
+            state["in_flight"] -= 1
+    app = web.Application()
+    app.router.add_get("/v5/market/kline", kline)
+    return app
+
+async def run(limiter, script, n_requests=1, max_in_flight=None):
+    state = {"in_flight": 0, "peak": 0, "hits": 0, "log": []}
+    server = TestServer(make_app(script, state, max_in_flight))
+    await server.start_server()
+    try:
+        url = str(server.make_url("/v5/market/kline"))
+        async with aiohttp.ClientSession() as http:
+            out = await asyncio.gather(*(limiter.get_json(http, url, {"symbol": "BTCUSDT"})
+                                         for _ in range(n_requests)), return_exceptions=True)
+    finally:
+        await server.close()
+    return out, state
+
+def new_limiter(**kw):
+    opts = dict(rate=1000.0, concurrency=8, min_concurrency=2, max_concurrency=16,
+                max_retries=4, base_delay=0.01, max_delay=0.3)
+    opts.update(kw)
+    return AdaptiveLimiter(**opts)
+
+def test_throttle_backs_off_and_shrinks_concurrency():
+    limiter = new_limiter()
+    t0 = time.monotonic()
+    out, state = asyncio.run(run(limiter, ["429", "10006"]))
+    elapsed = time.monotonic() - t0
+    assert out[0]["retCode"] == 0
+    assert limiter.stats["throttles"] == 2 and limiter.stats["retries"] == 2
+    assert limiter.concurrency == 2             # 8 -> 4 -> 2
+    assert limiter.rate == 250.0                # 1000 -> 500 -> 250
+    assert elapsed >= 0.15                      # chờ tới X-Bapi-Limit-Reset-Timestamp
+    assert state["hits"] == 3
+
+def test_gives_up_after_max_retries():
+    limiter = new_limiter(max_retries=2)
+    out, state = asyncio.run(run(limiter, ["429"] * 5))
+    assert isinstance(out[0], ThrottledError)
+    assert state["hits"] == 3
+
+def test_recovers_and_respects_concurrency():
+    limiter = new_limiter(concurrency=2)
+    out, state = asyncio.run(run(limiter, [], n_requests=40))
+    assert all(js["retCode"] == 0 for js in out)
+    assert limiter.concurrency > 2              # tăng cộng sau mỗi chuỗi thành công
+    assert state["peak"] <= limiter.concurrency
+    assert limiter.in_flight == 0
+
+def test_low_remaining_header_slows_down():
+    limiter = new_limiter()
+    asyncio.run(run(limiter, ["low"]))
+    assert limiter.rate == 900.0 and limiter.concurrency == 8
+
+def test_reused_across_event_loops():
+    # limiter toàn cục của u4 được dùng lại qua nhiều asyncio.run
+    limiter = new_limiter()
+    for _ in range(2):
+        out, _ = asyncio.run(run(limiter, [], n_requests=10))
+        assert all(js["retCode"] == 0 for js in out)
+
+def test_settles_at_server_limit_and_stops_throttling():
+    # Server chặn khi quá 6 request đồng thời; limiter bắt đầu ở 16, tối đa 32
+    limit = 6
+    limiter = new_limiter(rate=5000.0, max_rate=10000.0, concurrency=16, max_concurrency=32, max_retries=8)
+    out, state = asyncio.run(run(limiter, [], n_requests=600, max_in_flight=limit))
+    assert all(js["retCode"] == 0 for js in out)
+    assert limiter.concurrency == limit         # dừng đúng ở mức an toàn, không sập về min
+    assert limiter.ceiling == limit + 1
+    # Bị chặn chỉ trong giai đoạn dò đầu tiên, sau đó chạy ổn định ở mức tối đa an toàn
+    log = state["log"]
+    assert sum(log) > 0
+    assert not any(log[len(log) // 3:])
+    assert state["peak"] >= limit
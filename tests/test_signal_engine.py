@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import ta
+import t1
+from signal_engine import stack_right_aligned, batch_signals, rsi, ema, bollinger
+
+# So khớp engine vector hoá với calc_signals (thư viện ta) trên dữ liệu tổng hợp cố định
+
+def synthetic_closes(n_series=400, seed=7):
+    rng = np.random.default_rng(seed)
+    series = []
+    for i in range(n_series):
+        n = int(rng.integers(150, 1200))          # có cả chuỗi ngắn hơn EMA_LEN + 1
+        steps = rng.normal(0, 0.01, n)
+        # Cú giật mạnh ở cuối để có tín hiệu long / short thật
+        if i % 3 == 0:
+            steps[-int(rng.integers(1, 4)):] -= 0.06
+        elif i % 3 == 1:
+            steps[-int(rng.integers(1, 4)):] += 0.06
+        series.append(100 * np.exp(np.cumsum(steps)))
+    return series
+
+def test_indicators_match_ta():
+    closes = synthetic_closes(20)
+    mat = stack_right_aligned(closes)
+    r, e = rsi(mat, t1.RSI_LEN), ema(mat, t1.EMA_LEN)
+    upper, lower = bollinger(mat, t1.BB_LEN, t1.STDDEV)
+    for i, s in enumerate(closes):
+        c = pd.Series(s)
+        k = len(s)
+        bb = ta.volatility.BollingerBands(c, window=t1.BB_LEN, window_dev=t1.STDDEV)
+        np.testing.assert_allclose(r[i, -k:], ta.momentum.RSIIndicator(c, window=t1.RSI_LEN).rsi(), equal_nan=True)
+        np.testing.assert_allclose(e[i, -k:], ta.trend.EMAIndicator(c, window=t1.EMA_LEN).ema_indicator(), equal_nan=True)
+        np.testing.assert_allclose(upper[i, -k:], bb.bollinger_hband(), equal_nan=True)
+        np.testing.assert_allclose(lower[i, -k:], bb.bollinger_lband(), equal_nan=True)
+
+def test_batch_signals_match_calc_signals():
+    closes = synthetic_closes()
+    got = batch_signals(stack_right_aligned(closes), **t1.STRATEGY_PARAMS)
+    want = [t1.calc_signals(pd.DataFrame({"close": s})) for s in closes]
+    assert got == want
+    # Dữ liệu phải thực sự sinh tín hiệu cả hai chiều thì phép so mới có ý nghĩa
+    assert "long" in want and "short" in want and None in want
@@ -0,0 +1,13 @@
+import itertools
+from sweep import GRID, build_tasks
+
+def test_tasks_split_for_all_workers():
+    n_combos = len(list(itertools.product(*GRID.values())))
+    for workers in (1, 8, 32):
+        tasks = build_tasks(GRID, workers)
+        assert len(tasks) >= min(workers * 4, n_combos) - 4
+        assert sum(len(combos) for _, combos in tasks) == n_combos
+        # Mỗi task chỉ chứa một bộ chỉ báo; các task cùng bộ đứng liền nhau
+        inds = [tuple(ind.values()) for ind, _ in tasks]
+        assert len(set(inds)) == 4
+        assert [k for k, _ in itertools.groupby(inds)] == list(dict.fromkeys(inds))
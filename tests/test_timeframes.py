@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import bar_store
+import timeframes
+from conftest import make_bars
+
+@pytest.fixture
+def subscriptions(monkeypatch):
+    monkeypatch.setattr(timeframes, "DERIVED", [])
+    monkeypatch.setattr(timeframes, "SUBSCRIPTIONS", [])
+    return timeframes.SUBSCRIPTIONS
+
+def test_only_subscribed_timeframes_are_derived(tmp_path, subscriptions):
+    folder = str(tmp_path)
+    bar_store.write(folder, "BTCUSDT", make_bars(48))
+    assert timeframes.update(folder, "BTCUSDT") == {}
+    assert not bar_store.exists(folder, "BTCUSDT", "4h")
+
+    fn = lambda df: None
+    timeframes.subscribe("4h", fn)
+    timeframes.subscribe("4h", fn, last=100)      # đăng ký lại không tạo bản trùng
+    assert subscriptions == [("4h", fn, 100)]
+    assert timeframes.update(folder, "BTCUSDT") == {"4h": 12}
+    assert [tf for tf in timeframes.ALL_DERIVED if bar_store.exists(folder, "BTCUSDT", tf)] == ["4h"]
+
+    timeframes.remove(folder, "BTCUSDT")
+    assert not bar_store.exists(folder, "BTCUSDT", "4h")
+
+def test_incremental_update_matches_full_resample(tmp_path, subscriptions):
+    folder = str(tmp_path)
+    full = make_bars(50)
+    bar_store.write(folder, "BTCUSDT", full[:45])
+    timeframes.update(folder, "BTCUSDT", ["4h"])
+    bar_store.append(folder, "BTCUSDT", full[45:])
+    timeframes.update(folder, "BTCUSDT", ["4h"])
+    np.testing.assert_array_equal(bar_store.read(folder, "BTCUSDT", tf="4h"), timeframes.resample(full, "4h"))
@@ -0,0 +1,37 @@
+import time
+import universe
+
+def cache(age, **tables):
+    return {"updated": time.time() - age, **tables}
+
+def test_plan_and_refresh_for_missing_symbols():
+    old = cache(3600, linear={"BTCUSDT": {"status": "Trading"}, "LUNAUSDT": {"status": "Closed"}})
+    contracts = ["BTCUSDT", "LUNAUSDT", "NEWUSDT"]
+    plan = universe.plan(contracts, old)
+    assert plan == {"active": ["BTCUSDT"], "inactive": ["LUNAUSDT"], "delisted": ["NEWUSDT"]}
+    # NEWUSDT có thể vừa niêm yết sau lần làm mới cache: phải làm mới trước khi bỏ qua
+    assert universe.needs_refresh(plan, old)
+
+    fresh = cache(5, linear={**old["linear"], "NEWUSDT": {"status": "Trading"}})
+    plan = universe.plan(contracts, fresh)
+    assert plan["active"] == ["BTCUSDT", "NEWUSDT"] and not universe.needs_refresh(plan, fresh)
+
+    # Vừa làm mới mà vẫn không có: đúng là delist, không làm mới lại mỗi lượt
+    plan = universe.plan(contracts + ["GONEUSDT"], fresh)
+    assert plan["delisted"] == ["GONEUSDT"] and not universe.needs_refresh(plan, fresh)
+
+def test_known_missing_symbol_does_not_refresh_every_run(tmp_path):
+    path = str(tmp_path / "universe.json")
+    universe.save_state({"digest": "x", "symbols": ["BTCUSDT", "GONEUSDT"]}, path)
+    # Lượt này: làm mới bắt buộc xong GONEUSDT vẫn thiếu -> ghi nhận là đã delist
+    universe.remember_missing(["GONEUSDT"], path)
+    state = universe.load_state(path)
+    assert state["missing"] == ["GONEUSDT"] and state["digest"] == "x"
+
+    # Lượt sau (1h): cache đã cũ hơn MISSING_REFRESH_AGE nhưng không có symbol thiếu mới
+    hour_later = cache(3600, linear={"BTCUSDT": {"status": "Trading"}})
+    plan = universe.plan(["BTCUSDT", "GONEUSDT"], hour_later)
+    assert not universe.needs_refresh(plan, hour_later, state["missing"])
+    # Có symbol thiếu mới thì vẫn làm mới
+    plan = universe.plan(["BTCUSDT", "GONEUSDT", "NEWUSDT"], hour_later)
+    assert universe.needs_refresh(plan, hour_later, state["missing"])
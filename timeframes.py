@@ -0,0 +1,135 @@
+import os
+import logging
+import numpy as np
+import bar_store
+
+# Khung thời gian lớn (2h/4h/12h/1d) dựng từ chuỗi 1h đã lưu, không gọi thêm API.
+# Mỗi khung là một file {symbol}_{tf}.bars trong cùng kho nến; khi có nến 1h mới
+# chỉ đọc phần đuôi 1h kể từ đầu nến khung lớn cuối cùng và ghi đè đúng nến đó
+# (cộng các nến mới nếu sang khung mới), không quét lại cả file.
+# Nến cuối của khung lớn có thể đang hình thành; read(..., closed_only=True) bỏ nó đi.
+
+BAR_MS = 3600 * 1000
+TF_HOURS = {"1h": 1, "2h": 2, "4h": 4, "12h": 12, "1d": 24}
+# Chỉ dựng các khung có người dùng: DERIVED_TIMEFRAMES (mặc định = EXTRA_TIMEFRAMES của
+# t1.py, để u4.py chạy process riêng vẫn biết) cộng các khung đã subscribe trong process
+DERIVED = [tf for tf in os.getenv("DERIVED_TIMEFRAMES", os.getenv("EXTRA_TIMEFRAMES", "")).split(",") if tf]
+ALL_DERIVED = [tf for tf in TF_HOURS if tf != "1h"]
+MAX_BARS = 1200
+TRIM_SLACK = 1.5
+
+def tf_ms(tf):
+    return TF_HOURS[tf] * BAR_MS
+
+# ==== GỘP NẾN ====
+def resample(bars, tf):
+    # bars 1h tăng dần theo ts -> nến khung tf, ts = đầu khung (căn theo UTC)
+    ms = tf_ms(tf)
+    if len(bars) == 0:
+        return np.empty(0, dtype=bar_store.BAR_DTYPE)
+    bucket = np.asarray(bars["ts"]) // ms
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bars)] - 1
+    out = np.empty(len(starts), dtype=bar_store.BAR_DTYPE)
+    out["ts"] = bucket[starts] * ms
+    out["open"] = bars["open"][starts]
+    out["high"] = np.maximum.reduceat(np.asarray(bars["high"]), starts)
+    out["low"] = np.minimum.reduceat(np.asarray(bars["low"]), starts)
+    out["close"] = bars["close"][ends]
+    return out
+
+# ==== CẬP NHẬT KHUNG LỚN TỪ KHO 1h ====
+def update(folder, symbol, tfs=None, max_bars=MAX_BARS, since=None):
+    # Trả về dict tf -> số nến khung lớn đã ghi (gồm cả nến đang hình thành được ghi đè).
+    # since: ts nến 1h sớm nhất vừa thay đổi (lấp gap) -> gộp lại từ khung chứa nến đó
+    tfs = active() if tfs is None else tfs
+    written = {}
+    if not tfs:
+        return written
+    last_1h = bar_store.last_ts(folder, symbol)
+    if last_1h is None:
+        return written
+    for tf in tfs:
+        prev = bar_store.last_ts(folder, symbol, tf)
+        if prev is None or prev > last_1h:
+            # Chưa có file, hoặc kho 1h vừa được dựng lại: gộp toàn bộ một lần
+            written[tf] = bar_store.write(folder, symbol, resample(bar_store.read(folder, symbol), tf), tf)
+            continue
+        if since is not None:
+            prev = min(prev, since - since % tf_ms(tf))
+        # Chỉ cần các nến 1h từ đầu nến khung lớn cuối cùng trở đi
+        tail = bar_store.read(folder, symbol, last=(last_1h - prev) // BAR_MS + 1)
+        tail = tail[tail["ts"] >= prev]
+        written[tf] = bar_store.replace_tail(folder, symbol, resample(tail, tf), tf)
+        if bar_store.count(folder, symbol, tf) > max_bars * TRIM_SLACK:
+            bar_store.trim(folder, symbol, max_bars, tf)
+    return written
+
+def remove(folder, symbol, tfs=None):
+    # Mặc định xoá mọi khung lớn, kể cả khung trước đây có dựng nhưng nay không còn ai dùng
+    for tf in (ALL_DERIVED if tfs is None else tfs):
+        bar_store.remove(folder, symbol, tf)
+
+# ==== ĐỌC ====
+def is_closed(bar_ts, last_1h_ts, tf):
+    # Nến khung lớn đã đóng khi đã có nến 1h cuối cùng của khung đó
+    return last_1h_ts is not None and last_1h_ts >= bar_ts + tf_ms(tf) - BAR_MS
+
+def read(folder, symbol, tf, last=None, closed_only=True):
+    if tf == "1h":
+        return bar_store.read(folder, symbol, last=last)
+    extra = 1 if closed_only and last is not None else 0
+    bars = bar_store.read(folder, symbol, last=None if last is None else last + extra, tf=tf)
+    if closed_only and len(bars) and not is_closed(int(bars["ts"][-1]), bar_store.last_ts(folder, symbol), tf):
+        bars = bars[:-1]
+    if last is not None and len(bars) > last:
+        bars = bars[-last:]
+    return bars
+
+def just_closed(folder, symbol, tf):
+    # True nếu nến 1h mới nhất vừa đóng một nến khung tf (đánh giá mỗi nến khung lớn đúng một lần)
+    last_1h = bar_store.last_ts(folder, symbol)
+    return last_1h is not None and (last_1h + BAR_MS) % tf_ms(tf) == 0
+
+# ==== ĐĂNG KÝ CHIẾN LƯỢC THEO KHUNG ====
+SUBSCRIPTIONS = []   # list (tf, fn, last): fn(df) -> "long" / "short" / None như calc_signals
+
+def subscribe(tf, fn, last=MAX_BARS):
+    # Đăng ký lại cùng (tf, fn) chỉ cập nhật `last` (t1.main gọi mỗi lượt trong daemon)
+    if tf not in TF_HOURS:
+        raise ValueError(f"Khung thời gian không hỗ trợ: {tf}")
+    for i, (t, f, _) in enumerate(SUBSCRIPTIONS):
+        if t == tf and f is fn:
+            SUBSCRIPTIONS[i] = (tf, fn, last)
+            return fn
+    SUBSCRIPTIONS.append((tf, fn, last))
+    return fn
+
+def active():
+    # Các khung cần dựng sau mỗi lần ghi nến 1h
+    tfs = list(DERIVED)
+    for tf, _, _ in SUBSCRIPTIONS:
+        if tf != "1h" and tf not in tfs:
+            tfs.append(tf)
+    return tfs
+
+def evaluate(folder, symbols, subscriptions=None):
+    # Trả về dict symbol -> hướng lệnh từ chiến lược khung lớn đầu tiên có tín hiệu.
+    # Chỉ đánh giá symbol vừa đóng nến ở khung đó, trên các nến đã đóng.
+    subscriptions = SUBSCRIPTIONS if subscriptions is None else subscriptions
+    out = {}
+    for tf, fn, last in subscriptions:
+        for symbol in symbols:
+            if symbol in out or not just_closed(folder, symbol, tf):
+                continue
+            try:
+                bars = read(folder, symbol, tf, last=last)
+                if len(bars) == 0:
+                    continue
+                direction = fn(bar_store.to_frame(bars))
+            except Exception as e:
+                logging.warning(f"[TF] Lỗi đánh giá {symbol} {tf}: {e}")
+                continue
+            if direction:
+                out[symbol] = direction
+    return out
@@ -5,40 +5,32 @@ if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 import os
+import time
 import aiohttp
-import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta, timezone
+from indicator_state import mark_resync
+import bar_store
+import instruments
+import metrics
+import timeframes
+import universe
+import integrity
+from rate_limit import AdaptiveLimiter
 
 # ==== CẤU HÌNH ====
 contracts_file = "capcoin.csv"
 data_folder = "/data/Data1200bar"
 interval = "60"  # nến 1h
 batch_limit = 200
-sem_limit = 30   # Tăng đồng thời, tuỳ Bybit limit (thử 30, test, có thể lên 50)
+sem_limit = 30   # số request đồng thời ban đầu, AdaptiveLimiter tự tăng/giảm theo phản hồi của Bybit
+max_concurrency = 64
 MAX_BARS = 1200
-
-# ==== HỖ TRỢ LẤY LIST SYMBOL VỚI PAGINATION ====
-async def fetch_instrument_set(session, category):
-    url = "https://api.bybit.com/v5/market/instruments-info"
-    cursor = None
-    symbols = set()
-    while True:
-        params = {"category": category, "limit": 200}
-        if cursor:
-            params["cursor"] = cursor
-        async with session.get(url, params=params) as resp:
-            js = await resp.json()
-        lst = js["result"].get("list", [])
-        symbols |= {item["symbol"] for item in lst}
-        cursor = js["result"].get("nextPageCursor")
-        if not cursor:
-            break
-    return symbols
-
-async def fetch_symbol_lists(session):
-    linear_set = await fetch_instrument_set(session, "linear")
-    spot_set = await fetch_instrument_set(session, "spot")
-    return linear_set, spot_set
+trim_slack = 1.5   # chỉ cắt file về MAX_BARS khi vượt quá 1.5 × MAX_BARS (ghi thêm là append)
+resync_file = "/data/indicator_resync.json"  # báo t1.py tính lại chỉ báo cho symbol backfill / có gap
+max_repair_bars = 2000   # tối đa số nến lấp gap cho mỗi symbol mỗi lượt
+universe_file = "/data/universe.json"   # capcoin.csv lần trước, chỉ dọn kho khi danh sách đổi
+derived_tfs = None   # khung lớn dựng từ nến 1h sau mỗi lần ghi; None: timeframes.active() (khung đang có người dùng)
 
 # ==== HỖ TRỢ LẤY OHLC BATCH ====
 async def fetch_ohlc(session, symbol, category, start_ms, end_ms):
@@ -51,18 +43,36 @@ async def fetch_ohlc(session, symbol, category, start_ms, end_ms):
         "start": start_ms,
         "end": end_ms,
     }
-    async with session.get(url, params=params) as resp:
-        js = await resp.json()
-    rows = js["result"].get("list", [])
+    js = await limiter.get_json(session, url, params)
+    return parse_klines(js["result"].get("list", []))
+
+def parse_klines(rows):
+    # Giải mã thẳng list [ts, open, high, low, close, ...] (chuỗi, mới nhất trước)
+    # vào mảng bản ghi của bar_store, tăng dần theo ts, không qua DataFrame
+    bars = np.empty(len(rows), dtype=bar_store.BAR_DTYPE)
     if not rows:
-        return pd.DataFrame()
-    df = pd.DataFrame(rows).iloc[:, :5]
-    df.columns = ["timestamp", "open", "high", "low", "close"]
-    # Fix FutureWarning: ép timestamp về numeric trước khi to_datetime
-    df["timestamp"] = pd.to_datetime(pd.to_numeric(df["timestamp"]), unit="ms", utc=True)
-    for col in ["open", "high", "low", "close"]:
-        df[col] = df[col].astype(float)
-    return df
+        return bars
+    arr = np.array([r[:5] for r in rows], dtype=np.float64)[::-1]
+    bars["ts"] = arr[:, 0].astype(np.int64)
+    bars["open"] = arr[:, 1]
+    bars["high"] = arr[:, 2]
+    bars["low"] = arr[:, 3]
+    bars["close"] = arr[:, 4]
+    return bars
+
+def merge_batches(parts, after_ms=None):
+    # Ghép các batch đã tăng dần theo thứ tự lấy về vào một mảng cấp phát sẵn,
+    # chỉ bỏ nến <= nến cuối đã ghép (không cần dedup / sort lại)
+    out = np.empty(sum(len(p) for p in parts), dtype=bar_store.BAR_DTYPE)
+    n = 0
+    last = after_ms if after_ms is not None else np.iinfo(np.int64).min
+    for p in parts:
+        p = p[p["ts"] > last]
+        out[n:n + len(p)] = p
+        n += len(p)
+        if len(p):
+            last = p["ts"][-1]
+    return out[:n]
 
 # ==== HỖ TRỢ BACKFILL CHỈ LẤY 1200 NẾN CUỐI ====
 async def fetch_full_history(session, symbol, category, last_closed):
@@ -71,29 +81,25 @@ async def fetch_full_history(session, symbol, category, last_closed):
     start_ts = int(start_time.timestamp() * 1000)
     end_ts = int(last_closed.timestamp() * 1000)
     total = 0
-    while start_ts < end_ts and total < MAX_BARS:
-        fetch_end_ts = min(end_ts, start_ts + batch_limit * 3600 * 1000)
-        dfp = await fetch_ohlc(session, symbol, category, start_ts, fetch_end_ts)
-        if dfp.empty:
+    while start_ts <= end_ts and total < MAX_BARS:
+        # Hai đầu đều tính: batch_limit nến là batch_limit - 1 giờ (sàn chỉ trả batch_limit nến mới nhất)
+        fetch_end_ts = min(end_ts, start_ts + (batch_limit - 1) * 3600 * 1000)
+        bars = await fetch_ohlc(session, symbol, category, start_ts, fetch_end_ts)
+        if len(bars) == 0:
             break
-        parts.append(dfp)
-        count = len(dfp)
+        parts.append(bars)
+        count = len(bars)
         total += count
-        start_ts = int(dfp["timestamp"].max().timestamp() * 1000) + 3600 * 1000
+        start_ts = int(bars["ts"][-1]) + 3600 * 1000
         if count < batch_limit:
             break
-    if not parts:
-        return pd.DataFrame()
-    full = pd.concat(parts, ignore_index=True).drop_duplicates("timestamp")
-    full = full.sort_values("timestamp").reset_index(drop=True)
-    if len(full) > MAX_BARS:
-        full = full.iloc[-MAX_BARS:]
-    full["timestamp"] = full["timestamp"].dt.tz_localize(None)
-    return full
+    full = merge_batches(parts)
+    return full[-MAX_BARS:]
 
 # ==== XỬ LÝ 1 SYMBOL (LOG GỌN, BÁO LỖI 1 LẦN) ====
 async def process_symbol(symbol, linear_set, spot_set, last_closed, session, sem, summary):
     async with sem:
+        t0 = time.perf_counter()
         try:
             if symbol in linear_set:
                 category = "linear"
@@ -102,55 +108,50 @@ async def process_symbol(symbol, linear_set, spot_set, last_closed, session, sem
             else:
                 category = "linear"
 
-            fp = os.path.join(data_folder, f"{symbol}_1h.csv")
-
             # Full backfill nếu chưa có file
-            if not os.path.exists(fp):
-                df_full = await fetch_full_history(session, symbol, category, last_closed)
-                if df_full.empty and category == "linear":
-                    df_full = await fetch_full_history(session, symbol, "spot", last_closed)
+            if not bar_store.exists(data_folder, symbol):
+                bars_full = await fetch_full_history(session, symbol, category, last_closed)
+                if len(bars_full) == 0 and category == "linear":
+                    bars_full = await fetch_full_history(session, symbol, "spot", last_closed)
                     category_used = "spot"
                 else:
                     category_used = category
-                if df_full.empty:
+                if len(bars_full) == 0:
                     summary["error"].add(f"{symbol}: No data for both categories")
                 else:
                     os.makedirs(data_folder, exist_ok=True)
-                    if len(df_full) > MAX_BARS:
-                        df_full = df_full.iloc[-MAX_BARS:]
-                    df_full.to_csv(fp, index=False)
+                    with bar_store.symbol_lock(data_folder, symbol):
+                        bar_store.write(data_folder, symbol, bars_full)
+                        integrity.get_index(data_folder).record_write(symbol, bars_full)
+                        timeframes.update(data_folder, symbol, derived_tfs, MAX_BARS)
                     summary["updated"] += 1
+                    summary["resync"].add(symbol)
                 return
 
-            # incremental update
-            df_old = pd.read_csv(fp)
-            df_old = df_old.iloc[:, :5]
-            df_old.columns = ["timestamp", "open", "high", "low", "close"]
-            df_old["timestamp"] = pd.to_datetime(df_old["timestamp"], utc=True)
+            # incremental update: chỉ đọc timestamp nến cuối, không đọc cả file
+            last_ms = bar_store.last_ts(data_folder, symbol)
 
-            if df_old.empty:
-                df_full = await fetch_full_history(session, symbol, category, last_closed)
-                if df_full.empty and category == "linear":
-                    df_full = await fetch_full_history(session, symbol, "spot", last_closed)
+            if last_ms is None:
+                bars_full = await fetch_full_history(session, symbol, category, last_closed)
+                if len(bars_full) == 0 and category == "linear":
+                    bars_full = await fetch_full_history(session, symbol, "spot", last_closed)
                     category_used = "spot"
                 else:
                     category_used = category
-                if df_full.empty:
+                if len(bars_full) == 0:
                     summary["error"].add(f"{symbol}: No data on retry")
                 else:
-                    if len(df_full) > MAX_BARS:
-                        df_full = df_full.iloc[-MAX_BARS:]
-                    df_full.to_csv(fp, index=False)
+                    with bar_store.symbol_lock(data_folder, symbol):
+                        bar_store.write(data_folder, symbol, bars_full)
+                        integrity.get_index(data_folder).record_write(symbol, bars_full)
+                        timeframes.update(data_folder, symbol, derived_tfs, MAX_BARS)
                     summary["updated"] += 1
+                    summary["resync"].add(symbol)
                 return
 
-            last_ts = df_old["timestamp"].max().to_pydatetime().replace(tzinfo=timezone.utc)
+            last_ts = datetime.fromtimestamp(last_ms / 1000, tz=timezone.utc)
             since = last_ts + timedelta(hours=1)
             if since > last_closed:
-                df_old["timestamp"] = df_old["timestamp"].dt.tz_localize(None)
-                if len(df_old) > MAX_BARS:
-                    df_old = df_old.iloc[-MAX_BARS:]
-                df_old.to_csv(fp, index=False)
                 summary["unchanged"] += 1
                 return
 
@@ -158,70 +159,210 @@ async def process_symbol(symbol, linear_set, spot_set, last_closed, session, sem
             current = since
             while current <= last_closed:
                 start_ms = int(current.timestamp() * 1000)
-                end_time = min(current + timedelta(hours=batch_limit), last_closed)
+                end_time = min(current + timedelta(hours=batch_limit - 1), last_closed)
                 end_ms = int(end_time.timestamp() * 1000)
-                dfp = await fetch_ohlc(session, symbol, category, start_ms, end_ms)
-                if dfp.empty:
+                bars = await fetch_ohlc(session, symbol, category, start_ms, end_ms)
+                if len(bars) == 0:
                     break
-                parts_new.append(dfp)
-                current = end_time + timedelta(milliseconds=1)
+                parts_new.append(bars)
+                current = end_time + timedelta(hours=1)
 
             if parts_new:
-                df_new = pd.concat(parts_new, ignore_index=True)
-                df_combined = pd.concat([df_old, df_new], ignore_index=True)
-                df_combined = (
-                    df_combined.drop_duplicates("timestamp")
-                    .sort_values("timestamp")
-                    .reset_index(drop=True)
-                )
-                if len(df_combined) > MAX_BARS:
-                    df_combined = df_combined.iloc[-MAX_BARS:]
-                df_combined["timestamp"] = df_combined["timestamp"].dt.tz_localize(None)
-                df_combined.to_csv(fp, index=False)
+                new_bars = merge_batches(parts_new, after_ms=last_ms)
+                if len(new_bars) == 0:
+                    summary["unchanged"] += 1
+                    return
+                expected = last_ms + 3600 * 1000 * np.arange(1, len(new_bars) + 1)
+                if not np.array_equal(new_bars["ts"], expected):
+                    summary["resync"].add(symbol)
+                index = integrity.get_index(data_folder)
+                with bar_store.symbol_lock(data_folder, symbol):
+                    # bar_stream có thể đã append nến trong lúc chờ REST: chỉ ghi phần mới hơn
+                    prev_ms = bar_store.last_ts(data_folder, symbol)
+                    if prev_ms is not None:
+                        new_bars = new_bars[new_bars["ts"] > prev_ms]
+                    if len(new_bars):
+                        bar_store.append(data_folder, symbol, new_bars)
+                        n_bars = bar_store.count(data_folder, symbol)
+                        index.record_append(symbol, new_bars, prev_ms, n_bars)
+                        if n_bars > MAX_BARS * trim_slack:
+                            bar_store.trim(data_folder, symbol, MAX_BARS)
+                            kept = bar_store.read(data_folder, symbol)
+                            index.record_trim(symbol, int(kept["ts"][0]), int(kept["ts"][-1]), len(kept))
+                        timeframes.update(data_folder, symbol, derived_tfs, MAX_BARS)
                 summary["updated"] += 1
             else:
                 summary["unchanged"] += 1
 
         except Exception as e:
             summary["error"].add(f"{symbol}: {str(e)}")
+        finally:
+            metrics.observe("stage_seconds", time.perf_counter() - t0, stage="u4_symbol")
+
+# ==== LẤP GAP ĐÃ GHI TRONG CHỈ MỤC (chỉ tải đúng các giờ bị thiếu) ====
+async def repair_symbol(session, symbol, ranges, category, summary):
+    index = integrity.get_index(data_folder)
+    parts, tried, budget = [], [], max_repair_bars
+    try:
+        for start, end in ranges:
+            if budget <= 0:
+                break
+            tried.append((start, end))
+            current = start
+            while current <= end and budget > 0:
+                chunk_end = min(end, current + (batch_limit - 1) * 3600 * 1000)
+                bars = await fetch_ohlc(session, symbol, category, current, chunk_end)
+                parts.append(bars[(bars["ts"] >= current) & (bars["ts"] <= chunk_end)])
+                budget -= (chunk_end - current) // (3600 * 1000) + 1
+                current = chunk_end + 3600 * 1000
+        fetched = np.concatenate(parts) if parts else np.empty(0, dtype=bar_store.BAR_DTYPE)
+        if len(fetched):
+            with bar_store.symbol_lock(data_folder, symbol):
+                merged = integrity.merge_bars(bar_store.read(data_folder, symbol), fetched)
+                bar_store.write(data_folder, symbol, merged)
+                index.record_write(symbol, merged)
+                timeframes.update(data_folder, symbol, derived_tfs, MAX_BARS, since=int(fetched["ts"][0]))
+            summary["repaired"] += len(fetched)
+            summary["resync"].add(symbol)
+        # Gap nào vẫn còn giao với khoảng vừa thử bị tính thêm một lần (quá MAX_ATTEMPTS thì bỏ)
+        index.mark_attempts(symbol, tried)
+    except Exception as e:
+        summary["error"].add(f"{symbol}: lấp gap lỗi: {str(e)}")
+
+async def repair_gaps(session, symbols, linear_set, spot_set, summary):
+    gaps = integrity.get_index(data_folder).gaps(symbols)
+    if not gaps:
+        return 0
+    tasks = [
+        repair_symbol(session, sym, ranges, "spot" if sym in spot_set and sym not in linear_set else "linear", summary)
+        for sym, ranges in gaps.items()
+    ]
+    await asyncio.gather(*tasks)
+    return len(gaps)
+
+async def repair_main():
+    # python integrity.py repair: chỉ lấp gap, không lấy nến mới
+    global limiter
+    if limiter is None:
+        limiter = AdaptiveLimiter(concurrency=sem_limit, max_concurrency=max_concurrency)
+    summary = {"repaired": 0, "error": set(), "resync": set()}
+    async with open_session() as session:
+        cache = await instruments.get_instruments_async(session)
+        n = await repair_gaps(session, None, set(cache.get("linear", {})), set(cache.get("spot", {})), summary)
+    mark_resync(resync_file, summary["resync"])
+    print(f"Lấp gap: {n} symbol, {summary['repaired']} nến, {len(summary['error'])} lỗi")
+    for err in summary["error"]:
+        print("  ", err)
+    return summary
 
 # ==== MAIN ====
-async def main():
-    os.makedirs(data_folder, exist_ok=True)
-    now_utc = datetime.now(timezone.utc)
-    last_closed = now_utc.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+def open_session():
+    # Phải gọi bên trong event loop sẽ dùng session (worker daemon giữ session này giữa các lần chạy)
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    return aiohttp.ClientSession(connector=connector)
 
-    with open(contracts_file, "r") as f:
-        symbols = [line.strip() for line in f if line.strip()]
+limiter = None   # giữ lại giữa các lần chạy trong worker daemon (nhớ tốc độ đã học)
 
-    existing = {fn[:-4] for fn in os.listdir(data_folder) if fn.endswith("_1h.csv")}
-    to_remove = existing - set(symbols)
+# ==== DỌN KHO KHI capcoin.csv ĐỔI ====
+def sync_store(contracts):
+    state = universe.load_state(universe_file)
+    added, removed, changed = universe.changes(contracts, state)
+    if not changed:
+        return
+    # Chuyển file CSV cũ (nếu có) sang kho .bars một lần
+    n_imported = bar_store.import_legacy_csv(data_folder)
+    if n_imported:
+        print(f"Đã chuyển {n_imported} file CSV cũ sang .bars")
+    to_remove = universe.stale_files(data_folder, contracts)
     for sym in to_remove:
         try:
-            os.remove(os.path.join(data_folder, f"{sym}_1h.csv"))
+            with bar_store.symbol_lock(data_folder, sym):
+                bar_store.remove(data_folder, sym)
+                timeframes.remove(data_folder, sym, derived_tfs)
+                integrity.get_index(data_folder).remove(sym)
         except:
             pass
+    universe.save_state({**state, "digest": universe.digest(contracts), "symbols": contracts}, universe_file)
+    print(f"capcoin.csv thay đổi: thêm {len(added)}, bỏ {len(removed)}, xoá {len(to_remove)} file thừa")
 
-    connector = aiohttp.TCPConnector(limit=sem_limit)
-    sem = asyncio.Semaphore(sem_limit)
-    summary = {"updated": 0, "unchanged": 0, "error": set()}
-    async with aiohttp.ClientSession(connector=connector) as session:
-        linear_set, spot_set = await fetch_symbol_lists(session)
-        tasks = [
-            process_symbol(sym, linear_set, spot_set, last_closed, session, sem, summary)
-            for sym in symbols
-        ]
+async def run(session, only_symbols=None, shard=None):
+    # only_symbols: chỉ lấp dữ liệu cho các symbol này (bar_stream dùng khi phát hiện gap)
+    # shard: (i, n) -> process này chỉ xử lý các symbol có crc32 % n == i
+    global limiter
+    if limiter is None:
+        n_shards = shard[1] if shard else 1
+        # Các shard dùng chung giới hạn theo IP của Bybit: chia đều tốc độ / số request đồng thời
+        limiter = AdaptiveLimiter(rate=100.0 / n_shards, max_rate=120.0 / n_shards,
+                                  concurrency=max(2, sem_limit // n_shards),
+                                  max_concurrency=max(2, max_concurrency // n_shards))
+    limiter.reset_stats()
+    os.makedirs(data_folder, exist_ok=True)
+    now_utc = datetime.now(timezone.utc)
+    last_closed = now_utc.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+
+    contracts = universe.load_contracts(contracts_file)
+    with metrics.stage("u4_symbol_list"):
+        cache = await instruments.get_instruments_async(session)
+        plan = universe.plan(contracts, cache)
+        known_missing = universe.load_state(universe_file).get("missing", [])
+        if universe.needs_refresh(plan, cache, known_missing):
+            cache = await instruments.get_instruments_async(session, force=True)
+            plan = universe.plan(contracts, cache)
+            known_missing = plan["delisted"]
+        else:
+            # Symbol đã niêm yết lại / bỏ khỏi capcoin.csv thì không còn tính là đã biết thiếu
+            delisted = set(plan["delisted"])
+            known_missing = [sym for sym in known_missing if sym in delisted]
+        universe.remember_missing(known_missing, universe_file)
+    linear_set, spot_set = set(cache.get("linear", {})), set(cache.get("spot", {}))
+    symbols = plan["active"]
+    if only_symbols is not None:
+        symbols = [sym for sym in symbols if sym in set(only_symbols)]
+    elif shard is None or shard[0] == 0:
+        sync_store(contracts)
+    if plan["inactive"] or plan["delisted"]:
+        print(f"Bỏ qua {len(plan['inactive'])} symbol không Trading, {len(plan['delisted'])} symbol đã delist")
+    if shard:
+        symbols = universe.shard(symbols, *shard)
+
+    sem = asyncio.Semaphore(max_concurrency)
+    summary = {"updated": 0, "unchanged": 0, "repaired": 0, "error": set(), "resync": set()}
+    # Symbol đã có nến đã đóng gần nhất thì không cần lên lịch
+    pending = universe.due(data_folder, symbols, int(last_closed.timestamp() * 1000))
+    summary["unchanged"] = len(symbols) - len(pending)
+    tasks = [
+        process_symbol(sym, linear_set, spot_set, last_closed, session, sem, summary)
+        for sym in pending
+    ]
+    with metrics.stage("u4_fetch"):
         await asyncio.gather(*tasks)
+    with metrics.stage("u4_repair"):
+        n_repair = await repair_gaps(session, symbols, linear_set, spot_set, summary)
+    mark_resync(resync_file, summary["resync"])
 
     print(f"=== Tổng kết: ===")
     print(f"Số symbol cập nhật mới: {summary['updated']}")
     print(f"Số symbol đã đủ data, không cần update: {summary['unchanged']}")
+    if n_repair:
+        print(f"Lấp gap: {n_repair} symbol, {summary['repaired']} nến")
+    st = limiter.summary()
+    print(f"Request: {st['requests']}, thử lại: {st['retries']}, bị giới hạn: {st['throttles']}, "
+          f"p50 {st['p50_ms']}ms, p99 {st['p99_ms']}ms, tốc độ {st['rate']}/s, đồng thời {st['concurrency']}")
     if summary["error"]:
         print("Các lỗi gặp phải (mỗi lỗi chỉ báo 1 lần):")
         for err in summary["error"]:
             print("  ", err)
     else:
         print("Không gặp lỗi nào.")
+    summary["limiter"] = st
+    return summary
+
+async def main(only_symbols=None, shard=None):
+    async with open_session() as session:
+        return await run(session, only_symbols, shard)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # python u4.py [--shard i/n]
+    shard = universe.parse_shard(sys.argv[sys.argv.index("--shard") + 1]) if "--shard" in sys.argv else None
+    asyncio.run(main(shard=shard))
+    metrics.dump(job="u4")
@@ -0,0 +1,122 @@
+import os
+import json
+import zlib
+import time
+import hashlib
+import bar_store
+
+# Quản lý danh sách symbol cho u4.py: đối chiếu capcoin.csv với danh sách
+# instrument của sàn (bỏ symbol đã delist / không còn Trading), chỉ dọn file
+# thừa trong kho khi capcoin.csv thay đổi (không os.listdir mỗi lần chạy),
+# chỉ lấy dữ liệu cho symbol chưa có nến đã đóng gần nhất, và chia symbol cho
+# N process theo hash cố định (crc32) để mỗi symbol luôn thuộc cùng một shard.
+
+STATE_FILE = "/data/universe.json"
+ACTIVE_STATUSES = {"Trading"}
+MISSING_REFRESH_AGE = 15 * 60   # giây: cache cũ hơn mà thiếu symbol thì làm mới trước khi coi là delist
+
+# ==== ĐỌC capcoin.csv ====
+def load_contracts(path):
+    seen, out = set(), []
+    with open(path, "r") as f:
+        for line in f:
+            sym = line.strip()
+            if sym and sym not in seen:
+                seen.add(sym)
+                out.append(sym)
+    return out
+
+def digest(symbols):
+    return hashlib.sha1("\n".join(symbols).encode()).hexdigest()
+
+# ==== ĐỐI CHIẾU VỚI SÀN ====
+def plan(contracts, cache):
+    # Trả về dict: active (giữ thứ tự capcoin), inactive (có trên sàn nhưng không Trading),
+    # delisted (không còn trong instrument list). Chưa có cache thì coi mọi symbol là active.
+    tables = [cache.get(c, {}) for c in ("linear", "spot")] if cache else []
+    if not any(tables):
+        return {"active": list(contracts), "inactive": [], "delisted": []}
+    active, inactive, delisted = [], [], []
+    for sym in contracts:
+        infos = [t[sym] for t in tables if sym in t]
+        if not infos:
+            delisted.append(sym)
+        elif any(i.get("status") in ACTIVE_STATUSES or i.get("status") is None for i in infos):
+            active.append(sym)
+        else:
+            inactive.append(sym)
+    return {"active": active, "inactive": inactive, "delisted": delisted}
+
+def needs_refresh(plan_result, cache, known_missing=(), max_age=MISSING_REFRESH_AGE):
+    # Symbol không có trong cache có thể vừa niêm yết (cache sống tới 6h): làm mới cache
+    # rồi đối chiếu lại. known_missing: symbol vẫn thiếu sau lần làm mới bắt buộc trước
+    # (đã delist thật) -> chỉ làm mới khi xuất hiện symbol thiếu mới, không làm mới mỗi lượt
+    new = set(plan_result["delisted"]) - set(known_missing)
+    return bool(new) and time.time() - (cache or {}).get("updated", 0) > max_age
+
+def remember_missing(missing, path=None):
+    # Lưu danh sách symbol đã xác nhận delist vào universe.json (chỉ ghi khi đổi)
+    state = load_state(path)
+    missing = sorted(missing)
+    if state.get("missing", []) != missing:
+        state["missing"] = missing
+        save_state(state, path)
+
+# ==== THAY ĐỔI SO VỚI LẦN CHẠY TRƯỚC ====
+def load_state(path=None):
+    path = path or STATE_FILE
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    return {}
+
+def save_state(state, path=None):
+    path = path or STATE_FILE
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def changes(contracts, state):
+    # (added, removed, changed?) giữa capcoin.csv hiện tại và lần chạy trước
+    prev = state.get("symbols", [])
+    changed = state.get("digest") != digest(contracts)
+    if not changed:
+        return [], [], False
+    prev_set, cur_set = set(prev), set(contracts)
+    return sorted(cur_set - prev_set), sorted(prev_set - cur_set), True
+
+def stale_files(folder, contracts):
+    # Symbol có file trong kho nhưng không còn trong capcoin.csv (quét thư mục, chỉ gọi khi đổi)
+    keep = set(contracts)
+    return [sym for sym in bar_store.list_symbols(folder) if sym not in keep]
+
+# ==== CHỈ SYMBOL CẦN LẤY DỮ LIỆU ====
+def due(folder, symbols, last_closed_ms):
+    # Bỏ symbol đã có nến đã đóng gần nhất (đọc 40 byte cuối file, không gọi API)
+    out = []
+    for sym in symbols:
+        last = bar_store.last_ts(folder, sym)
+        if last is None or last < last_closed_ms:
+            out.append(sym)
+    return out
+
+# ==== CHIA SHARD ====
+def shard_of(symbol, n_shards):
+    return zlib.crc32(symbol.encode()) % n_shards
+
+def shard(symbols, index, n_shards):
+    if n_shards <= 1:
+        return list(symbols)
+    return [sym for sym in symbols if shard_of(sym, n_shards) == index]
+
+def parse_shard(text):
+    # "i/n" -> (i, n)
+    index, n = (int(x) for x in text.split("/"))
+    if not 0 <= index < n:
+        raise ValueError(f"Shard không hợp lệ: {text}")
+    return index, n
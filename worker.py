@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 import os
+import sys
+import time
+import asyncio
 import subprocess
+import metrics
 from apscheduler.schedulers.blocking import BlockingScheduler
 
 print("=== [DEBUG] worker.py started ===")
@@ -10,14 +14,40 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SCRIPT_U4 = os.path.join(BASE_DIR, "u4.py")
 SCRIPT_T1 = os.path.join(BASE_DIR, "t1.py")
 
+# "daemon": chạy u4/t1 trong cùng process, giữ session Bybit, pool aiohttp và
+# trạng thái chỉ báo giữa các lần chạy. "subprocess": cách cũ, mỗi giờ spawn 2 process.
+# "stream": như daemon nhưng nhận nến qua WebSocket, REST chỉ dùng để lấp gap.
+WORKER_MODE = os.getenv("WORKER_MODE", "daemon")
+# U4_SHARDS > 1: mỗi giờ chạy song song N process u4.py, mỗi process một phần cố định
+# của danh sách symbol (crc32(symbol) % N), cho universe lớn vẫn xong trong phút đầu.
+U4_SHARDS = int(os.getenv("U4_SHARDS", "1"))
+# Metrics: METRICS_PORT mở /metrics (Prometheus) trong daemon, METRICS_FILE nhận
+# một dòng JSON mỗi job (chế độ subprocess: u4.py / t1.py tự ghi khi kết thúc).
+
+def run_u4_shards(n_shards=U4_SHARDS):
+    procs = [
+        subprocess.Popen(["python", SCRIPT_U4, "--shard", f"{i}/{n_shards}"],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for i in range(n_shards)
+    ]
+    for i, proc in enumerate(procs):
+        out, err = proc.communicate()
+        print(f"---- [WORKER] u4.py shard {i}/{n_shards} ----")
+        print(out)
+        if err:
+            print(f"[Error] u4.py shard {i}/{n_shards}:", err)
+
 def job():
     print("==== [WORKER] JOB START ====")
     try:
         print("==== [WORKER] Đang cập nhật dữ liệu (u4.py) ====")
-        r1 = subprocess.run(["python", SCRIPT_U4], capture_output=True, text=True)
-        print(r1.stdout)
-        if r1.stderr:
-            print("[Error] u4.py:", r1.stderr)
+        if U4_SHARDS > 1:
+            run_u4_shards()
+        else:
+            r1 = subprocess.run(["python", SCRIPT_U4], capture_output=True, text=True)
+            print(r1.stdout)
+            if r1.stderr:
+                print("[Error] u4.py:", r1.stderr)
     except Exception as e:
         print("[WORKER][ERROR] Khi chạy u4.py:")
         import traceback
@@ -38,12 +68,120 @@ def job():
 
     print("==== [WORKER] JOB END ====")
 
+# ==== DAEMON: GIỮ MỌI THỨ "ẤM" GIỮA CÁC LẦN CHẠY ====
+class Daemon:
+    def __init__(self):
+        # Chi phí một lần khởi động kiểu cũ: interpreter + import (đo bằng process lạnh) + handshake Bybit
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import u4, t1"], cwd=BASE_DIR, capture_output=True)
+        cold_import = time.perf_counter() - t0
+
+        import u4
+        import t1
+        self.u4, self.t1 = u4, t1
+        t0 = time.perf_counter()
+        t1.connect()
+        self.loop = asyncio.new_event_loop()
+        self.http = self.loop.run_until_complete(self._open_http())
+        handshake = time.perf_counter() - t0
+        # Ước tính (đo một lần lúc khởi động, không đo lại mỗi giờ): cách cũ trả chi phí
+        # import lạnh 2 lần (u4 + t1) cộng handshake Bybit mỗi lượt chạy
+        self.startup_estimate = 2 * cold_import + handshake
+        self.metrics_server = metrics.serve()
+        print(f"[WORKER] Daemon sẵn sàng: import lạnh {cold_import:.2f}s, kết nối {handshake:.2f}s")
+
+    async def _open_http(self):
+        return self.u4.open_session()
+
+    def job(self):
+        print("==== [WORKER] JOB START (daemon) ====")
+        t_start = time.perf_counter()
+        try:
+            print("==== [WORKER] Đang cập nhật dữ liệu (u4) ====")
+            if U4_SHARDS > 1:
+                run_u4_shards()
+            else:
+                self.loop.run_until_complete(self.u4.run(self.http))
+        except Exception as e:
+            print("[WORKER][ERROR] Khi chạy u4:")
+            import traceback
+            traceback.print_exc()
+            print(f"Exception: {e}")
+        t_u4 = time.perf_counter()
+
+        try:
+            print("==== [WORKER] Đang chạy bot đặt lệnh (t1) ====")
+            self.t1.main()
+        except Exception as e:
+            print("[WORKER][ERROR] Khi chạy t1:")
+            import traceback
+            traceback.print_exc()
+            print(f"Exception: {e}")
+        t_end = time.perf_counter()
+        metrics.observe("stage_seconds", t_u4 - t_start, stage="job_u4")
+        metrics.observe("stage_seconds", t_end - t_u4, stage="job_t1")
+        metrics.dump(job="worker")
+
+        print(f"[WORKER] u4 {t_u4 - t_start:.2f}s, t1 {t_end - t_u4:.2f}s, "
+              f"ước tính tránh được ~{self.startup_estimate:.2f}s khởi động so với chạy subprocess "
+              f"(đo một lần lúc khởi động)")
+        print("==== [WORKER] JOB END ====")
+
+    # ==== STREAM: NẾN MỚI QUA WEBSOCKET ====
+    def start_stream(self):
+        import instruments
+        from bar_stream import BarStream
+        import universe
+        cache = instruments.load_cache() or {}
+        symbols = universe.plan(universe.load_contracts(self.u4.contracts_file), cache)["active"]
+        categories = {sym: instruments.category_of(cache, sym) for sym in symbols}
+        self.stream = BarStream(
+            symbols, self.u4.data_folder,
+            on_bars=self.t1.main,
+            on_gap=lambda syms: self.loop.run_until_complete(self.u4.run(self.http, syms)),
+            categories=categories,
+            max_bars=self.u4.MAX_BARS,
+            trim_slack=self.u4.trim_slack,
+        )
+        self.stream.start()
+        if self.t1.API_KEY:
+            try:
+                self.t1.start_position_stream()
+                print("[WORKER] Đã subscribe private stream position")
+            except Exception as e:
+                print(f"[WORKER][ERROR] Không subscribe được position stream, dùng REST mỗi lượt: {e}")
+        return self.stream
+
+    def maintain(self):
+        # Chế độ stream không chạy u4/t1 theo giờ: làm mới cache instrument (theo TTL) rồi
+        # lấp bằng REST các symbol thiếu nến đã đóng
+        import instruments
+        try:
+            self.t1.instrument_cache = instruments.get_instruments(self.t1.session)
+        except Exception as e:
+            print(f"[WORKER][ERROR] Không làm mới được cache instrument: {e}")
+        return self.stream.check_stale()
+
 if __name__ == "__main__":
     try:
         print("=== [DEBUG] worker.py main starting ===")
-        job()
+        if "--subprocess" in sys.argv:
+            WORKER_MODE = "subprocess"
+        if "--stream" in sys.argv:
+            WORKER_MODE = "stream"
+        run_job = job
+        if WORKER_MODE in ("daemon", "stream"):
+            daemon = Daemon()
+            run_job = daemon.job
+        print(f"[WORKER] Chế độ: {WORKER_MODE}")
+        run_job()
         scheduler = BlockingScheduler()
-        scheduler.add_job(job, "cron", minute=0, second=15)
+        if WORKER_MODE == "stream":
+            # Nến đến qua WebSocket; mỗi giờ làm mới cache instrument và lấp bằng REST symbol thiếu nến
+            daemon.start_stream()
+            scheduler.add_job(daemon.maintain, "cron", minute=2)
+        else:
+            scheduler.add_job(run_job, "cron", minute=0, second=15)
         print("[WORKER] Scheduler started. Job sẽ chạy mỗi giờ vào giây 01.")
         scheduler.start()
     except Exception as e: